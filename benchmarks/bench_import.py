@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+'''
+Benchmark the import time and memory of dipzy entry points, each in a fresh
+interpreter, and list the heavy dependencies they load.
+
+    python benchmarks/bench_import.py --repeat 10 --output imports.json
+    python benchmarks/bench_import.py --compare imports.json --threshold 0.3
+
+With --compare, entry points slower than the baseline by more than the
+threshold are reported and the script exits with status 1.
+'''
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+ENTRY_POINTS = {
+    "import dipzy": "import dipzy",
+    "telegram.Bot": "import dipzy; dipzy.telegram.Bot",
+    "Twitter": "import dipzy; dipzy.Twitter",
+    "CoinGecko": "import dipzy; dipzy.CoinGecko",
+    "AlphaVantage": "import dipzy; dipzy.AlphaVantage",
+    "web3": "import dipzy; dipzy.web3.LiquidityPool",
+}
+HEAVY = ("numpy", "pandas", "web3", "eth_abi", "aiohttp")
+
+PROBE = '''
+import resource, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss, ",".join(name for name in {heavy!r} if name in sys.modules))
+'''
+
+
+def probe(statement):
+    code = PROBE.format(statement=statement, heavy=HEAVY)
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.split()
+    heavy = output[2].split(",") if len(output) > 2 else []
+    # ru_maxrss is in kilobytes on Linux
+    return float(output[0]), int(output[1]) / 1024, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write results to a JSON file")
+    parser.add_argument("--compare", help="JSON results of a baseline run")
+    parser.add_argument("--threshold", type=float, default=0.3)
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'entry point':<16}{'median ms':>10}{'max RSS MB':>12}  heavy dependencies")
+    for name, statement in ENTRY_POINTS.items():
+        runs = [probe(statement) for _ in range(args.repeat)]
+        results[name] = {
+            "ms": statistics.median(elapsed for elapsed, _, _ in runs) * 1e3,
+            "rss_mb": max(rss for _, rss, _ in runs),
+            "heavy": runs[0][2],
+        }
+        print(f"{name:<16}{results[name]['ms']:>10.1f}{results[name]['rss_mb']:>12.1f}  {', '.join(runs[0][2]) or '-'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = [
+            f"{name}: {baseline[name]['ms']:.1f} -> {metrics['ms']:.1f} ms"
+            for name, metrics in results.items()
+            if name in baseline and metrics["ms"] > baseline[name]["ms"] * (1 + args.threshold)
+        ]
+        print("\n".join(regressions) if regressions else "No regressions")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
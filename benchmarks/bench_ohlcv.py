@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+'''
+Benchmark parsing of TIME_SERIES_DAILY_ADJUSTED payloads: the previous
+pandas.DataFrame.from_dict path against the NumPy parser used by
+AlphaVantage.get_daily_ohlcv.
+
+    python benchmarks/bench_ohlcv.py --symbols 200 --days 5000
+'''
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from dipzy.alphavantage import _ohlcv_frame, _ohlcv_panel, _parse_daily
+
+
+def make_payload(days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = np.datetime64("2000-01-03") + np.arange(days)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, days)))
+    series = {
+        str(date): {
+            "1. open": f"{c * 0.99:.4f}",
+            "2. high": f"{c * 1.01:.4f}",
+            "3. low": f"{c * 0.98:.4f}",
+            "4. close": f"{c:.4f}",
+            "5. adjusted close": f"{c * 0.9:.4f}",
+            "6. volume": str(int(rng.integers(1e5, 1e8))),
+            "7. dividend amount": "0.0000",
+            "8. split coefficient": "1.0",
+        }
+        for date, c in zip(dates[::-1], close[::-1])
+    }
+    return {"Meta Data": {}, "Time Series (Daily)": series}
+
+
+def legacy(jsons):
+    list_ohlcv = [
+        pd.DataFrame.from_dict(
+            json['Time Series (Daily)'], orient="index", dtype='float'
+        ).sort_index() for json in jsons
+    ]
+    colnames = {colname: colname[3:] for colname in list(list_ohlcv[0])}
+    for data in list_ohlcv:
+        data.rename(columns=colnames, inplace=True)
+        data.index = pd.to_datetime(data.index)
+    return list_ohlcv
+
+
+def numpy_frames(jsons):
+    return [_ohlcv_frame(_parse_daily(json)) for json in jsons]
+
+
+def numpy_panel(jsons):
+    symbols = [f"S{i}" for i in range(len(jsons))]
+    return _ohlcv_panel(symbols, [_parse_daily(json) for json in jsons])
+
+
+def best_of(func, jsons, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(jsons)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--days", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    jsons = [make_payload(args.days, seed) for seed in range(args.symbols)]
+    baseline = best_of(legacy, jsons, args.repeat)
+    print(f"{args.symbols} symbols x {args.days} days")
+    print(f"{'from_dict (previous)':<24}{baseline * 1e3:>10.1f} ms")
+    for name, func in [("numpy frames", numpy_frames), ("numpy panel", numpy_panel)]:
+        elapsed = best_of(func, jsons, args.repeat)
+        print(f"{name:<24}{elapsed * 1e3:>10.1f} ms  {baseline / elapsed:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+'''
+Offline benchmark suite of the dipzy hot paths against a local stand-in server
+(see server.py) that replays API and JSON-RPC payloads at realistic sizes.
+
+For each scenario it reports throughput, p50/p99 latency of the HTTP requests,
+client CPU time (mostly parsing, as the server runs in another process) and
+peak memory traced during a separate run.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --compare results.json --threshold 0.2
+
+With --compare, scenarios whose throughput, p99 latency, CPU time or peak
+memory are worse than the baseline by more than the threshold are reported and
+the script exits with status 1, so a regression fails CI.
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+from web3 import HTTPProvider, Web3
+
+import dipzy as dz
+from dipzy.coingecko import SymbolIndex
+from dipzy.transport import Transport
+from dipzy.twitter import StreamConsumer
+from dipzy.web3 import LiquidityPool, TokenCache, refresh_reserves
+
+from server import pool_address
+
+ERC20_ABI = [
+    {"name": "symbol", "type": "function", "stateMutability": "view", "inputs": [], "outputs": [{"name": "", "type": "string"}]},
+    {"name": "decimals", "type": "function", "stateMutability": "view", "inputs": [], "outputs": [{"name": "", "type": "uint8"}]},
+    {"name": "balanceOf", "type": "function", "stateMutability": "view", "inputs": [{"name": "account", "type": "address"}], "outputs": [{"name": "", "type": "uint256"}]},
+]
+CURVE_ABI = [
+    {"name": "coins", "type": "function", "stateMutability": "view", "inputs": [{"name": "i", "type": "uint256"}], "outputs": [{"name": "", "type": "address"}]},
+    {"name": "balances", "type": "function", "stateMutability": "view", "inputs": [{"name": "i", "type": "uint256"}], "outputs": [{"name": "", "type": "uint256"}]},
+]
+
+# Metrics where a larger value is a regression
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "cpu_ms", "peak_mb")
+
+
+class TimingTransport:
+    '''Transport recording the latency of every request'''
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.latencies = []
+
+    def request(self, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.transport.request(method, url, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    def close(self):
+        self.transport.close()
+
+
+class TimingProvider(HTTPProvider):
+    '''JSON-RPC provider recording the latency of every request'''
+
+    def __init__(self, endpoint_uri):
+        super().__init__(endpoint_uri)
+        self.latencies = []
+
+    def make_request(self, method, params):
+        start = time.perf_counter()
+        try:
+            return super().make_request(method, params)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    def make_batch_request(self, requests):
+        start = time.perf_counter()
+        try:
+            return super().make_batch_request(requests)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+class Scenario:
+    '''
+    A benchmarked hot path. setup() builds fresh clients and returns a
+    callable running the path once, which returns the number of items
+    processed, and the object holding the recorded latencies.
+    '''
+    name = None
+    unit = "items"
+
+    def __init__(self, url, args):
+        self.url = url
+        self.args = args
+
+    def setup(self):
+        raise NotImplementedError
+
+
+class DailyOHLCV(Scenario):
+    name = "get_daily_ohlcv"
+    unit = "symbols"
+
+    def setup(self):
+        timing = TimingTransport(Transport())
+        av = dz.AlphaVantage(
+            "demo", calls_per_minute=10 ** 6, max_workers=8,
+            throttle_retries=10, throttle_backoff=0.05, transport=timing,
+            memo_ttl=0,
+        )
+        av.base_url = self.url + "/alphavantage/query"
+        symbols = [f"S{i}" for i in range(self.args.symbols)]
+        return lambda: len(av.get_daily_ohlcv(symbols, "full", panel="long").groupby("symbol")), timing
+
+
+class CoinsMarkets(Scenario):
+    name = "get_coins_markets"
+    unit = "coins"
+
+    def setup(self):
+        timing = TimingTransport(Transport())
+        # memo_ttl=0 so every run goes upstream instead of to the memo
+        cg = dz.CoinGecko(timing, calls_per_minute=10 ** 6, max_workers=4, memo_ttl=0)
+        cg.base_url = self.url + "/coingecko"
+        ids = [f"coin-{i}" for i in range(self.args.markets)]
+        return lambda: len(cg.get_coins_markets(ids)), timing
+
+
+class ConvertSymbols(Scenario):
+    name = "convert_symbols"
+    unit = "coins"
+
+    def setup(self):
+        timing = TimingTransport(Transport())
+
+        def run():
+            # A fresh index downloads and indexes the whole catalogue
+            cg = dz.CoinGecko(timing, symbol_index=SymbolIndex(), calls_per_minute=10 ** 6)
+            cg.base_url = self.url + "/coingecko"
+            cg.convert_symbols(["btc", "eth"])
+            return len(cg.symbol_index)
+
+        return run, timing
+
+
+class Reserves(Scenario):
+    name = "get_reserves"
+    unit = "pools"
+
+    def setup(self):
+        provider = TimingProvider(self.url + "/rpc")
+        LiquidityPool.set_defaults(Web3(provider), ERC20_ABI, token_cache=TokenCache())
+        pools = [
+            dz.web3.CurveLP(pool_address(i), CURVE_ABI, n=3, refresh=False)
+            for i in range(self.args.pools)
+        ]
+        # Warm refresh: token addresses and metadata are known
+        refresh_reserves(pools)
+        provider.latencies.clear()
+
+        def run():
+            refresh_reserves(pools)
+            return len(pools)
+
+        return run, provider
+
+
+class Stream(Scenario):
+    name = "stream"
+    unit = "tweets"
+
+    def setup(self):
+        timing = TimingTransport(Transport())
+        twitter = dz.Twitter("token", transport=timing)
+        twitter.base_url = self.url + "/twitter"
+
+        def run():
+            received = [0]
+            done = threading.Event()
+
+            def handler(tweet):
+                received[0] += 1
+                if received[0] >= self.args.tweets:
+                    done.set()
+
+            consumer = StreamConsumer(twitter, handler, max_workers=1)
+            consumer.start()
+            done.wait(timeout=120)
+            consumer.stop()
+            return received[0]
+
+        return run, timing
+
+
+class Timelines(Scenario):
+    name = "iter_users_tweets"
+    unit = "tweets"
+
+    def setup(self):
+        timing = TimingTransport(Transport())
+        twitter = dz.Twitter("token", transport=timing)
+        twitter.base_url = self.url + "/twitter"
+        users = list(range(1, self.args.users + 1))
+        return lambda: sum(1 for _ in twitter.iter_users_tweets(users)), timing
+
+
+class SendMessage(Scenario):
+    name = "send_message"
+    unit = "messages"
+
+    def setup(self):
+        timing = TimingTransport(Transport())
+        bot = dz.telegram.Bot("123:token", transport=timing)
+        bot.base_url = self.url + "/telegram/bot123:token"
+
+        def run():
+            for i in range(self.args.messages):
+                bot.send_message(i, "Price alert: BTC above 100,000")
+            return self.args.messages
+
+        return run, timing
+
+
+class Webhook(Scenario):
+    name = "webhook"
+    unit = "updates"
+
+    def setup(self):
+        # Latencies are from posting a command update until its handler runs.
+        # The server runs in this process, so CPU time includes it.
+        timing = SimpleNamespace(latencies=[])
+        bot = dz.telegram.Bot("123:token", transport=Transport())
+        bot.base_url = self.url + "/telegram/bot123:token"
+        bot.dispatcher.max_workers = 8
+        webhook = dz.telegram.WebhookServer(bot, "https://example.com/hook", host="127.0.0.1", port=0)
+        webhook.start()
+        host, port = webhook.address
+        url = f"http://{host}:{port}/hook"
+        headers = {dz.telegram.SECRET_TOKEN_HEADER: webhook.secret_token}
+        lock = threading.Lock()
+
+        def run():
+            pending = threading.Semaphore(0)
+            sent = {}
+
+            def handler(update, bot):
+                latency = time.perf_counter() - sent[update["update_id"]]
+                with lock:
+                    timing.latencies.append(latency)
+                pending.release()
+
+            bot.add_command_handler("price", handler)
+
+            def post(ids):
+                # Telegram delivers over a few kept-alive connections
+                session = Transport()
+                for i in ids:
+                    body = json.dumps({"update_id": i, "message": {"chat": {"id": i}, "text": "/price btc"}})
+                    sent[i] = time.perf_counter()
+                    session.request("POST", url, data=body, headers=headers)
+                session.close()
+
+            threads = [
+                threading.Thread(target=post, args=(range(j, self.args.updates, 4),))
+                for j in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for _ in range(self.args.updates):
+                pending.acquire(timeout=30)
+            return self.args.updates
+
+        return run, timing
+
+
+SCENARIOS = [DailyOHLCV, CoinsMarkets, ConvertSymbols, Reserves, Stream, Timelines, SendMessage, Webhook]
+
+
+def measure(scenario, repeat):
+    run, timing = scenario.setup()
+    try:
+        # Warm up connections and caches
+        run()
+    except Exception:
+        pass
+    timing.latencies.clear()
+
+    walls, cpus, items, errors = [], [], 0, 0
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            items += run()
+        except Exception:
+            errors += 1
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+
+    # Separate run, as tracing allocations slows everything down
+    tracemalloc.start()
+    try:
+        run()
+    except Exception:
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies = np.array(timing.latencies or [np.nan]) * 1e3
+    return {
+        "unit": scenario.unit,
+        "throughput": items / sum(walls),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "cpu_ms": min(cpus) * 1e3,
+        "peak_mb": peak / 2 ** 20,
+        "requests": len(timing.latencies),
+        "errors": errors,
+    }
+
+
+def start_server(args):
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    command = [
+        sys.executable, server, "--latency", str(args.latency),
+        "--error-rate", str(args.error_rate), "--days", str(args.days),
+        "--coins", str(args.coins), "--tweets", str(args.tweets),
+        "--pools", str(args.pools),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    port = int(process.stdout.readline())
+    return process, f"http://127.0.0.1:{port}"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, metrics in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if metrics["throughput"] < previous["throughput"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {previous['throughput']:.1f} -> {metrics['throughput']:.1f}")
+        for key in LOWER_IS_BETTER:
+            if metrics[key] > previous[key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {previous[key]:.1f} -> {metrics[key]:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenarios", nargs="*", help="Names of the scenarios to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of rate limited replies")
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--days", type=int, default=5000)
+    parser.add_argument("--coins", type=int, default=14000)
+    parser.add_argument("--markets", type=int, default=2500)
+    parser.add_argument("--pools", type=int, default=500)
+    parser.add_argument("--tweets", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--output", help="Write results to a JSON file")
+    parser.add_argument("--compare", help="JSON results of a baseline run")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    process, url = start_server(args)
+    results = {}
+    try:
+        print(f"{'scenario':<20}{'throughput':>22}{'p50 ms':>9}{'p99 ms':>9}{'cpu ms':>10}{'peak MB':>9}{'errors':>8}")
+        for scenario in SCENARIOS:
+            if args.scenarios and scenario.name not in args.scenarios:
+                continue
+            metrics = measure(scenario(url, args), args.repeat)
+            results[scenario.name] = metrics
+            throughput = f"{metrics['throughput']:,.0f} {metrics['unit']}/s"
+            print(
+                f"{scenario.name:<20}{throughput:>22}{metrics['p50_ms']:>9.1f}{metrics['p99_ms']:>9.1f}"
+                f"{metrics['cpu_ms']:>10.1f}{metrics['peak_mb']:>9.1f}{metrics['errors']:>8}"
+            )
+    finally:
+        process.terminate()
+        process.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+                "results": results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        print(f"\nCompared with {baseline.get('commit') or args.compare}:")
+        print("\n".join(regressions) if regressions else "No regressions")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+'''
+Local stand-in for the AlphaVantage, CoinGecko, Twitter and Telegram APIs and
+an Ethereum JSON-RPC node, serving deterministic payloads at realistic sizes.
+Prints its port on the first line of stdout, then serves until killed.
+
+    python benchmarks/server.py --latency 0.02 --error-rate 0.05
+
+Routes:
+    /alphavantage/query             TIME_SERIES_DAILY_ADJUSTED of any symbol
+    /coingecko/coins/list           Catalogue of --coins coins
+    /coingecko/coins/markets        Markets by ids or by page
+    /twitter/tweets/search/stream   --tweets tweets, then the stream closes
+    /twitter/users/:id/tweets       Pages of 100 tweets, --pages per user
+    /telegram/bot<token>/*          Ok replies to any bot method
+    /rpc                            Curve pools, ERC-20 tokens and Multicall3
+
+With --error-rate, that fraction of requests is rate limited the way each API
+does it: a "Note" message for AlphaVantage, 429 with x-rate-limit headers for
+Twitter, 429 with retry_after for Telegram and plain 429 for CoinGecko.
+'''
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector
+
+from bench_ohlcv import make_payload
+
+MULTICALL3 = "0xca11bde05977b3631167028862be2a173976ca11"
+
+
+def selector(signature):
+    return function_signature_to_4byte_selector(signature)
+
+
+def pool_address(i):
+    return "0x" + format(0xC0 << 152 | i, "040x")
+
+
+def token_address(i):
+    return "0x" + format(0x70 << 152 | i, "040x")
+
+
+def make_coins(n, seed=0):
+    rng = random.Random(seed)
+    coins = []
+    for i in range(n):
+        symbol = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(2, 5)))
+        coins.append({"id": f"coin-{i}", "symbol": symbol, "name": f"Coin {symbol.upper()} {i}"})
+    return coins
+
+
+def make_market(coin, rng):
+    price = rng.lognormvariate(0, 3)
+    return {
+        "id": coin["id"], "symbol": coin["symbol"], "name": coin["name"],
+        "image": f"https://assets.coingecko.com/coins/images/{coin['id']}/large.png",
+        "current_price": price, "market_cap": price * 1e7, "market_cap_rank": 1,
+        "fully_diluted_valuation": price * 2e7, "total_volume": price * 1e6,
+        "high_24h": price * 1.05, "low_24h": price * 0.95,
+        "price_change_24h": price * 0.01, "price_change_percentage_24h": 1.0,
+        "market_cap_change_24h": 1e5, "market_cap_change_percentage_24h": 1.0,
+        "circulating_supply": 1e7, "total_supply": 2e7, "max_supply": None,
+        "ath": price * 3, "ath_change_percentage": -66.0, "ath_date": "2021-11-10T14:24:11.849Z",
+        "atl": price / 3, "atl_change_percentage": 200.0, "atl_date": "2015-10-20T00:00:00.000Z",
+        "roi": None, "last_updated": "2024-01-01T00:00:00.000Z",
+        "price_change_percentage_24h_in_currency": 1.0,
+    }
+
+
+def make_tweet(i, rng):
+    return {
+        "data": {
+            "id": str(1500000000000000000 + i),
+            "author_id": str(rng.randint(1, 10 ** 9)),
+            "created_at": "2024-01-01T00:00:00.000Z",
+            "text": " ".join(rng.choices(["$BTC", "pump", "gm", "wagmi", "rekt", "ser", "chart", "moon"], k=30)),
+        },
+        "includes": {"users": [{"id": "1", "name": "Someone", "username": "someone"}]},
+        "matching_rules": [{"id": "1", "tag": "crypto"}],
+    }
+
+
+class Chain:
+    '''Executes calls to Curve pools of 3 coins, ERC-20 tokens and Multicall3'''
+
+    def __init__(self, pools, tokens=20, block_time=12):
+        self.pools = pools
+        self.tokens = tokens
+        self.block_time = block_time
+        self.started = time.time()
+        self.functions = {
+            selector("coins(uint256)"): (["uint256"], ["address"], self.coins),
+            selector("balances(uint256)"): (["uint256"], ["uint256"], self.balances),
+            selector("symbol()"): ([], ["string"], lambda to: [f"TK{self.token_id(to)}"]),
+            selector("decimals()"): ([], ["uint8"], lambda to: [18 if self.token_id(to) % 2 else 6]),
+            selector("balanceOf(address)"): (["address"], ["uint256"], lambda to, owner: [10 ** 24]),
+            selector("getBlockNumber()"): ([], ["uint256"], lambda to: [self.head()]),
+        }
+
+    def head(self):
+        return 18_000_000 + int((time.time() - self.started) / self.block_time)
+
+    @staticmethod
+    def token_id(address):
+        return int(address, 16) & 0xFFFFFFFF
+
+    def coins(self, to, i):
+        pool = int(to, 16) & 0xFFFFFFFF
+        return [token_address((pool + i) % self.tokens)]
+
+    def balances(self, to, i):
+        pool = int(to, 16) & 0xFFFFFFFF
+        return [(pool + 1) * 10 ** 24 + i * 10 ** 20 + self.head()]
+
+    def execute(self, to, data):
+        if to == MULTICALL3 and data[:4] == selector("aggregate3((address,bool,bytes)[])"):
+            (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+            replies = [(True, self.execute(target.lower(), call)) for target, _, call in calls]
+            return encode(["(bool,bytes)[]"], [replies])
+        inputs, outputs, func = self.functions[data[:4]]
+        return encode(outputs, func(to, *decode(inputs, data[4:])))
+
+    def respond(self, request):
+        method, params = request["method"], request.get("params", [])
+        if method == "eth_chainId":
+            result = "0x1"
+        elif method == "eth_blockNumber":
+            result = hex(self.head())
+        elif method == "eth_getCode":
+            result = "0x60" if params[0].lower() == MULTICALL3 else "0x"
+        elif method == "eth_call":
+            data = bytes.fromhex(params[0]["data"][2:])
+            result = "0x" + self.execute(params[0]["to"].lower(), data).hex()
+        else:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32601, "message": method}}
+        return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which Nagle's algorithm would
+    # delay by the peer's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, payload, headers=None):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def handle_request(self):
+        config = self.server.config
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if config.latency:
+            time.sleep(config.latency)
+        limited = config.error_rate and random.random() < config.error_rate
+        try:
+            self.route(url.path, params, body, limited)
+        except (KeyError, ValueError) as e:
+            self.reply(400, {"error": repr(e)})
+
+    def route(self, path, params, body, limited):
+        server = self.server
+        if path == "/rpc":
+            request = json.loads(body)
+            if isinstance(request, list):
+                return self.reply(200, [server.chain.respond(r) for r in request])
+            return self.reply(200, server.chain.respond(request))
+
+        if path == "/alphavantage/query":
+            if limited:
+                return self.reply(200, {"Note": "Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute."})
+            return self.reply(200, server.ohlcv)
+
+        if path.startswith("/coingecko/"):
+            if limited:
+                return self.reply(429, {"status": {"error_code": 429, "error_message": "Rate limited"}})
+            if path == "/coingecko/coins/list":
+                return self.reply(200, server.coins_list, {"ETag": '"catalogue"'})
+            if path == "/coingecko/coins/markets":
+                if "ids" in params:
+                    ids = params["ids"].split(",")
+                    markets = [server.markets[server.coin_index[coin_id]] for coin_id in ids if coin_id in server.coin_index]
+                else:
+                    per_page, page = int(params.get("per_page", 100)), int(params.get("page", 1))
+                    markets = server.markets[(page - 1) * per_page:page * per_page]
+                return self.reply(200, markets)
+
+        if path.startswith("/twitter/"):
+            reset = str(int(time.time()) + 1)
+            if limited:
+                return self.reply(429, {"title": "Too Many Requests"}, {
+                    "x-rate-limit-limit": "900", "x-rate-limit-remaining": "0", "x-rate-limit-reset": reset,
+                })
+            if path == "/twitter/tweets/search/stream":
+                return self.stream()
+            if path.endswith("/tweets"):
+                page = int(params.get("pagination_token", 0))
+                payload = {"data": server.tweets[:100], "meta": {"result_count": 100}}
+                if page + 1 < server.config.pages:
+                    payload["meta"]["next_token"] = str(page + 1)
+                return self.reply(200, payload, {
+                    "x-rate-limit-limit": "900", "x-rate-limit-remaining": "899", "x-rate-limit-reset": reset,
+                })
+
+        if path.startswith("/telegram/bot"):
+            if limited:
+                return self.reply(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 1}})
+            return self.reply(200, {"ok": True, "result": {"message_id": 1, "date": int(time.time()), "chat": {"id": 1}}})
+
+        self.reply(404, {"error": path})
+
+    def stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, line in enumerate(self.server.stream_lines):
+            self.wfile.write(line)
+            if i % 100 == 99:
+                # Keep-alive line
+                self.wfile.write(b"\r\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config):
+        super().__init__(("127.0.0.1", config.port), Handler)
+        self.config = config
+        rng = random.Random(0)
+        self.ohlcv = json.dumps(make_payload(config.days)).encode()
+        coins = make_coins(config.coins)
+        self.coins_list = json.dumps(coins).encode()
+        self.coin_index = {coin["id"]: i for i, coin in enumerate(coins)}
+        self.markets = [make_market(coin, rng) for coin in coins]
+        self.tweets = [make_tweet(i, rng)["data"] for i in range(100)]
+        self.stream_lines = [
+            json.dumps(make_tweet(i, rng)).encode() + b"\r\n" for i in range(config.tweets)
+        ]
+        self.chain = Chain(config.pools)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of rate limited replies")
+    parser.add_argument("--days", type=int, default=5000, help="Days of each OHLCV series")
+    parser.add_argument("--coins", type=int, default=14000, help="Coins in the CoinGecko catalogue")
+    parser.add_argument("--tweets", type=int, default=20000, help="Tweets per stream connection")
+    parser.add_argument("--pages", type=int, default=5, help="Timeline pages per user")
+    parser.add_argument("--pools", type=int, default=500, help="Curve pools on the chain")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    config = parse_args(argv)
+    server = StandInServer(config)
+    print(server.server_port, flush=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
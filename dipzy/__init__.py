@@ -1,7 +1,40 @@
-from .alphavantage import AlphaVantage
-from .coingecko import CoinGecko
-from .twitter import Twitter
+'''
+Clients and submodules are imported on first attribute access (PEP 562), so
+e.g. a script only using dz.telegram does not import pandas or web3.
+'''
+import importlib
 
-from . import telegram 
-from . import web3
-from . import utils
+# Attribute -> submodule defining it
+_ATTRIBUTES = {
+    "AlphaVantage": "alphavantage",
+    "AsyncAlphaVantage": "alphavantage",
+    "AsyncCoinGecko": "coingecko",
+    "CoinGecko": "coingecko",
+    "AsyncTwitter": "twitter",
+    "Twitter": "twitter",
+    "RequestError": "client",
+    "AsyncTransport": "transport",
+    "Transport": "transport",
+}
+_SUBMODULES = {
+    "alphavantage", "cache", "client", "coingecko", "metrics", "ratelimit",
+    "store", "telegram", "transport", "twitter", "utils", "web3",
+}
+
+__all__ = [*_ATTRIBUTES, *sorted(_SUBMODULES)]
+
+
+def __getattr__(name):
+    if name in _ATTRIBUTES:
+        module = importlib.import_module(f".{_ATTRIBUTES[name]}", __name__)
+        value = getattr(module, name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *__all__})
@@ -1,20 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from typing import Iterable
 
-import math
-import requests
-import time
+import asyncio
+import importlib.util
+import io
+import json
+import logging
 
 import numpy as np
 import pandas as pd
 
+from . import metrics
+from .cache import Memo, ResponseCache
+from .client import AsyncClient, Client, RequestError
+from .ratelimit import RateLimiter, RateLimitError
+from .store import OHLCV_DTYPE, OHLCVStore
 
-class AlphaVantage:
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+# Seconds a response stays cached, per AlphaVantage function
+CACHE_TTL = {
+    "GLOBAL_QUOTE": 60,
+    "TIME_SERIES_DAILY_ADJUSTED": 60 * 60,
+    "OVERVIEW": DAY,
+    "INCOME_STATEMENT": DAY,
+    "BALANCE_SHEET": DAY,
+    "CASH_FLOW": DAY,
+    "EARNINGS": DAY,
+    "CPI": DAY,
+    "FEDERAL_FUNDS_RATE": DAY,
+    "WTI": DAY,
+    "BRENT": DAY,
+    "NATURAL_GAS": DAY,
+    "COPPER": DAY,
+    "ALUMINUM": DAY,
+    "WHEAT": DAY,
+    "CORN": DAY,
+    "COTTON": DAY,
+    "SUGAR": DAY,
+    "COFFEE": DAY,
+    "ALL_COMMODITIES": DAY,
+}
+
+# Faster CSV reader when pyarrow is installed
+CSV_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+
+# Column types of economic indicator and commodity series besides the date
+SERIES_SCHEMA = {"value": "float64"}
+
+# Column types of OVERVIEW responses. Other columns are kept as strings.
+OVERVIEW_SCHEMA = {
+    **dict.fromkeys([
+        "MarketCapitalization", "EBITDA", "PERatio", "PEGRatio", "BookValue",
+        "DividendPerShare", "DividendYield", "EPS", "RevenuePerShareTTM",
+        "ProfitMargin", "OperatingMarginTTM", "ReturnOnAssetsTTM",
+        "ReturnOnEquityTTM", "RevenueTTM", "GrossProfitTTM", "DilutedEPSTTM",
+        "QuarterlyEarningsGrowthYOY", "QuarterlyRevenueGrowthYOY",
+        "AnalystTargetPrice", "AnalystRatingStrongBuy", "AnalystRatingBuy",
+        "AnalystRatingHold", "AnalystRatingSell", "AnalystRatingStrongSell",
+        "TrailingPE", "ForwardPE", "PriceToSalesRatioTTM", "PriceToBookRatio",
+        "EVToRevenue", "EVToEBITDA", "Beta", "52WeekHigh", "52WeekLow",
+        "50DayMovingAverage", "200DayMovingAverage", "SharesOutstanding",
+        "SharesFloat", "PercentInsiders", "PercentInstitutions",
+    ], "float64"),
+    **dict.fromkeys(["LatestQuarter", "DividendDate", "ExDividendDate"], "datetime64"),
+}
+
+
+class AlphaVantage(Client):
+    '''
+    AlphaVantage API client. Requests are paced by a sliding-window rate
+    limiter so batches run at the plan's true limit.
+
+    Args:
+        api_key (str): AlphaVantage API key
+        calls_per_minute (int): Per-minute quota of the plan
+        calls_per_day (int): Per-day quota of the plan. None if unlimited.
+        max_workers (int): Number of concurrent requests in batch requests
+        max_wait (float): Maximum seconds to wait for the rate limiter
+            before raising RateLimitError
+        throttle_retries (int): Retries when the API replies with a
+            "Note"/"Information" throttle message
+        throttle_backoff (float): Initial backoff in seconds after a throttle
+            message, doubled on every retry
+        transport (Transport): HTTP transport shared with other clients
+        cache (ResponseCache | str): Persistent response cache, or path of
+            its database file. Responses are not cached if None.
+        cache_ttl (dict): Overrides of the cache TTL in seconds per function.
+            Functions with a TTL of None are not cached.
+        store (OHLCVStore | str): Local store of daily OHLCV histories, or
+            its directory. get_daily_ohlcv then only fetches missing rows.
+        memo_ttl (float): Seconds a response is reused for identical
+            requests. Concurrent identical requests always share one call.
+    '''
     base_url = "https://www.alphavantage.co/query"
     
-    def __init__(self, api_key):
+    def __init__(
+        self,
+        api_key,
+        calls_per_minute=5,
+        calls_per_day=None,
+        max_workers=None,
+        max_wait=120,
+        throttle_retries=3,
+        throttle_backoff=15,
+        transport=None,
+        cache=None,
+        cache_ttl=None,
+        store=None,
+        memo_ttl=1,
+    ):
+        super().__init__(transport)
         self.api_key = api_key
-    
+        self.limiter = RateLimiter.from_quota(
+            calls_per_minute=calls_per_minute, calls_per_day=calls_per_day
+        )
+        if max_workers is None:
+            max_workers = min(calls_per_minute or 16, 16)
+        self.max_workers = max_workers
+        self.max_wait = max_wait
+        self.throttle_retries = throttle_retries
+        self.throttle_backoff = throttle_backoff
+        if isinstance(cache, str):
+            cache = ResponseCache(cache)
+        self.cache = cache
+        self.cache_ttl = {**CACHE_TTL, **(cache_ttl or {})}
+        if isinstance(store, str):
+            store = OHLCVStore(store)
+        self.store = store
+        self.memo = Memo(memo_ttl)
+
     def _request(self, func, symbol=None, method="GET", params=None, **kwargs):
+        return self._exchange(func, symbol, method, params, **kwargs)[0]
+
+    def _exchange(self, func, symbol=None, method="GET", params=None, **kwargs) -> tuple:
+        '''(response, its decoded JSON content or None if not JSON)'''
+        if method != "GET" or kwargs:
+            return self._fetch(func, symbol, method, params, **kwargs)
+        # Identical requests in flight or within memo_ttl share one call
+        return self.memo.call(
+            Memo.make_key(func, symbol, params or {}),
+            lambda: self._fetch(func, symbol, method, params)
+        )
+
+    def _fetch(self, func, symbol=None, method="GET", params=None, **kwargs) -> tuple:
         parameters = {
             "function": func,
             "symbol": symbol,
@@ -22,40 +155,97 @@ class AlphaVantage:
         }
         if params is not None:
             parameters.update(params)
-            
-        # fixed API endpoint (i.e. URL)
-        r = requests.request(
-            method, self.base_url, params=parameters, **kwargs
+
+        for attempt in range(self.throttle_retries + 1):
+            if not self.limiter.acquire(timeout=self.max_wait):
+                raise RateLimitError(
+                    f"No AlphaVantage call available within {self.max_wait}s"
+                )
+            # fixed API endpoint (i.e. URL)
+            r = self._send(method, self.base_url, params=parameters, **kwargs)
+            try:
+                content = r.json()
+            except ValueError:
+                # Non-JSON responses, e.g. datatype=csv
+                return r, None
+            # Alphavantage API does not reflect error in status code 
+            if "Error Message" in content: 
+                raise RequestError(
+                    f"Request error: {content['Error Message']}", r
+                )
+            if not self._is_throttled(content):
+                return r, content
+            if attempt < self.throttle_retries:
+                metrics.count("retries", type(self).__name__, func)
+                backoff = self.throttle_backoff * 2 ** attempt
+                logger.info(
+                    f"Throttled on {func} {symbol or ''}, "
+                    f"backing off for {backoff}s."
+                )
+                self.limiter.pause(backoff)
+
+        message = content.get("Note") or content.get("Information")
+        raise RateLimitError(f"Request throttled: {message}")
+
+    def _endpoint_label(self, url, kwargs) -> str:
+        # Every call goes to the same URL, the function names the endpoint
+        return kwargs["params"]["function"]
+
+    @staticmethod
+    def _is_throttled(content) -> bool:
+        # Throttle replies carry a single "Note"/"Information" message
+        return (
+            isinstance(content, dict)
+            and len(content) == 1
+            and ("Note" in content or "Information" in content)
         )
-        # Alphavantage API does not reflect error in status code 
-        if "Error Message" in r.json(): 
-            raise Exception(f"Request error: {r.json()['Error Message']}")
-        
-        return r
     
+    def _query(self, func, symbol=None, params=None) -> dict:
+        '''Request JSON content, served from the cache when fresh'''
+        ttl = self.cache_ttl.get(func)
+        if self.cache is None or ttl is None:
+            return self._exchange(func, symbol, params=params)[1]
+
+        key = ResponseCache.make_key(func, symbol, params)
+        text = self.cache.get(key)
+        metrics.count("cache_misses" if text is None else "cache_hits", type(self).__name__, func)
+        if text is not None:
+            return json.loads(text)
+        # The response was decoded once to check for errors, reuse it
+        r, content = self._exchange(func, symbol, params=params)
+        self.cache.set(key, r.text, ttl)
+        return content
+
+    def _query_body(self, func, symbol=None, params=None) -> bytes | str:
+        '''Request the response body, served from the cache when fresh'''
+        ttl = self.cache_ttl.get(func)
+        if self.cache is None or ttl is None:
+            return self._request(func, symbol, params=params).content
+
+        key = ResponseCache.make_key(func, symbol, params)
+        text = self.cache.get(key)
+        metrics.count("cache_misses" if text is None else "cache_hits", type(self).__name__, func)
+        if text is None:
+            text = self._request(func, symbol, params=params).text
+            self.cache.set(key, text, ttl)
+        return text
+
     def _batch_request(
-        self, func, symbols: Iterable[str], method="GET", **kwargs
+        self, func, symbols: Iterable[str], params=None
     ) -> Iterable:
-        # Group API calls into batches of 5 to overcome rate limit
+        # Dispatch calls concurrently, paced by the rate limiter
         if isinstance(symbols, str):
             symbols = [symbols]
+        symbols = list(symbols)
         
-        jsons = []
-        start, stop = 0, 5
-        n = math.ceil(len(symbols) / 5)
-        print(f"Bundling API calls into {n} batches.")
-        while stop < len(symbols):
-            for symbol in symbols[start:stop]:
-                jsons.append(
-                    self._request(func, symbol, method, **kwargs).json()
-                )
-            print("Sleeping for 1 minute before next batch.")
-            time.sleep(60)
-            start += 5
-            stop += 5    
-        # Last batch
-        for symbol in symbols[start:len(symbols)]:
-            jsons.append(self._request(func, symbol, method, **kwargs).json())
+        logger.info(f"Requesting {func} for {len(symbols)} symbols.")
+        if len(symbols) <= 1 or self.max_workers <= 1:
+            return [self._query(func, symbol, params) for symbol in symbols]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            jsons = list(executor.map(
+                lambda symbol: self._query(func, symbol, params), symbols
+            ))
             
         return jsons
     
@@ -63,47 +253,40 @@ class AlphaVantage:
         r = self._request("MARKET_STATUS")
         return r
 
-    def FFR(self, interval="monthly"):
+    def _series(self, func, interval="monthly", datatype="csv") -> pd.DataFrame:
+        '''Request and parse an economic indicator or commodity series'''
+        params = _series_params(interval, datatype)
+        if datatype == "json":
+            content = self._query(func, params=params)
+        else:
+            content = self._query_body(func, params=params)
+        with metrics.timer("parse", type(self).__name__, func):
+            return _parse_series(content, datatype)
+
+    def FFR(self, interval="monthly", datatype="csv"):
         '''Federal funds rate
         '''
-        r = self._request("FEDERAL_FUNDS_RATE", params={"interval": interval})
-        data = pd.DataFrame(r.json()["data"])
-        data.set_index("date", inplace=True)
-        data.index = pd.to_datetime(data.index)
-        data = data.apply(pd.to_numeric)
-        return data
+        return self._series("FEDERAL_FUNDS_RATE", interval, datatype)
     
-    def CPI(self, interval="monthly"):
+    def CPI(self, interval="monthly", datatype="csv"):
         '''CPI
         '''
-        r = self._request("CPI", params={"interval": interval})
-        data = pd.DataFrame(r.json()["data"])
-        data.set_index("date", inplace=True)
-        data.index = pd.to_datetime(data.index)
-        data = data.apply(pd.to_numeric)
-        return data
-
-    def price_commodities(self, commodities, interval="monthly"):
+        return self._series("CPI", interval, datatype)
+
+    def price_commodities(self, commodities, interval="monthly", datatype="csv"):
         '''
         Args:
             commodities (str): [WTI, BRENT, NATURAL_GAS, COPPER, ALUMINUM,
                 WHEAT, CORN, COTTON, SUGAR, COFFEE, ALL_COMMODITIES]
+            interval (str): ["daily", "weekly", "monthly", "quarterly", "annual"]
+            datatype (str): ["csv", "json"]. CSV responses are smaller and
+                parsed faster.
         '''
-        r = self._request(commodities, params={"interval": interval})
-        data = pd.DataFrame(r.json()["data"])
-        data.set_index("date", inplace=True)
-        data.index = pd.to_datetime(data.index)
-        data.replace({".": np.nan}, inplace=True)
-        data = data.apply(pd.to_numeric)
-        return data
+        return self._series(commodities, interval, datatype)
     
     def get_fundamentals(self, symbols: Iterable[str]):
         jsons = self._batch_request("OVERVIEW", symbols)
-        data = pd.DataFrame(jsons)
-        data.set_index("Symbol", inplace=True)
-        data.replace("-", np.nan, inplace=True)
-        
-        return data.apply(pd.to_numeric, errors="ignore")
+        return _parse_fundamentals(jsons)
     
     def get_income_statement(self, symbols: str):
         # TODO: Complete
@@ -115,32 +298,339 @@ class AlphaVantage:
 
     def get_price(self, symbols: str):
         jsons = self._batch_request("GLOBAL_QUOTE", symbols)
-        prices = [
-            [d["Global Quote"]["01. symbol"], d["Global Quote"]["05. price"]]
-            for d in jsons
-        ]
-        data = pd.DataFrame(prices, columns=["Symbol", "Price"]).set_index("Symbol")
-        return data
+        return _parse_prices(jsons)
 
     def get_daily_ohlcv(
-        self, symbols: Iterable[str], outputsize="compact"
+        self, symbols: Iterable[str], outputsize="compact", panel=None
+    ) -> list | pd.DataFrame:
+        '''
+        Daily adjusted OHLCV of symbols.
+
+        Args:
+            symbols (Iterable[str]): Symbols
+            outputsize (str): ["compact", "full"]. Ignored when reading from
+                the store, which always holds the full history.
+            panel (str): Return one frame for all symbols instead of a list.
+                "long" for symbol and date columns, "multiindex" for a
+                (symbol, date) index.
+
+        Returns:
+            list | pandas.DataFrame: Frame per symbol, or panel frame
+        '''
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        symbols = list(symbols)
+
+        if self.store is not None:
+            self._update_store(symbols)
+            arrays = [self.store.load(symbol) for symbol in symbols]
+        else:
+            jsons = self._batch_request(
+                "TIME_SERIES_DAILY_ADJUSTED", symbols,
+                params={"outputsize": outputsize}
+            )
+            with metrics.timer("parse", type(self).__name__, "TIME_SERIES_DAILY_ADJUSTED"):
+                arrays = [_parse_daily(json) for json in jsons]
+
+        return _ohlcv_output(symbols, arrays, panel)
+
+    def _update_store(self, symbols: list):
+        # Append the compact tail to stored histories, and fetch the full
+        # history of new symbols and of symbols whose prices were adjusted
+        stored = [symbol for symbol in symbols if symbol in self.store]
+        tails = self._batch_request(
+            "TIME_SERIES_DAILY_ADJUSTED", stored, params={"outputsize": "compact"}
+        )
+        refetch = self._append_tails(symbols, stored, tails)
+        if not refetch:
+            return
+        fulls = self._batch_request(
+            "TIME_SERIES_DAILY_ADJUSTED", refetch, params={"outputsize": "full"}
+        )
+        for symbol, content in zip(refetch, fulls):
+            self.store.write(symbol, _parse_daily(content))
+
+    def _append_tails(self, symbols, stored, tails) -> list:
+        # Returns symbols whose full history has to be fetched
+        refetch = [symbol for symbol in symbols if symbol not in stored]
+        for symbol, content in zip(stored, tails):
+            if not self.store.append(symbol, _parse_daily(content)):
+                logger.info(f"Refetching full history of {symbol}.")
+                refetch.append(symbol)
+        return refetch
+
+
+class AsyncAlphaVantage(AsyncClient, AlphaVantage):
+    '''
+    Asyncio counterpart of AlphaVantage with the same methods as coroutines.
+    Batch requests run as concurrent tasks instead of threads.
+    '''
+
+    async def _request(self, func, symbol=None, method="GET", params=None, **kwargs):
+        return (await self._exchange(func, symbol, method, params, **kwargs))[0]
+
+    async def _exchange(self, func, symbol=None, method="GET", params=None, **kwargs) -> tuple:
+        if method != "GET" or kwargs:
+            return await self._fetch(func, symbol, method, params, **kwargs)
+        return await self.memo.call_async(
+            Memo.make_key(func, symbol, params or {}),
+            lambda: self._fetch(func, symbol, method, params)
+        )
+
+    async def _fetch(self, func, symbol=None, method="GET", params=None, **kwargs) -> tuple:
+        parameters = {
+            "function": func,
+            "symbol": symbol,
+            "apikey": self.api_key
+        }
+        if params is not None:
+            parameters.update(params)
+
+        for attempt in range(self.throttle_retries + 1):
+            if not await self.limiter.acquire_async(timeout=self.max_wait):
+                raise RateLimitError(
+                    f"No AlphaVantage call available within {self.max_wait}s"
+                )
+            r = await self._send(method, self.base_url, params=parameters, **kwargs)
+            try:
+                content = r.json()
+            except ValueError:
+                return r, None
+            if "Error Message" in content:
+                raise RequestError(
+                    f"Request error: {content['Error Message']}", r
+                )
+            if not self._is_throttled(content):
+                return r, content
+            if attempt < self.throttle_retries:
+                metrics.count("retries", type(self).__name__, func)
+                self.limiter.pause(self.throttle_backoff * 2 ** attempt)
+
+        message = content.get("Note") or content.get("Information")
+        raise RateLimitError(f"Request throttled: {message}")
+
+    async def _query(self, func, symbol=None, params=None) -> dict:
+        ttl = self.cache_ttl.get(func)
+        if self.cache is None or ttl is None:
+            return (await self._exchange(func, symbol, params=params))[1]
+
+        key = ResponseCache.make_key(func, symbol, params)
+        text = self.cache.get(key)
+        metrics.count("cache_misses" if text is None else "cache_hits", type(self).__name__, func)
+        if text is not None:
+            return json.loads(text)
+        r, content = await self._exchange(func, symbol, params=params)
+        self.cache.set(key, r.text, ttl)
+        return content
+
+    async def _query_body(self, func, symbol=None, params=None) -> bytes | str:
+        ttl = self.cache_ttl.get(func)
+        if self.cache is None or ttl is None:
+            return (await self._request(func, symbol, params=params)).content
+
+        key = ResponseCache.make_key(func, symbol, params)
+        text = self.cache.get(key)
+        metrics.count("cache_misses" if text is None else "cache_hits", type(self).__name__, func)
+        if text is None:
+            text = (await self._request(func, symbol, params=params)).text
+            self.cache.set(key, text, ttl)
+        return text
+
+    async def _batch_request(
+        self, func, symbols: Iterable[str], params=None
+    ) -> Iterable:
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def query(symbol):
+            async with semaphore:
+                return await self._query(func, symbol, params)
+
+        return list(await asyncio.gather(*(query(symbol) for symbol in symbols)))
+
+    async def get_market_status(self):
+        return await self._request("MARKET_STATUS")
+
+    async def _series(self, func, interval="monthly", datatype="csv") -> pd.DataFrame:
+        params = _series_params(interval, datatype)
+        if datatype == "json":
+            content = await self._query(func, params=params)
+        else:
+            content = await self._query_body(func, params=params)
+        with metrics.timer("parse", type(self).__name__, func):
+            return _parse_series(content, datatype)
+
+    async def FFR(self, interval="monthly", datatype="csv"):
+        return await self._series("FEDERAL_FUNDS_RATE", interval, datatype)
+
+    async def CPI(self, interval="monthly", datatype="csv"):
+        return await self._series("CPI", interval, datatype)
+
+    async def price_commodities(self, commodities, interval="monthly", datatype="csv"):
+        return await self._series(commodities, interval, datatype)
+
+    async def get_fundamentals(self, symbols: Iterable[str]):
+        return _parse_fundamentals(await self._batch_request("OVERVIEW", symbols))
+
+    async def get_income_statement(self, symbols: str):
+        return await self._batch_request("INCOME_STATEMENT", symbols)
+
+    async def get_price(self, symbols: str):
+        return _parse_prices(await self._batch_request("GLOBAL_QUOTE", symbols))
+
+    async def get_daily_ohlcv(
+        self, symbols: Iterable[str], outputsize="compact", panel=None
     ) -> list | pd.DataFrame:
-        # outputsize: ["compact", "full"]
-        jsons = self._batch_request(
-            "TIME_SERIES_DAILY_ADJUSTED", symbols,
-            params={"outputsize": outputsize}
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        symbols = list(symbols)
+
+        if self.store is not None:
+            await self._update_store(symbols)
+            arrays = [self.store.load(symbol) for symbol in symbols]
+        else:
+            jsons = await self._batch_request(
+                "TIME_SERIES_DAILY_ADJUSTED", symbols,
+                params={"outputsize": outputsize}
+            )
+            with metrics.timer("parse", type(self).__name__, "TIME_SERIES_DAILY_ADJUSTED"):
+                arrays = [_parse_daily(json) for json in jsons]
+
+        return _ohlcv_output(symbols, arrays, panel)
+
+    async def _update_store(self, symbols: list):
+        stored = [symbol for symbol in symbols if symbol in self.store]
+        tails = await self._batch_request(
+            "TIME_SERIES_DAILY_ADJUSTED", stored, params={"outputsize": "compact"}
+        )
+        refetch = self._append_tails(symbols, stored, tails)
+        if not refetch:
+            return
+        fulls = await self._batch_request(
+            "TIME_SERIES_DAILY_ADJUSTED", refetch, params={"outputsize": "full"}
+        )
+        for symbol, content in zip(refetch, fulls):
+            self.store.write(symbol, _parse_daily(content))
+
+
+def _series_params(interval, datatype) -> dict:
+    if datatype not in ("csv", "json"):
+        raise ValueError(f"Unknown datatype: {datatype}")
+    return {"interval": interval, "datatype": datatype}
+
+
+def _parse_series(content: bytes | str | dict, datatype="csv") -> pd.DataFrame:
+    '''
+    Parse an economic indicator or commodity series into a frame with a
+    float64 value column indexed by date. Missing values (".") are NaN.
+
+    Args:
+        content (bytes | str | dict): Response body, or decoded JSON content
+        datatype (str): ["csv", "json"]
+    '''
+    if datatype == "csv":
+        buffer = io.BytesIO(content) if isinstance(content, bytes) else io.StringIO(content)
+        data = pd.read_csv(
+            buffer, engine=CSV_ENGINE, dtype=SERIES_SCHEMA, parse_dates=[0],
+            index_col=0, na_values=["."], keep_default_na=False,
+        )
+    else:
+        if not isinstance(content, dict):
+            content = json.loads(content)
+        rows = content["data"]
+        values = np.array([row["value"] for row in rows], dtype=object)
+        data = pd.DataFrame(
+            {"value": pd.to_numeric(values, errors="coerce")},
+            index=pd.to_datetime([row["date"] for row in rows], format="%Y-%m-%d"),
+        )
+    data.index.name = "date"
+    return data
+
+
+def _parse_fundamentals(jsons: list) -> pd.DataFrame:
+    '''Parse OVERVIEW responses with the column types of OVERVIEW_SCHEMA'''
+    columns = {}
+    for column in dict.fromkeys(chain.from_iterable(jsons)):
+        values = np.array([content.get(column) for content in jsons], dtype=object)
+        dtype = OVERVIEW_SCHEMA.get(column)
+        if dtype == "float64":
+            # Missing values are reported as "None" or "-"
+            values = pd.to_numeric(values, errors="coerce")
+        elif dtype == "datetime64":
+            values = pd.to_datetime(values, format="%Y-%m-%d", errors="coerce")
+        else:
+            values[values == "-"] = None
+        columns[column] = values
+    return pd.DataFrame(columns).set_index("Symbol")
+
+
+def _parse_prices(jsons: list) -> pd.DataFrame:
+    prices = [
+        [d["Global Quote"]["01. symbol"], d["Global Quote"]["05. price"]]
+        for d in jsons
+    ]
+    return pd.DataFrame(prices, columns=["Symbol", "Price"]).set_index("Symbol")
+
+
+def _parse_daily(content: dict) -> np.ndarray:
+    '''
+    Parse a TIME_SERIES_DAILY_ADJUSTED response into a structured array
+    sorted by date. Values are converted in a single pass over the payload
+    into preallocated columns.
+    '''
+    series = content["Time Series (Daily)"]
+    n = len(series)
+    ncols = len(OHLCV_DTYPE.names) - 1
+    data = np.empty(n, dtype=OHLCV_DTYPE)
+    data["date"] = np.array(list(series), dtype="datetime64[D]")
+    values = np.array(
+        list(chain.from_iterable(map(dict.values, series.values()))),
+        dtype=np.float64
+    ).reshape(n, ncols)
+    for i, name in enumerate(OHLCV_DTYPE.names[1:]):
+        data[name] = values[:, i]
+
+    # AlphaVantage lists the most recent day first
+    if n > 1 and data["date"][0] > data["date"][-1]:
+        data = data[::-1]
+    if not np.all(data["date"][1:] > data["date"][:-1]):
+        data = np.sort(data, order="date")
+    return data
+
+
+def _ohlcv_frame(data: np.ndarray) -> pd.DataFrame:
+    index = pd.DatetimeIndex(data["date"])
+    return pd.DataFrame(
+        {name: data[name] for name in OHLCV_DTYPE.names[1:]}, index=index
+    )
+
+
+def _ohlcv_output(symbols, arrays, panel=None) -> list | pd.DataFrame:
+    if panel is not None:
+        return _ohlcv_panel(symbols, arrays, panel)
+
+    list_ohlcv = [_ohlcv_frame(data) for data in arrays]
+    if len(list_ohlcv) == 1:
+        return list_ohlcv[0]
+
+    return list_ohlcv
+
+
+def _ohlcv_panel(symbols, arrays, panel="long") -> pd.DataFrame:
+    '''Concatenate OHLCV arrays of symbols into one panel frame'''
+    lengths = [len(data) for data in arrays]
+    data = np.concatenate(arrays) if arrays else np.empty(0, OHLCV_DTYPE)
+    symbol = np.repeat(np.asarray(symbols, dtype=object), lengths)
+    columns = {name: data[name] for name in OHLCV_DTYPE.names[1:]}
+
+    if panel == "long":
+        return pd.DataFrame({
+            "symbol": symbol, "date": pd.DatetimeIndex(data["date"]), **columns
+        })
+    if panel == "multiindex":
+        index = pd.MultiIndex.from_arrays(
+            [symbol, pd.DatetimeIndex(data["date"])], names=["symbol", "date"]
         )
-        list_ohlcv = [
-            pd.DataFrame.from_dict(
-                json['Time Series (Daily)'], orient="index", dtype='float'
-            ).sort_index() for json in jsons
-        ]
-        colnames = {colname: colname[3:] for colname in list(list_ohlcv[0])}
-        for data in list_ohlcv:
-            data.rename(columns=colnames, inplace=True)
-            data.index = pd.to_datetime(data.index)
-
-        if len(list_ohlcv) == 1:
-            return list_ohlcv[0]
-
-        return list_ohlcv
+        return pd.DataFrame(columns, index=index)
+    raise ValueError(f"Unknown panel format: {panel}")
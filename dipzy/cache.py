@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class ResponseCache:
+    '''
+    Persistent response cache stored in SQLite. Entries expire after a
+    per-entry TTL and the least recently used entries are evicted once the
+    cache exceeds its size bounds. The database runs in WAL mode so several
+    processes can read and write the same file at once.
+
+    Args:
+        path (str): Database file
+        max_entries (int): Maximum number of entries kept
+        max_bytes (int): Maximum total size of cached values in bytes
+        touch_interval (float): Seconds before a read refreshes the access
+            time of an entry, so frequent reads do not take the write lock
+    '''
+
+    def __init__(self, path, max_entries=10000, max_bytes=256 * 2**20,
+                 touch_interval=5):
+        self.path = os.path.expanduser(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires REAL NOT NULL, accessed REAL NOT NULL, "
+                "size INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed "
+                "ON responses (accessed)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        raw = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, key) -> str | None:
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            row = conn.execute(
+                "SELECT value, accessed FROM responses WHERE key = ? AND expires > ?",
+                (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] >= self.touch_interval:
+                conn.execute(
+                    "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+                )
+        return row[0]
+
+    def set(self, key, value: str, ttl: float):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, now + ttl, now, len(value.encode()))
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        count, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        # Walk entries from least recently used until within bounds
+        rows = conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ).fetchall()
+        stale = []
+        for key, entry_size in rows:
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            stale.append((key,))
+            count -= 1
+            size -= entry_size
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def __len__(self):
+        conn = self._connect()
+        return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+_MISSING = object()
+
+
+class Memo:
+    '''
+    In-memory memo of calls with single-flight: concurrent calls with the same
+    key share one in-flight call, and its result is reused for ttl seconds.
+    Failed calls are not memoized. Thread-safe, with call_async for coroutines.
+
+    Args:
+        ttl (float): Seconds a result is reused. 0 only shares in-flight calls.
+        maxsize (int): Maximum number of results kept. Least recently used
+            results are evicted first.
+    '''
+
+    def __init__(self, ttl=1, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.results = OrderedDict() # key -> (expires, result)
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts) -> tuple:
+        '''Hashable key of call arguments, e.g. params dicts'''
+        return tuple(
+            tuple(sorted(part.items())) if isinstance(part, dict) else part
+            for part in parts
+        )
+
+    def _get(self, key):
+        # Call with the lock held
+        item = self.results.get(key)
+        if item is None:
+            return _MISSING
+        if item[0] <= time.monotonic():
+            del self.results[key]
+            return _MISSING
+        self.results.move_to_end(key)
+        return item[1]
+
+    def _set(self, key, result):
+        # Call with the lock held
+        if self.ttl <= 0:
+            return
+        self.results[key] = (time.monotonic() + self.ttl, result)
+        self.results.move_to_end(key)
+        while len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+
+    def call(self, key, func):
+        '''
+        Args:
+            key (Hashable): Identity of the call
+            func (Callable): Makes the call if no result is memoized or
+                in flight
+
+        Returns:
+            Result of func, possibly from an earlier or concurrent call
+        '''
+        with self.lock:
+            result = self._get(key)
+            if result is not _MISSING:
+                return result
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            with self.lock:
+                del self.inflight[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.inflight[key]
+            self._set(key, result)
+        future.set_result(result)
+        return result
+
+    async def call_async(self, key, func):
+        '''Coroutine counterpart of call, where func returns an awaitable'''
+        with self.lock:
+            result = self._get(key)
+            if result is not _MISSING:
+                return result
+            # Tasks are bound to their event loop
+            task_key = (asyncio.get_running_loop(), key)
+            task = self.inflight.get(task_key)
+            if task is None:
+                task = self.inflight[task_key] = asyncio.ensure_future(func())
+                task.add_done_callback(lambda task: self._done(task_key, task))
+        # Cancelling one caller does not cancel the call shared by others
+        return await asyncio.shield(task)
+
+    def _done(self, task_key, task):
+        with self.lock:
+            del self.inflight[task_key]
+            if not task.cancelled() and task.exception() is None:
+                self._set(task_key[1], task.result())
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
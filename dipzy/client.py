@@ -0,0 +1,132 @@
+import re
+
+import requests
+
+from . import metrics
+from .transport import get_default_async_transport, get_default_transport
+
+
+# Path segments of IDs, e.g. /users/12345/tweets -> /users/:id/tweets
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+class RequestError(Exception):
+    '''Raised when an API replies with an error'''
+
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+    @property
+    def status_code(self):
+        return None if self.response is None else self.response.status_code
+
+
+class Client:
+    '''
+    Base class of dipzy API clients. Sends requests through a shared pooled
+    transport and raises RequestError on error responses.
+
+    Args:
+        transport (Transport): HTTP transport. Defaults to the shared
+            process-wide transport.
+    '''
+    base_url = None
+    headers = None
+
+    def __init__(self, transport=None):
+        if transport is None:
+            transport = self._default_transport()
+        self.transport = transport
+
+    @staticmethod
+    def _default_transport():
+        return get_default_transport()
+
+    def _send(self, method, url, **kwargs) -> requests.Response:
+        if self.headers:
+            kwargs["headers"] = {**self.headers, **(kwargs.get("headers") or {})}
+        if not metrics.enabled:
+            r = self.transport.request(method, url, **kwargs)
+        else:
+            event = metrics.before_call(
+                type(self).__name__, method, self._endpoint_label(url, kwargs)
+            )
+            try:
+                r = self.transport.request(method, url, **kwargs)
+            except Exception as e:
+                metrics.after_call(event, error=e)
+                raise
+            metrics.after_call(event, r.status_code, _body_size(r, kwargs))
+        self._check_response(r)
+        return r
+
+    def _endpoint_label(self, url, kwargs) -> str:
+        '''Endpoint of a request in metrics, without IDs to bound labels'''
+        if self.base_url and url.startswith(self.base_url):
+            url = url[len(self.base_url):]
+        return _ID_SEGMENT.sub("/:id", url)
+
+    def _check_response(self, r):
+        # 304 Not Modified only replies to conditional requests
+        if r.status_code not in (200, 201, 304):
+            raise RequestError(f"Request error: {r.status_code} {r.text}", r)
+
+    def _request(self, endpoint, method="GET", params=None, **kwargs):
+        url = self.base_url + endpoint
+        return self._send(method, url, params=params, **kwargs)
+
+
+class AsyncClient:
+    '''
+    Mixin turning a Client into its asyncio counterpart. Place it before the
+    synchronous client in the bases so configuration and response parsing are
+    shared, and override the network-bound methods as coroutines.
+
+    E.g. class AsyncCoinGecko(AsyncClient, CoinGecko)
+    '''
+
+    @staticmethod
+    def _default_transport():
+        return get_default_async_transport()
+
+    async def _send(self, method, url, **kwargs):
+        if self.headers:
+            kwargs["headers"] = {**self.headers, **(kwargs.get("headers") or {})}
+        if not metrics.enabled:
+            r = await self.transport.request(method, url, **kwargs)
+        else:
+            event = metrics.before_call(
+                type(self).__name__, method, self._endpoint_label(url, kwargs)
+            )
+            try:
+                r = await self.transport.request(method, url, **kwargs)
+            except Exception as e:
+                metrics.after_call(event, error=e)
+                raise
+            metrics.after_call(event, r.status_code, _body_size(r, kwargs))
+        self._check_response(r)
+        return r
+
+    async def _request(self, endpoint, method="GET", params=None, **kwargs):
+        url = self.base_url + endpoint
+        return await self._send(method, url, params=params, **kwargs)
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def _body_size(r, kwargs):
+    # Streamed bodies are not read here
+    length = r.headers.get("Content-Length")
+    if length is not None:
+        return int(length)
+    if kwargs.get("stream"):
+        return None
+    return len(r.content)
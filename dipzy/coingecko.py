@@ -1,108 +1,395 @@
+from __future__ import annotations
+
+import asyncio
+import json
 import logging
-import requests
-import pandas as pd
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from . import metrics
+from .cache import Memo
+from .client import AsyncClient, Client
+from .ratelimit import RateLimiter
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 logger = logging.getLogger(__name__) # module-level logger
 
-class CoinGecko:
+MAX_PER_PAGE = 250 # page size limit of /coins/markets
+MAX_IDS_LENGTH = 2000 # characters of comma-separated ids per request
+
+
+class SymbolIndex:
+    '''
+    In-memory index of the CoinGecko coin catalogue mapping lowercase symbols
+    to CoinGecko IDs. The catalogue is revalidated with a conditional request
+    once it is older than refresh_interval and can persist to disk, so a
+    restarted process resolves symbols without downloading it again.
+
+    Args:
+        path (str): JSON file of the catalogue. Not persisted if None.
+        refresh_interval (float): Seconds before the catalogue is revalidated
+    '''
+
+    def __init__(self, path=None, refresh_interval=24 * 60 * 60):
+        self.path = None if path is None else os.path.expanduser(path)
+        self.refresh_interval = refresh_interval
+        self.ids = {}
+        self.names = {}
+        self.fetched_at = None
+        self.etag = None
+        self.last_modified = None
+        self.lock = threading.Lock()
+        self.refreshes = {} # event loop -> in-flight async refresh
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_stale(self) -> bool:
+        return (
+            self.fetched_at is None
+            or time.time() - self.fetched_at > self.refresh_interval
+        )
+
+    def validators(self) -> dict:
+        '''Headers of a conditional request for the catalogue'''
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def update(self, r):
+        '''Update the index from a /coins/list response'''
+        if r.status_code != 304:
+            ids = {}
+            names = {}
+            for coin in r.json():
+                ids.setdefault(coin["symbol"], []).append(coin["id"])
+                names[coin["id"]] = coin["name"]
+            self.ids = {symbol: tuple(coin_ids) for symbol, coin_ids in ids.items()}
+            self.names = names
+            self.etag = r.headers.get("ETag")
+            self.last_modified = r.headers.get("Last-Modified")
+        self.fetched_at = time.time()
+        if self.path is not None:
+            self.save()
+
+    def lookup(self, symbols) -> dict:
+        '''Map symbols to tuples of IDs. Missing symbols are left out.'''
+        return {symbol: self.ids[symbol] for symbol in symbols if symbol in self.ids}
+
+    def to_frame(self) -> pd.DataFrame:
+        import pandas as pd
+
+        data = pd.DataFrame(
+            [
+                (coin_id, symbol, self.names[coin_id])
+                for symbol, coin_ids in self.ids.items()
+                for coin_id in coin_ids
+            ],
+            columns=["id", "symbol", "name"]
+        )
+        return data.set_index("symbol")
+
+    def load(self):
+        with open(self.path) as f:
+            state = json.load(f)
+        self.fetched_at = state["fetched_at"]
+        self.etag = state["etag"]
+        self.last_modified = state["last_modified"]
+        self.names = state["names"]
+        self.ids = {symbol: tuple(ids) for symbol, ids in state["ids"].items()}
+
+    def save(self):
+        state = {
+            "fetched_at": self.fetched_at,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "names": self.names,
+            "ids": self.ids,
+        }
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+
+_default_symbol_index = SymbolIndex()
+
+
+class CoinGecko(Client):
+    '''
+    CoinGecko API client.
+
+    Args:
+        transport (Transport): HTTP transport shared with other clients
+        symbol_index (SymbolIndex | str): Index of the coin catalogue used by
+            convert_symbols, or path of its file. Defaults to an in-memory
+            index shared by all clients.
+        calls_per_minute (int): Rate limit of the plan
+        max_workers (int): Number of concurrent requests of paginated calls
+        memo_ttl (float): Seconds a response is reused for identical
+            requests. Concurrent identical requests always share one call.
+    '''
     base_url = 'https://api.coingecko.com/api/v3'
 
-    def __init__(self):
-        self.base_url = base_url
+    def __init__(
+        self,
+        transport=None,
+        symbol_index=None,
+        calls_per_minute=30,
+        max_workers=4,
+        memo_ttl=1,
+    ):
+        super().__init__(transport)
+        self.limiter = RateLimiter.from_quota(calls_per_minute=calls_per_minute)
+        self.max_workers = max_workers
+        if symbol_index is None:
+            symbol_index = _default_symbol_index
+        elif isinstance(symbol_index, str):
+            symbol_index = SymbolIndex(symbol_index)
+        self.symbol_index = symbol_index
+        self.memo = Memo(memo_ttl)
 
     def _request(self, endpoint, method="GET", params=None, **kwargs):
-        url = self.base_url + endpoint 
-        r = requests.request(method, url, params=params, **kwargs)
-        if r.status_code != 200 and r.status_code != 201:
-            raise Exception(f"Request error: {r.status_code} {r.text}")
-        
-        return r
+        if method != "GET" or kwargs:
+            return self._fetch(endpoint, method, params, **kwargs)
+        # Identical requests in flight or within memo_ttl share one call
+        return self.memo.call(
+            Memo.make_key(endpoint, params or {}),
+            lambda: self._fetch(endpoint, method, params)
+        )
+
+    def _fetch(self, endpoint, method="GET", params=None, **kwargs):
+        self.limiter.acquire()
+        return super()._request(endpoint, method, params, **kwargs)
 
-    def convert_symbols(self, symbols=None):
+    def _refresh_symbol_index(self, force=False) -> SymbolIndex:
+        index = self.symbol_index
+        with index.lock:
+            if force or index.is_stale():
+                r = self._request("/coins/list", headers=index.validators())
+                with metrics.timer("parse", type(self).__name__, "/coins/list"):
+                    index.update(r)
+        return index
+
+    def convert_symbols(self, symbols=None, ambiguous="all"):
         '''
         Convert token symbols to CoinGecko IDs. Does not return symbols not
-        found in CoinGecko.
+        found in CoinGecko. Symbols are resolved from the in-memory symbol
+        index, which only goes to the network when it is stale.
         
         Args:
             symbols (List): List of symbols. Symbols have to be lowercase.
+            ambiguous (str): Handling of symbols shared by several coins.
+                "all" returns every ID, "skip" leaves the symbol out and
+                "raise" raises ValueError.
         
         Returns:
             pandas.Series: Coingecko IDs
         ''' 
-        endpoint =  "/coins/list"
-        r = self._request(endpoint)
-        coingecko_tokens = pd.read_json(r.json())
-        coingecko_tokens.set_index('symbol', inplace=True)
-        
-        if symbols is None:
-            return coingecko_tokens
-        
-        missing_symbols = [s for s in symbols if s not in coingecko_tokens.index]
-        if len(missing_symbols) > 0:
-            logger.info(
-                f'Symbols missing from CoinGecko: {missing_symbols}'
-            )
-        
-        present_symbols = set(coingecko_tokens.index.tolist()) & set(symbols)
-        ids = coingecko_tokens.id.loc[present_symbols]
-        
-        ambiguous_symbols = ids.index[ids.index.duplicated(keep=False)].unique()
-        if len(ambiguous_symbols) > 0:
-            logger.info(f'Following symbols are ambiguous: {ambiguous_symbols}')
-        
-        ids.index = ids.index.str.upper()
-        return ids
+        index = self._refresh_symbol_index()
+        return _convert_symbols(index, symbols, ambiguous)
 
     def get_coins_markets(
         self,
         ids=None,
         select=['symbol', 'name', 'current_price', 'total_volume'],
         order='market_cap',
-        timepoints='24h'
+        timepoints='24h',
+        pages=1,
+        per_page=MAX_PER_PAGE,
     ):
         '''
         Get prices market data of tokens from CoinGecko API: coins/markets.
         If ids is not provided, returns top tokens ranked by total volume.
+        Large lists of ids are split into request-sized chunks, and chunks or
+        pages are fetched concurrently within the rate limit.
         
         Args:
             ids (List): List of coingecko IDs.
             select (List): List of column names of coingecko response data.
             timepoints (str): Time points of percentage change. E.g. '24h,7d,1y'
+            pages (int): Number of pages of top tokens if ids is not provided.
+            per_page (int): Tokens per page, at most 250.
         
         Return:
             pandas.DataFrame: Prices and percentage change of tokens.
         '''
         endpoint = "/coins/markets"
-        
-        if ids is not None:
-            ids_str = ','.join(ids)
-            params = {
-                'vs_currency': 'usd',
-                'ids': ids_str,
-                'order': order,
-                'price_change_percentage': timepoints
-            }
+        queries = _markets_queries(ids, order, timepoints, pages, per_page)
+        if len(queries) == 1 or self.max_workers <= 1:
+            markets = [self._request(endpoint, params=params).json() for params in queries]
         else:
-            params = {
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                markets = list(executor.map(
+                    lambda params: self._request(endpoint, params=params).json(),
+                    queries
+                ))
+        with metrics.timer("parse", type(self).__name__, "/coins/markets"):
+            return _select_markets(markets, select, timepoints)
+
+
+class AsyncCoinGecko(AsyncClient, CoinGecko):
+    '''Asyncio counterpart of CoinGecko with the same methods as coroutines'''
+
+    async def _request(self, endpoint, method="GET", params=None, **kwargs):
+        if method != "GET" or kwargs:
+            return await self._fetch(endpoint, method, params, **kwargs)
+        return await self.memo.call_async(
+            Memo.make_key(endpoint, params or {}),
+            lambda: self._fetch(endpoint, method, params)
+        )
+
+    async def _fetch(self, endpoint, method="GET", params=None, **kwargs):
+        await self.limiter.acquire_async()
+        return await super()._request(endpoint, method, params, **kwargs)
+
+    async def _refresh_symbol_index(self, force=False) -> SymbolIndex:
+        index = self.symbol_index
+        if not (force or index.is_stale()):
+            return index
+        # Concurrent refreshes on a loop share one request. The thread lock is
+        # only held to update the index so the loop never waits on a sync refresh.
+        loop = asyncio.get_running_loop()
+        task = index.refreshes.get(loop)
+        if task is None:
+            task = index.refreshes[loop] = loop.create_task(self._update_symbol_index(index))
+            task.add_done_callback(lambda _: index.refreshes.pop(loop, None))
+        await asyncio.shield(task)
+        return index
+
+    async def _update_symbol_index(self, index):
+        r = await self._request("/coins/list", headers=index.validators())
+        with index.lock, metrics.timer("parse", type(self).__name__, "/coins/list"):
+            index.update(r)
+
+    async def convert_symbols(self, symbols=None, ambiguous="all"):
+        index = await self._refresh_symbol_index()
+        return _convert_symbols(index, symbols, ambiguous)
+
+    async def get_coins_markets(
+        self,
+        ids=None,
+        select=['symbol', 'name', 'current_price', 'total_volume'],
+        order='market_cap',
+        timepoints='24h',
+        pages=1,
+        per_page=MAX_PER_PAGE,
+    ):
+        queries = _markets_queries(ids, order, timepoints, pages, per_page)
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def fetch(params):
+            async with semaphore:
+                r = await self._request("/coins/markets", params=params)
+                return r.json()
+
+        markets = await asyncio.gather(*(fetch(params) for params in queries))
+        with metrics.timer("parse", type(self).__name__, "/coins/markets"):
+            return _select_markets(markets, select, timepoints)
+
+
+def _convert_symbols(index: SymbolIndex, symbols=None, ambiguous="all"):
+    if symbols is None:
+        return index.to_frame()
+
+    found = index.lookup(symbols)
+    missing_symbols = [s for s in symbols if s not in found]
+    if len(missing_symbols) > 0:
+        logger.info(
+            f'Symbols missing from CoinGecko: {missing_symbols}'
+        )
+
+    ambiguous_symbols = [s for s, ids in found.items() if len(ids) > 1]
+    if len(ambiguous_symbols) > 0:
+        if ambiguous == "raise":
+            raise ValueError(f'Following symbols are ambiguous: {ambiguous_symbols}')
+        logger.info(f'Following symbols are ambiguous: {ambiguous_symbols}')
+
+    symbol_index = []
+    ids = []
+    for symbol, coin_ids in found.items():
+        if ambiguous == "skip" and len(coin_ids) > 1:
+            continue
+        symbol_index.extend([symbol.upper()] * len(coin_ids))
+        ids.extend(coin_ids)
+
+    import pandas as pd
+    return pd.Series(ids, index=pd.Index(symbol_index, name="symbol"), name="id")
+
+
+def _markets_queries(ids, order, timepoints, pages=1, per_page=MAX_PER_PAGE) -> list:
+    '''Query parameters of each /coins/markets request'''
+    per_page = min(per_page, MAX_PER_PAGE)
+    if ids is None:
+        return [
+            {
                 'vs_currency': 'usd',
                 'order': 'volume_desc',
+                'per_page': per_page,
+                'page': page,
                 'price_change_percentage': timepoints
             }
-        
-        r = self._request(endpoint, params=params)
-        data = pd.DataFrame(response.json())
-        
-        # Filter out unnecessary info from data
-        list_timepoints = timepoints.split(',')
-        keys_timepoints = [
-            f'price_change_percentage_{x}_in_currency'
-            for x in list_timepoints
+            for page in range(1, pages + 1)
         ]
 
-        features = select + keys_timepoints
-        data_selected = data[features]
-        data_selected.columns = select + list_timepoints
-        # data_selected.sort_values('symbol', inplace=True)
-        
-        return data_selected
+    # Split ids so each request fits into one page and a URL
+    chunks = []
+    chunk = []
+    length = 0
+    for coin_id in ids:
+        if chunk and (len(chunk) == per_page or length + len(coin_id) + 1 > MAX_IDS_LENGTH):
+            chunks.append(chunk)
+            chunk = []
+            length = 0
+        chunk.append(coin_id)
+        length += len(coin_id) + 1
+    if chunk:
+        chunks.append(chunk)
+
+    return [
+        {
+            'vs_currency': 'usd',
+            'ids': ','.join(chunk),
+            'order': order,
+            'per_page': per_page,
+            'page': 1,
+            'price_change_percentage': timepoints
+        }
+        for chunk in chunks
+    ]
+
+
+def _select_markets(markets: list, select, timepoints) -> pd.DataFrame:
+    '''Merge pages of /coins/markets, keeping only the selected fields'''
+    list_timepoints = timepoints.split(',')
+    keys_timepoints = [
+        f'price_change_percentage_{x}_in_currency'
+        for x in list_timepoints
+    ]
+
+    # Project columns while reading records instead of building full frames
+    columns = {key: [] for key in select + keys_timepoints}
+    for page in markets:
+        for coin in page:
+            for key, values in columns.items():
+                values.append(coin.get(key))
+
+    import pandas as pd
+    data_selected = pd.DataFrame(columns)
+    data_selected.columns = select + list_timepoints
+    
+    return data_selected
@@ -0,0 +1,273 @@
+'''
+Instrumentation of outbound calls. Disabled by default, in which case every
+instrumentation point costs a single flag check.
+
+E.g.
+    from dipzy import metrics
+
+    metrics.enable()
+    metrics.add_hook(after=lambda event: print(event.endpoint, event.duration))
+    ...
+    print(metrics.registry.to_prometheus())
+
+Every request of a client is recorded as an Event passed to the hooks and
+counted in the registry per client and endpoint:
+
+    dipzy_requests_total            Requests by status code
+    dipzy_request_errors_total      Requests failing without a response
+    dipzy_request_seconds           Latency histogram
+    dipzy_response_bytes_total      Bytes of response bodies
+    dipzy_retries_total             Throttled or rate limited calls retried
+    dipzy_cache_hits_total          Responses served from a cache
+    dipzy_cache_misses_total        Cache lookups sent to the API
+    dipzy_parse_seconds             Histogram of response parsing time
+'''
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+enabled = False
+_before_hooks = []
+_after_hooks = []
+_null_timer = nullcontext()
+
+
+class Histogram:
+    '''Cumulative histogram of observations in fixed buckets'''
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list:
+        total, counts = 0, []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Registry:
+    '''
+    In-process registry of counters and histograms keyed by metric name and
+    labels.
+
+    Args:
+        buckets (tuple): Upper bounds of histogram buckets in seconds
+    '''
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, labels, value=1):
+        '''
+        Args:
+            name (str): Metric name
+            labels (tuple): (label, value) pairs
+            value (float): Increment
+        '''
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def get(self, name, **labels):
+        '''Sum of a counter over the series matching labels'''
+        with self.lock:
+            return sum(
+                value for (metric, series), value in self.counters.items()
+                if metric == name and labels.items() <= dict(series).items()
+            )
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_dict(self) -> dict:
+        '''Snapshot of the metrics, e.g. {name: [(labels, value), ...]}'''
+        data = {}
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                data.setdefault(name, []).append((dict(labels), value))
+            for (name, labels), histogram in self.histograms.items():
+                data.setdefault(name, []).append((dict(labels), {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": dict(zip(histogram.buckets, histogram.cumulative())),
+                }))
+        return data
+
+    def to_prometheus(self) -> str:
+        '''Metrics in the Prometheus text exposition format'''
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            for name in _names(counters):
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in counters:
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+            for name in _names(histograms):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in histograms:
+                    if metric != name:
+                        continue
+                    bounds = [*map(str, histogram.buckets), "+Inf"]
+                    counts = [*histogram.cumulative(), histogram.count]
+                    for bound, count in zip(bounds, counts):
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _names(items) -> list:
+    return list(dict.fromkeys(name for (name, _), _ in items))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+registry = Registry()
+
+
+class Event:
+    '''An outbound call, passed to hooks before it is sent and after it returns'''
+    __slots__ = ("client", "method", "endpoint", "start", "duration", "status", "bytes", "error")
+
+    def __init__(self, client, method, endpoint):
+        self.client = client
+        self.method = method
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.bytes = None
+        self.error = None
+
+    def labels(self) -> tuple:
+        return (("client", self.client), ("endpoint", self.endpoint))
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def add_hook(before=None, after=None):
+    '''
+    Register callables called with the Event of every outbound call, before
+    it is sent and after its response or error. Exceptions raised by hooks are
+    logged and ignored.
+    '''
+    if before is not None:
+        _before_hooks.append(before)
+    if after is not None:
+        _after_hooks.append(after)
+
+
+def remove_hook(before=None, after=None):
+    if before is not None:
+        _before_hooks.remove(before)
+    if after is not None:
+        _after_hooks.remove(after)
+
+
+def _run_hooks(hooks, event):
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception:
+            logger.exception("Instrumentation hook failed")
+
+
+def before_call(client, method, endpoint) -> Event:
+    '''Start recording a call. Only call while instrumentation is enabled.'''
+    event = Event(client, method, endpoint)
+    _run_hooks(_before_hooks, event)
+    return event
+
+
+def after_call(event, status=None, size=None, error=None):
+    '''
+    Args:
+        event (Event): Returned by before_call
+        status (int): Status code of the response
+        size (int): Bytes of the response body, if known
+        error (Exception): Raised instead of a response
+    '''
+    event.duration = time.perf_counter() - event.start
+    event.status = status
+    event.bytes = size
+    event.error = error
+    labels = event.labels()
+    if error is not None:
+        registry.inc("dipzy_request_errors_total", labels)
+    else:
+        registry.inc("dipzy_requests_total", labels + (("status", str(status)),))
+    registry.observe("dipzy_request_seconds", labels, event.duration)
+    if size is not None:
+        registry.inc("dipzy_response_bytes_total", labels, size)
+    _run_hooks(_after_hooks, event)
+
+
+def count(name, client, endpoint, value=1):
+    '''Increment counter dipzy_<name>_total of a client endpoint if enabled'''
+    if enabled:
+        registry.inc(f"dipzy_{name}_total", (("client", client), ("endpoint", endpoint)), value)
+
+
+@contextmanager
+def _timer(name, labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(f"dipzy_{name}_seconds", labels, time.perf_counter() - start)
+
+
+def timer(name, client, endpoint):
+    '''Context manager timing a block into histogram dipzy_<name>_seconds'''
+    if not enabled:
+        return _null_timer
+    return _timer(name, (("client", client), ("endpoint", endpoint)))
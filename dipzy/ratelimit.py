@@ -0,0 +1,189 @@
+import asyncio
+import collections
+import threading
+import time
+
+
+class RateLimitError(Exception):
+    '''Raised when a call cannot be made within the allowed waiting time'''
+
+
+class RateLimiter:
+    '''
+    Thread-safe sliding-window rate limiter. A call is allowed when it fits
+    under every (calls, period) limit, so e.g. per-minute and per-day quotas
+    can be enforced together.
+
+    Args:
+        limits (Iterable[tuple]): Pairs of (max calls, period in seconds)
+    '''
+
+    def __init__(self, limits):
+        self.limits = [(int(calls), float(period)) for calls, period in limits]
+        self._history = [collections.deque() for _ in self.limits]
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    @classmethod
+    def from_quota(cls, calls_per_minute=None, calls_per_day=None, calls_per_second=None):
+        limits = []
+        if calls_per_second is not None:
+            limits.append((calls_per_second, 1))
+        if calls_per_minute is not None:
+            limits.append((calls_per_minute, 60))
+        if calls_per_day is not None:
+            limits.append((calls_per_day, 86400))
+        return cls(limits)
+
+    def _wait_time(self, now) -> float:
+        wait = max(0.0, self._paused_until - now)
+        for (calls, period), history in zip(self.limits, self._history):
+            while history and history[0] <= now - period:
+                history.popleft()
+            if len(history) >= calls:
+                wait = max(wait, history[len(history) - calls] + period - now)
+        return wait
+
+    def _reserve(self) -> float:
+        # Record a call if allowed, otherwise return seconds to wait
+        with self._lock:
+            now = time.monotonic()
+            wait = self._wait_time(now)
+            if wait <= 0:
+                for history in self._history:
+                    history.append(now)
+            return wait
+
+    def acquire(self, timeout=None) -> bool:
+        '''
+        Block until a call is allowed and record it.
+
+        Args:
+            timeout (float): Maximum seconds to wait. Returns False without
+                waiting if the next free slot is further away than this.
+
+        Returns:
+            bool: True if the call was recorded
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout=None) -> bool:
+        '''Asyncio counterpart of acquire'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        '''Hold back all callers for the given number of seconds'''
+        with self._lock:
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + seconds
+            )
+
+
+class RateGovernor:
+    '''
+    Thread-safe tracker of rate-limit budgets reported by an API, per key
+    (e.g. endpoint). Calls to a key are held back only once its budget for
+    the current window is used up, counting calls still in flight, and are
+    released when the window resets. Other keys are unaffected.
+
+    Args:
+        pace (bool): Spread the remaining budget evenly over the rest of
+            the window instead of sending calls as fast as possible
+        margin (float): Seconds added to reset times for clock skew
+    '''
+
+    def __init__(self, pace=False, margin=1.0):
+        self.pace = pace
+        self.margin = margin
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    def _reserve(self, key) -> float:
+        # Record a call if allowed, otherwise return seconds to wait
+        with self._lock:
+            now = time.time()
+            budget = self._budgets.setdefault(key, {
+                "limit": None, "remaining": None, "reset": None,
+                "in_flight": 0, "last": 0.0,
+            })
+            if budget["reset"] is not None and now >= budget["reset"] + self.margin:
+                # New window, its reset time is known after the next reply
+                budget["remaining"] = budget["limit"]
+                budget["reset"] = None
+
+            if budget["remaining"] is not None:
+                available = budget["remaining"] - budget["in_flight"]
+                if available <= 0:
+                    if budget["reset"] is None:
+                        # Waiting on replies of calls in flight
+                        return 0.05
+                    return budget["reset"] + self.margin - now
+                if self.pace and budget["reset"] is not None:
+                    interval = (budget["reset"] - now) / available
+                    wait = budget["last"] + interval - now
+                    if wait > 0:
+                        return wait
+
+            budget["in_flight"] += 1
+            budget["last"] = now
+            return 0.0
+
+    def acquire(self, key):
+        '''Block until a call to key fits in its budget and record it'''
+        while True:
+            wait = self._reserve(key)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, key):
+        '''Asyncio counterpart of acquire'''
+        while True:
+            wait = self._reserve(key)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, key, limit=None, remaining=None, reset=None):
+        '''
+        Record the reply of a call to key with the budget it reported.
+
+        Args:
+            limit (int): Calls allowed per window
+            remaining (int): Calls left in the current window
+            reset (float): Epoch seconds when the window resets
+        '''
+        with self._lock:
+            budget = self._budgets[key]
+            budget["in_flight"] = max(budget["in_flight"] - 1, 0)
+            if remaining is None or reset is None:
+                return
+            if limit is not None:
+                budget["limit"] = limit
+            # Replies of one window can arrive out of order
+            if budget["reset"] == reset and budget["remaining"] is not None:
+                remaining = min(remaining, budget["remaining"])
+            budget["remaining"] = remaining
+            budget["reset"] = reset
+
+    def budgets(self) -> dict:
+        '''Snapshot of limit, remaining, reset and in_flight per key'''
+        with self._lock:
+            return {
+                key: {name: value for name, value in budget.items() if name != "last"}
+                for key, budget in self._budgets.items()
+            }
@@ -0,0 +1,106 @@
+import os
+import re
+import tempfile
+
+import numpy as np
+
+
+# Columns of AlphaVantage TIME_SERIES_DAILY_ADJUSTED, in response order
+OHLCV_DTYPE = np.dtype([
+    ("date", "datetime64[D]"),
+    ("open", "float64"),
+    ("high", "float64"),
+    ("low", "float64"),
+    ("close", "float64"),
+    ("adjusted close", "float64"),
+    ("volume", "int64"),
+    ("dividend amount", "float64"),
+    ("split coefficient", "float64"),
+])
+
+
+class OHLCVStore:
+    '''
+    Local store of daily OHLCV histories. Each symbol is kept as a NumPy
+    structured array sorted by date in its own .npy file and read back
+    memory-mapped, so only the pages that are used are loaded.
+
+    Args:
+        directory (str): Directory of the store
+        rtol (float): Relative tolerance when comparing adjusted close prices
+            of overlapping rows
+    '''
+
+    def __init__(self, directory, rtol=1e-6):
+        self.directory = os.path.expanduser(directory)
+        self.rtol = rtol
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, symbol) -> str:
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", symbol.upper())
+        return os.path.join(self.directory, f"{name}.npy")
+
+    def __contains__(self, symbol):
+        return os.path.exists(self._path(symbol))
+
+    def load(self, symbol) -> np.ndarray | None:
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def write(self, symbol, data: np.ndarray):
+        '''Replace the history of a symbol'''
+        data = np.sort(np.asarray(data, dtype=OHLCV_DTYPE), order="date")
+        # Write to a temporary file first so readers never see partial data
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".npy")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp, self._path(symbol))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def append(self, symbol, tail: np.ndarray) -> bool:
+        '''
+        Append the rows of tail that are newer than the stored history.
+
+        Returns:
+            bool: False if tail cannot be appended and the full history has
+                to be refetched: nothing is stored, tail does not overlap
+                the stored history, or prices were adjusted for a split or
+                dividend.
+        '''
+        stored = self.load(symbol)
+        if stored is None or len(stored) == 0:
+            return False
+        if len(tail) == 0:
+            return True
+        tail = np.sort(np.asarray(tail, dtype=OHLCV_DTYPE), order="date")
+
+        last = stored["date"][-1]
+        if tail["date"][0] > last:
+            # Gap between stored history and tail
+            return False
+
+        # Adjusted prices of the overlap change after splits and dividends
+        stored_dates = stored["date"]
+        overlap = tail[tail["date"] <= last]
+        idx = np.searchsorted(stored_dates, overlap["date"])
+        idx = np.minimum(idx, len(stored) - 1)
+        if not np.array_equal(stored_dates[idx], overlap["date"]):
+            return False
+        if not np.allclose(
+            stored["adjusted close"][idx], overlap["adjusted close"],
+            rtol=self.rtol, atol=0
+        ):
+            return False
+
+        new = tail[tail["date"] > last]
+        if len(new) == 0:
+            return True
+        if np.any(new["split coefficient"] != 1) or np.any(new["dividend amount"] != 0):
+            return False
+        self.write(symbol, np.concatenate([stored, new]))
+        return True
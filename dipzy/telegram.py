@@ -1,34 +1,66 @@
+import asyncio
+import heapq
+import hmac
+import itertools
+import json
 import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import requests
 
+from .client import AsyncClient, Client, RequestError
+from .ratelimit import RateLimiter
+
 logger = logging.getLogger(__name__)
 
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
 
-class Bot:
+class Bot(Client):
     """ Basic telegram bot using web API"""
     
     domain = f"https://api.telegram.org"
+    # Whether command handlers may be coroutine functions
+    coroutine_handlers = False
     
-    def __init__(self, token):
+    def __init__(self, token, transport=None):
+        super().__init__(transport)
         self.token = token
         self.base_url = f"{self.domain}/bot{self.token}"
-        
-    def _request(
-        self, endpoint, method="GET", params=None, **kwargs
-    ):
-        query_url = self.base_url + endpoint 
-        r = requests.request(method, query_url, params=params, **kwargs)
-        if r.status_code != 200 and r.status_code != 201:
-            raise Exception(f"Request error: {r.status_code} {r.text}")
-        
-        return r 
+        self.queue = None
+        self._queue_lock = threading.Lock()
+        self.dispatcher = Dispatcher(self)
+        self.poller = None
+        self.webhook = None
 
     def get_me(self) -> requests.models.Response:
         r = self._request("/getMe")
         return r
     
-    def get_updates(self) -> requests.models.Response:
-        r = self._request("/getUpdates")
+    def get_updates(
+        self, offset=None, timeout=0, allowed_updates=None, limit=None
+    ) -> requests.models.Response:
+        """ Receive incoming updates
+
+        Args:
+            offset (int): ID of the first update to return. Updates with
+                smaller IDs are confirmed and not returned again.
+            timeout (int): Seconds to long poll for until an update arrives
+            allowed_updates (List[str]): Update types to receive, e.g.
+                ["message"]
+            limit (int): Maximum number of updates
+        """
+        params = _updates_params(offset, timeout, allowed_updates, limit)
+        # The read timeout has to outlast the long poll
+        r = self._request("/getUpdates", params=params, timeout=(5, timeout + 10))
         return r
 
     def send_message(self, chat_id, text, **kwargs):
@@ -43,6 +75,818 @@ class Bot:
         logger.info(f'Sent message to {chat_id}.')
         return r
 
+    def set_webhook(
+        self, url, secret_token=None, allowed_updates=None,
+        max_connections=None, drop_pending_updates=False
+    ) -> requests.models.Response:
+        """ Have Telegram push updates to url instead of getUpdates
+
+        Args:
+            url (str): HTTPS URL receiving updates
+            secret_token (str): Sent by Telegram in the
+                X-Telegram-Bot-Api-Secret-Token header of every update
+            allowed_updates (List[str]): Update types to receive
+            max_connections (int): Maximum concurrent connections to url
+            drop_pending_updates (bool): Drop updates not delivered yet
+        """
+        params = _webhook_params(
+            url, secret_token, allowed_updates, max_connections, drop_pending_updates
+        )
+        return self._request("/setWebhook", params=params)
+
+    def delete_webhook(self, drop_pending_updates=False) -> requests.models.Response:
+        params = {"drop_pending_updates": json.dumps(drop_pending_updates)}
+        return self._request("/deleteWebhook", params=params)
+
+    def _get_queue(self):
+        with self._queue_lock:
+            if self.queue is None:
+                self.queue = MessageQueue(self)
+            return self.queue
+
+    def queue_message(self, chat_id, text, **kwargs) -> Future:
+        """ Send a message in the background, see MessageQueue.submit"""
+        return self._get_queue().submit(chat_id, text, **kwargs)
+
+    def broadcast(self, chat_ids, text, **kwargs) -> dict:
+        """ Send a message to many chats in the background
+
+        Returns:
+            dict: Future of each chat ID
+        """
+        queue = self._get_queue()
+        return {
+            chat_id: queue.submit(chat_id, text, **kwargs)
+            for chat_id in chat_ids
+        }
+
+    def add_command_handler(self, command, handler):
+        """ Call handler(update, bot) on messages starting with /command"""
+        if asyncio.iscoroutinefunction(handler) and not self.coroutine_handlers:
+            raise TypeError(f"{type(self).__name__} cannot run coroutine handlers, use AsyncBot")
+        self.dispatcher.add_command_handler(command, handler)
+
+    def start_polling(
+        self, offset_path=None, timeout=30, allowed_updates=None
+    ):
+        """ Long poll for updates in a background thread, see Poller"""
+        if self.poller is None:
+            self.poller = Poller(
+                self, offset_path, timeout, allowed_updates
+            )
+        self.poller.start()
+        logger.info('Telegram bot started polling...')
+
+    def stop_polling(self):
+        if self.poller is not None:
+            self.poller.stop()
+            logger.info('Telegram bot stopped polling.')
+
+    def start_webhook(
+        self, url, host="0.0.0.0", port=8443, secret_token=None,
+        allowed_updates=None
+    ):
+        """ Receive updates on an embedded HTTP server, see WebhookServer.
+        Telegram does not serve getUpdates while a webhook is set."""
+        if self.webhook is None:
+            self.webhook = WebhookServer(
+                self, url, host, port, secret_token, allowed_updates
+            )
+        self.webhook.start()
+        logger.info(f'Telegram bot receiving updates on {url}...')
+
+    def stop_webhook(self):
+        if self.webhook is not None and self.webhook.running:
+            self.webhook.stop()
+            logger.info('Telegram bot stopped receiving updates.')
+
+    def close(self, wait=True):
+        """ Stop receiving updates and the message queue after delivering
+        pending messages"""
+        self.stop_polling()
+        self.stop_webhook()
+        self.dispatcher.shutdown(wait)
+        if self.queue is not None:
+            self.queue.close(wait)
+
+
+class Dispatcher:
+    """ Dispatches updates to command handlers on a worker pool
+
+    Command handlers take the update (dict) and the bot. Errors raised by
+    handlers are logged and do not affect other updates. Coroutine handlers
+    run on the event loop set as loop, e.g. by AsyncBot.start_polling.
+
+    Args:
+        bot (Bot): Bot passed to the handlers
+        max_workers (int): Number of concurrent handlers
+    """
+
+    def __init__(self, bot, max_workers=4):
+        self.bot = bot
+        self.max_workers = max_workers
+        self.handlers = {}
+        self.default_handler = None
+        self.loop = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def add_command_handler(self, command, handler):
+        self.handlers[command.lstrip("/").lower()] = handler
+
+    def set_default_handler(self, handler):
+        """ Handler of updates that are not commands"""
+        self.default_handler = handler
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def dispatch(self, update: dict) -> Future | None:
+        handler = self.handlers.get(_command(update), self.default_handler)
+        if handler is None:
+            return None
+        if asyncio.iscoroutinefunction(handler):
+            if self.loop is None:
+                raise RuntimeError(
+                    "Coroutine handlers need an event loop, set by "
+                    "AsyncBot.start_polling or AsyncBot.start_webhook"
+                )
+            return asyncio.run_coroutine_threadsafe(
+                self._handle_async(handler, update), self.loop
+            )
+        return self._get_executor().submit(self._handle, handler, update)
+
+    def _handle(self, handler, update):
+        try:
+            return handler(update, self.bot)
+        except Exception as e:
+            logger.warning(f'Update "{update}" caused error "{e}"')
+            raise
+
+    async def _handle_async(self, handler, update):
+        try:
+            return await handler(update, self.bot)
+        except Exception as e:
+            logger.warning(f'Update "{update}" caused error "{e}"')
+            raise
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+class Poller:
+    """ Long-polling loop of getUpdates
+
+    Confirms updates by tracking the offset, which is persisted so a
+    restarted bot does not process updates twice.
+
+    Args:
+        bot (Bot): Bot to poll, whose dispatcher handles the updates
+        offset_path (str): File of the persisted offset. Not persisted if
+            None.
+        timeout (int): Seconds of each long poll
+        allowed_updates (List[str]): Update types to receive
+        max_backoff (float): Maximum seconds to back off after errors
+    """
+
+    def __init__(
+        self, bot, offset_path=None, timeout=30, allowed_updates=None,
+        max_backoff=60
+    ):
+        self.bot = bot
+        self.offset_path = offset_path
+        self.timeout = timeout
+        self.allowed_updates = allowed_updates
+        self.max_backoff = max_backoff
+        self.offset = self._load_offset()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_offset(self):
+        if self.offset_path is None or not os.path.exists(self.offset_path):
+            return None
+        with open(self.offset_path) as f:
+            return int(f.read().strip() or 0) or None
+
+    def _save_offset(self):
+        if self.offset_path is None:
+            return
+        directory = os.path.dirname(self.offset_path) or "."
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            f.write(str(self.offset))
+        os.replace(tmp, self.offset_path)
+
+    def poll(self) -> list:
+        """ Fetch and dispatch one batch of updates"""
+        r = self.bot.get_updates(
+            offset=self.offset,
+            timeout=self.timeout,
+            allowed_updates=self.allowed_updates
+        )
+        return self._dispatch(r.json()["result"])
+
+    def _dispatch(self, updates) -> list:
+        if updates:
+            self.offset = updates[-1]["update_id"] + 1
+            self._save_offset()
+            for update in updates:
+                # The offset is confirmed, so a failed update must not drop the rest
+                try:
+                    self.bot.dispatcher.dispatch(update)
+                except Exception as e:
+                    logger.warning(f'Update "{update}" could not be dispatched: "{e}"')
+        return updates
+
+    def run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                self.poll()
+                backoff = 1
+            except Exception as e:
+                logger.warning(f"Polling failed: {e}. Retrying in {backoff}s.")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def start(self):
+        self._stop.clear()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=False):
+        """ Stop after the current long poll returns"""
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+
+class AsyncPoller(Poller):
+    """ Asyncio counterpart of Poller, long polling in a task of the running
+    event loop"""
+    _task = None
+
+    async def poll(self) -> list:
+        r = await self.bot.get_updates(
+            offset=self.offset,
+            timeout=self.timeout,
+            allowed_updates=self.allowed_updates
+        )
+        return self._dispatch(r.json()["result"])
+
+    async def run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                await self.poll()
+                backoff = 1
+            except Exception as e:
+                logger.warning(f"Polling failed: {e}. Retrying in {backoff}s.")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def start(self):
+        self._stop.clear()
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.ensure_future(self.run())
+
+    def stop(self, wait=False):
+        """ Stop at once, cancelling the current long poll. Updates it
+        received without dispatching are fetched again."""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+
+class WebhookServer:
+    """ Embedded HTTP server receiving the updates Telegram pushes
+
+    Checks the secret token header of each POST, hands the update to the
+    bot's dispatcher and acknowledges it at once, so slow handlers do not
+    hold up delivery. start() registers the webhook with setWebhook and
+    stop() removes it with deleteWebhook.
+
+    Args:
+        bot (Bot): Bot whose dispatcher handles the updates
+        url (str): Public HTTPS URL Telegram posts to, e.g. a reverse proxy
+            forwarding to host:port. Updates are accepted on its path.
+        host (str): Interface to listen on
+        port (int): Port to listen on. 0 picks a free port.
+        secret_token (str): Secret expected in the
+            X-Telegram-Bot-Api-Secret-Token header. Generated if None.
+        allowed_updates (List[str]): Update types to receive
+        max_connections (int): Maximum concurrent connections of Telegram
+        max_body (int): Largest accepted update in bytes
+        timeout (float): Seconds a connection may stall before it is dropped
+    """
+
+    def __init__(
+        self, bot, url, host="0.0.0.0", port=8443, secret_token=None,
+        allowed_updates=None, max_connections=40, max_body=2**20, timeout=10
+    ):
+        self.bot = bot
+        self.url = url
+        self.path = urllib.parse.urlsplit(url).path or "/"
+        self.host = host
+        self.port = port
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.allowed_updates = allowed_updates
+        self.max_connections = max_connections
+        self.max_body = max_body
+        self.timeout = timeout
+        self._server = None
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._server is not None
+
+    @property
+    def address(self) -> tuple:
+        """ (host, port) the server listens on"""
+        return self._server.server_address[:2]
+
+    def authorize(self, path, headers) -> int | None:
+        """ Status code rejecting a request before its body is read, None if
+        it comes from Telegram"""
+        if path != self.path:
+            return 404
+        secret = headers.get(SECRET_TOKEN_HEADER) or ""
+        if not hmac.compare_digest(secret.encode(), self.secret_token.encode()):
+            logger.warning("Rejected webhook request without the secret token")
+            return 403
+        return None
+
+    def handle(self, body: bytes) -> int:
+        """ Dispatch a posted update. Returns the status code."""
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return 400
+        if not isinstance(update, dict):
+            return 400
+        try:
+            self.bot.dispatcher.dispatch(update)
+        except Exception as e:
+            logger.warning(f'Update "{update}" could not be dispatched: "{e}"')
+            return 500
+        return 200
+
+    def start(self, register=True):
+        """ Serve updates, registering the webhook unless register is False"""
+        # Listen before registering so no update is refused
+        if self._server is None:
+            self._server = ThreadingHTTPServer((self.host, self.port), _WebhookHandler)
+            self._server.daemon_threads = True
+            self._server.webhook = self
+            self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            self._thread.start()
+        if register:
+            self.bot.set_webhook(
+                self.url, self.secret_token, self.allowed_updates, self.max_connections
+            )
+
+    def stop(self, delete=True):
+        """ Stop the server, removing the webhook unless delete is False"""
+        if delete:
+            self.bot.delete_webhook()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Telegram keeps connections alive
+    disable_nagle_algorithm = True
+    timeout = 10
+
+    def setup(self):
+        # Socket timeout, so stalled clients do not hold a thread forever
+        self.timeout = self.server.webhook.timeout
+        super().setup()
+
+    def do_POST(self):
+        webhook = self.server.webhook
+        status = webhook.authorize(self.path, self.headers)
+        if status is None:
+            length = _content_length(self.headers)
+            if length is None:
+                status = 400
+            elif length > webhook.max_body:
+                status = 413
+            else:
+                try:
+                    body = self.rfile.read(length)
+                except TimeoutError:
+                    self.close_connection = True
+                    return
+                status = webhook.handle(body) if len(body) == length else 400
+        if status != 200:
+            self.close_connection = True
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def _content_length(headers) -> int | None:
+    """ Content-Length of a request, None if missing or invalid"""
+    try:
+        length = int(headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return None
+    return length if length >= 0 else None
+
+
+def _command(update: dict) -> str | None:
+    """ Command of a message update, e.g. "start" for "/start@bot args" """
+    message = update.get("message") or update.get("channel_post")
+    if not isinstance(message, dict):
+        return None
+    text = message.get("text")
+    if not isinstance(text, str) or not text.startswith("/"):
+        return None
+    return text.split()[0][1:].split("@")[0].lower()
+
+
+def _webhook_params(
+    url, secret_token, allowed_updates, max_connections, drop_pending_updates
+) -> dict:
+    params = {"url": url}
+    if secret_token is not None:
+        params["secret_token"] = secret_token
+    if allowed_updates is not None:
+        params["allowed_updates"] = json.dumps(allowed_updates)
+    if max_connections is not None:
+        params["max_connections"] = max_connections
+    if drop_pending_updates:
+        params["drop_pending_updates"] = "true"
+    return params
+
+
+def _updates_params(offset, timeout, allowed_updates, limit) -> dict:
+    params = {"timeout": timeout}
+    if offset is not None:
+        params["offset"] = offset
+    if allowed_updates is not None:
+        params["allowed_updates"] = json.dumps(allowed_updates)
+    if limit is not None:
+        params["limit"] = limit
+    return params
+
+
+class MessageQueue:
+    """ Background queue of outbound messages of a Bot
+
+    Messages are delivered by a worker pool while a dispatcher thread enforces
+    Telegram's global limit and the limit per chat. Messages to the same chat
+    are sent in order, and a chat waiting on its limit or on retry_after of a
+    429 reply does not hold up other chats. Failures are isolated per message
+    and reported through its future.
+
+    Args:
+        bot (Bot): Bot sending the messages
+        max_workers (int): Number of concurrent requests
+        messages_per_second (float): Global limit of the bot
+        chat_interval (float): Seconds between messages to a private chat
+        group_interval (float): Seconds between messages to a group or
+            channel (negative chat IDs)
+        max_retries (int): Retries of a message after 429 replies
+    """
+
+    def __init__(
+        self,
+        bot,
+        max_workers=8,
+        messages_per_second=30,
+        chat_interval=1,
+        group_interval=3,
+        max_retries=3,
+    ):
+        self.bot = bot
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+        self.limiter = RateLimiter([(messages_per_second, 1)])
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = {} # chat ID -> deque of (future, text, kwargs, retries)
+        self._next_time = {} # chat ID -> earliest time of next message
+        self._busy = set() # chats with a message in flight
+        self._ready = [] # heap of (time, seq, chat ID) of chats with messages
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, chat_id, text, **kwargs) -> Future:
+        """ Queue a message. Returns a future of the sendMessage response."""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Message queue is closed")
+            messages = self._pending.setdefault(chat_id, deque())
+            messages.append((future, text, kwargs, 0))
+            if len(messages) == 1 and chat_id not in self._busy:
+                self._schedule(chat_id)
+            self._cond.notify()
+        return future
+
+    def _schedule(self, chat_id):
+        ready = self._next_time.get(chat_id, 0.0)
+        heapq.heappush(self._ready, (ready, next(self._seq), chat_id))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not self._pending and not self._busy:
+                        return
+                    now = time.monotonic()
+                    if self._ready and self._ready[0][0] <= now:
+                        _, _, chat_id = heapq.heappop(self._ready)
+                        self._busy.add(chat_id)
+                        break
+                    timeout = self._ready[0][0] - now if self._ready else None
+                    self._cond.wait(timeout)
+            self.limiter.acquire()
+            self._executor.submit(self._deliver, chat_id)
+
+    def _deliver(self, chat_id):
+        with self._cond:
+            future, text, kwargs, retries = self._pending[chat_id].popleft()
+        interval = self.group_interval if _is_group(chat_id) else self.chat_interval
+        next_time = time.monotonic() + interval
+        try:
+            r = self.bot.send_message(chat_id, text, **kwargs)
+        except RequestError as e:
+            retry_after = _retry_after(e)
+            if retry_after is not None and retries < self.max_retries:
+                logger.info(f"Rate limited on chat {chat_id}, retrying after {retry_after}s.")
+                next_time = time.monotonic() + retry_after
+                with self._cond:
+                    self._pending[chat_id].appendleft((future, text, kwargs, retries + 1))
+            else:
+                future.set_exception(e)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(r)
+
+        with self._cond:
+            self._busy.discard(chat_id)
+            self._next_time[chat_id] = next_time
+            if self._pending[chat_id]:
+                self._schedule(chat_id)
+            else:
+                del self._pending[chat_id]
+            self._cond.notify()
+
+    def close(self, wait=True):
+        """ Stop accepting messages, optionally waiting for pending ones"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if wait:
+            self._thread.join()
+            self._executor.shutdown(wait=True)
+
+
+class AsyncMessageQueue:
+    """ Asyncio counterpart of MessageQueue
+
+    A task per chat with pending messages sends them in order, within the
+    global limit and the limit per chat, and retries 429 replies after their
+    retry_after. Submit messages from the event loop of the queue.
+
+    Args:
+        bot (AsyncBot): Bot sending the messages
+        messages_per_second (float): Global limit of the bot
+        chat_interval (float): Seconds between messages to a private chat
+        group_interval (float): Seconds between messages to a group or
+            channel (negative chat IDs)
+        max_retries (int): Retries of a message after 429 replies
+    """
+
+    def __init__(
+        self,
+        bot,
+        messages_per_second=30,
+        chat_interval=1,
+        group_interval=3,
+        max_retries=3,
+    ):
+        self.bot = bot
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+        self.limiter = RateLimiter([(messages_per_second, 1)])
+        self._pending = {} # chat ID -> deque of (future, text, kwargs)
+        self._next_time = {} # chat ID -> earliest time of next message
+        self._tasks = set()
+        self._closed = False
+
+    def submit(self, chat_id, text, **kwargs) -> asyncio.Future:
+        """ Queue a message. Returns a future of the sendMessage response."""
+        if self._closed:
+            raise RuntimeError("Message queue is closed")
+        future = asyncio.get_running_loop().create_future()
+        messages = self._pending.get(chat_id)
+        if messages is None:
+            messages = self._pending[chat_id] = deque()
+            task = asyncio.ensure_future(self._deliver(chat_id, messages))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        messages.append((future, text, kwargs))
+        return future
+
+    async def _deliver(self, chat_id, messages):
+        interval = self.group_interval if _is_group(chat_id) else self.chat_interval
+        try:
+            while messages:
+                future, text, kwargs = messages[0]
+                for retries in range(self.max_retries + 1):
+                    delay = self._next_time.get(chat_id, 0.0) - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    await self.limiter.acquire_async()
+                    self._next_time[chat_id] = time.monotonic() + interval
+                    try:
+                        r = await self.bot.send_message(chat_id, text, **kwargs)
+                    except RequestError as e:
+                        retry_after = _retry_after(e)
+                        if retry_after is not None and retries < self.max_retries:
+                            logger.info(f"Rate limited on chat {chat_id}, retrying after {retry_after}s.")
+                            self._next_time[chat_id] = time.monotonic() + retry_after
+                            continue
+                        _resolve(future, error=e)
+                    except Exception as e:
+                        _resolve(future, error=e)
+                    else:
+                        _resolve(future, r)
+                    break
+                messages.popleft()
+        finally:
+            del self._pending[chat_id]
+            for future, _, _ in messages:
+                future.cancel()
+
+    async def close(self, wait=True):
+        """ Stop accepting messages, waiting for pending ones or cancelling
+        them"""
+        self._closed = True
+        tasks = list(self._tasks)
+        if not wait:
+            for task in tasks:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _resolve(future, result=None, error=None):
+    # The caller may have cancelled the future
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def _is_group(chat_id) -> bool:
+    """ Groups and channels have negative IDs or @usernames"""
+    if isinstance(chat_id, str):
+        return chat_id.startswith("@") or chat_id.startswith("-")
+    return chat_id < 0
+
+
+def _retry_after(error: RequestError):
+    """ retry_after of a 429 reply, None for other errors"""
+    if error.status_code != 429:
+        return None
+    try:
+        return error.response.json()["parameters"]["retry_after"]
+    except (ValueError, KeyError, TypeError):
+        return 1
+
+
+class AsyncBot(AsyncClient, Bot):
+    """ Asyncio counterpart of Bot with the same methods as coroutines"""
+    coroutine_handlers = True
+
+    async def get_me(self):
+        return await self._request("/getMe")
+
+    async def get_updates(
+        self, offset=None, timeout=0, allowed_updates=None, limit=None
+    ):
+        params = _updates_params(offset, timeout, allowed_updates, limit)
+        return await self._request(
+            "/getUpdates", params=params, timeout=(5, timeout + 10)
+        )
+
+    async def send_message(self, chat_id, text, **kwargs):
+        params = {
+            "chat_id": chat_id,
+            "text": text
+        }
+        if kwargs:
+            params.update(kwargs)
+
+        r = await self._request("/sendMessage", params=params)
+        logger.info(f'Sent message to {chat_id}.')
+        return r
+
+    async def broadcast(self, chat_ids, text, **kwargs) -> dict:
+        """ Send a message to many chats concurrently
+
+        Returns:
+            dict: Response, or the raised exception, of each chat ID
+        """
+        chat_ids = list(chat_ids)
+        results = await asyncio.gather(
+            *(self.send_message(chat_id, text, **kwargs) for chat_id in chat_ids),
+            return_exceptions=True
+        )
+        return dict(zip(chat_ids, results))
+
+    def start_polling(
+        self, offset_path=None, timeout=30, allowed_updates=None
+    ):
+        """ Long poll for updates in a task of the running event loop, see
+        AsyncPoller. Handlers may be coroutine functions."""
+        self.dispatcher.loop = asyncio.get_running_loop()
+        if self.poller is None:
+            self.poller = AsyncPoller(
+                self, offset_path, timeout, allowed_updates
+            )
+        self.poller.start()
+        logger.info('Telegram bot started polling...')
+
+    async def close(self, wait=True):
+        """ Stop receiving updates, the dispatcher and the message queue
+        after delivering pending messages, then close the transport"""
+        self.stop_polling()
+        await self.stop_webhook()
+        await asyncio.to_thread(self.dispatcher.shutdown, wait)
+        if self.queue is not None:
+            await self.queue.close(wait)
+        await super().close()
+
+    async def set_webhook(
+        self, url, secret_token=None, allowed_updates=None,
+        max_connections=None, drop_pending_updates=False
+    ):
+        params = _webhook_params(
+            url, secret_token, allowed_updates, max_connections, drop_pending_updates
+        )
+        return await self._request("/setWebhook", params=params)
+
+    async def delete_webhook(self, drop_pending_updates=False):
+        params = {"drop_pending_updates": json.dumps(drop_pending_updates)}
+        return await self._request("/deleteWebhook", params=params)
+
+    def _get_queue(self):
+        if self.queue is None:
+            self.queue = AsyncMessageQueue(self)
+        return self.queue
+
+    async def start_webhook(
+        self, url, host="0.0.0.0", port=8443, secret_token=None,
+        allowed_updates=None
+    ):
+        """ Receive updates on an embedded HTTP server, see WebhookServer.
+        Handlers may be coroutine functions."""
+        self.dispatcher.loop = asyncio.get_running_loop()
+        if self.webhook is None:
+            self.webhook = WebhookServer(
+                self, url, host, port, secret_token, allowed_updates
+            )
+        webhook = self.webhook
+        webhook.start(register=False)
+        await self.set_webhook(
+            url, webhook.secret_token, allowed_updates, webhook.max_connections
+        )
+        logger.info(f'Telegram bot receiving updates on {url}...')
+
+    async def stop_webhook(self):
+        if self.webhook is not None and self.webhook.running:
+            await self.delete_webhook()
+            await asyncio.to_thread(self.webhook.stop, delete=False)
+            logger.info('Telegram bot stopped receiving updates.')
+
 
 # Deprecated code using python-telegram-bot package v13.x
 # class TelegramBot:
@@ -0,0 +1,256 @@
+import asyncio
+import contextlib
+import json
+import threading
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class Transport:
+    '''
+    Shared HTTP transport with keep-alive connection pools per host. All
+    dipzy clients send their requests through a transport so TCP and TLS
+    connections are reused across calls.
+
+    Args:
+        pool_connections (int): Number of host pools to keep
+        pool_maxsize (int): Maximum connections kept alive per host
+        timeout (float | tuple): Default (connect, read) timeout in seconds
+        retries (int): Retries on connection errors and retryable statuses
+        backoff_factor (float): Exponential backoff factor between retries
+        status_forcelist (Iterable[int]): Status codes that are retried
+        allowed_methods (Iterable[str]): Methods retried after the request
+            was sent. Defaults to the idempotent methods.
+    '''
+
+    def __init__(
+        self,
+        pool_connections=10,
+        pool_maxsize=10,
+        timeout=(5, 30),
+        retries=3,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+    ):
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_forcelist,
+            allowed_methods=allowed_methods,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=self.retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class Response:
+    '''
+    Buffered response of AsyncTransport, with the parts of the
+    requests.Response interface used by the clients.
+    '''
+
+    def __init__(self, status_code, headers, content, url, encoding=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+        self.encoding = encoding or "utf-8"
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncTransport:
+    '''
+    Asyncio HTTP transport backed by an aiohttp session. Connections are kept
+    alive and the number of concurrent connections per host is bounded, so
+    many calls can be in flight without a thread per call. Requires aiohttp.
+
+    Args:
+        limit (int): Maximum concurrent connections
+        limit_per_host (int): Maximum concurrent connections per host
+        timeout (float | tuple): Default (connect, read) timeout in seconds
+        retries (int): Retries on connection errors and retryable statuses
+        backoff_factor (float): Exponential backoff factor between retries
+        status_forcelist (Iterable[int]): Status codes that are retried
+        allowed_methods (Iterable[str]): Methods retried after the request
+            was sent. Defaults to the idempotent methods, as for Transport.
+    '''
+
+    def __init__(
+        self,
+        limit=100,
+        limit_per_host=10,
+        timeout=(5, 30),
+        retries=3,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+    ):
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError(
+                "AsyncTransport requires aiohttp: pip install dipzy[async]"
+            ) from e
+        self._aiohttp = aiohttp
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.status_forcelist = set(status_forcelist)
+        self.allowed_methods = {method.upper() for method in allowed_methods}
+        self._session = None
+        self._loop = None
+        self._guard = None
+
+    def _client_timeout(self, timeout):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self._aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        return self._aiohttp.ClientTimeout(total=timeout)
+
+    async def _get_session(self):
+        # Sessions are bound to the event loop they were created in
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._release_session()
+            connector = self._aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host
+            )
+            self._session = self._aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+            # Closed by the loop's shutdown_asyncgens, e.g. when asyncio.run
+            # returns, while the loop can still close its connections
+            self._guard = _close_on_shutdown(self._session)
+            await self._guard.__anext__()
+        return self._session
+
+    def _release_session(self):
+        '''Close or detach the session of another event loop'''
+        session, loop = self._session, self._loop
+        self._session = self._guard = None
+        if session is None or session.closed:
+            return
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            # Its loop can no longer close the connections
+            session.detach()
+
+    @staticmethod
+    def _encode_params(params):
+        # Same conventions as requests: None dropped, lists repeated
+        if params is None:
+            return None
+        query = []
+        for key, value in params.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            query.extend((key, str(v)) for v in values if v is not None)
+        return urllib.parse.urlencode(query)
+
+    async def request(self, method, url, params=None, timeout=None, **kwargs) -> Response:
+        session = await self._get_session()
+        timeout = self._client_timeout(self.timeout if timeout is None else timeout)
+        if params:
+            url = f"{url}?{self._encode_params(params)}"
+        # Like urllib3, only failed connections are retried for any method
+        retries = self.retries if method.upper() in self.allowed_methods else 0
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.request(method, url, timeout=timeout, **kwargs) as r:
+                    content = await r.read()
+                    if r.status not in self.status_forcelist or attempt >= retries:
+                        return Response(
+                            r.status, r.headers, content, str(r.url), r.charset
+                        )
+            except self._aiohttp.ClientConnectorError:
+                if attempt == self.retries:
+                    raise
+            except self._aiohttp.ClientConnectionError:
+                if attempt >= retries:
+                    raise
+            await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method, url, params=None, timeout=None, **kwargs):
+        '''Open a streaming request, yielding the unread aiohttp response'''
+        session = await self._get_session()
+        timeout = self._client_timeout(self.timeout if timeout is None else timeout)
+        if params:
+            url = f"{url}?{self._encode_params(params)}"
+        async with session.request(method, url, timeout=timeout, **kwargs) as r:
+            yield r
+
+    async def close(self):
+        if self._session is not None and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+            self._session = self._guard = None
+        else:
+            self._release_session()
+
+
+async def _close_on_shutdown(session):
+    try:
+        yield
+    finally:
+        await session.close()
+
+
+_default_transport = None
+_default_async_transport = None
+_default_lock = threading.Lock()
+
+
+def get_default_transport() -> Transport:
+    '''Process-wide transport used by clients created without one'''
+    global _default_transport
+    with _default_lock:
+        if _default_transport is None:
+            _default_transport = Transport()
+        return _default_transport
+
+
+def set_default_transport(transport: Transport):
+    global _default_transport
+    with _default_lock:
+        _default_transport = transport
+
+
+def get_default_async_transport() -> AsyncTransport:
+    '''Process-wide async transport used by async clients created without one'''
+    global _default_async_transport
+    with _default_lock:
+        if _default_async_transport is None:
+            _default_async_transport = AsyncTransport()
+        return _default_async_transport
+
+
+def set_default_async_transport(transport: AsyncTransport):
+    global _default_async_transport
+    with _default_lock:
+        _default_async_transport = transport
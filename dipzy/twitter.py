@@ -1,26 +1,70 @@
-import requests
+import asyncio
 import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from . import metrics
+from .client import _ID_SEGMENT, AsyncClient, Client, RequestError
+from .ratelimit import RateGovernor
 
-class Twitter:
-    '''Twitter v2 API'''
+
+logger = logging.getLogger(__name__)
+
+MAX_USERS = 100 # users per lookup request
+
+
+class Twitter(Client):
+    '''
+    Twitter v2 API. The rate-limit budget of each endpoint is tracked from
+    the x-rate-limit headers, so calls to an exhausted endpoint wait for its
+    window to reset instead of failing with 429, while other endpoints
+    proceed.
+
+    Args:
+        bearer_token (str): App bearer token
+        transport (Transport): HTTP transport shared with other clients
+        pace (bool): Spread the remaining budget of an endpoint evenly over
+            its window
+        max_retries (int): Retries of calls answered with 429
+    '''
     base_url = "https://api.twitter.com/2"
 
-    def __init__(self, bearer_token):
+    def __init__(self, bearer_token, transport=None, pace=False, max_retries=3):
+        super().__init__(transport)
         self.bearer_token = bearer_token
         self.headers = {
             "Authorization": f"Bearer {bearer_token}"
         }
+        self.governor = RateGovernor(pace=pace)
+        self.max_retries = max_retries
+
+    @property
+    def rate_limits(self) -> dict:
+        '''Budget per endpoint: limit, remaining, reset and in_flight'''
+        return self.governor.budgets()
 
     def _request(self, endpoint, method="GET", params=None, **kwargs):
-        url = self.base_url + endpoint 
-        r = requests.request(
-            method, url, headers=self.headers, params=params, **kwargs
-        )
-        if r.status_code != 200 and r.status_code != 201:
-            raise Exception(f"Request error: {r.status_code} {r.text}")
-        
-        return r
+        key = _rate_key(method, endpoint)
+        for attempt in range(self.max_retries + 1):
+            self.governor.acquire(key)
+            r = None
+            try:
+                r = super()._request(endpoint, method, params, **kwargs)
+                return r
+            except RequestError as e:
+                r = e.response
+                if e.status_code != 429 or attempt == self.max_retries:
+                    raise
+                logger.warning(f"Rate limited on {key}, waiting for reset.")
+                metrics.count(
+                    "retries", type(self).__name__,
+                    self._endpoint_label(endpoint, kwargs)
+                )
+            finally:
+                self.governor.release(key, *_rate_limit(r))
 
     # Users endpoints #
 
@@ -29,26 +73,39 @@ class Twitter:
         Args:
             user_ids:  User IDs
             usernames: Specify the usernames that you want to lookup below.
-                You can enter up to 100 comma-separated values.
+                Lists or comma-separated values. Lookups are split into
+                requests of 100 values.
             user_fields: User fields are adjustable, options include:
                 created_at, description, entities, id, location, name,
                 pinned_tweet_id, profile_image_url, protected,
                 public_metrics, url, username, verified, and withheld
         '''
-        params = {"user.fields": user_fields}
+        queries = self._users_queries(user_ids, usernames, user_fields)
+        users = []
+        for endpoint, params in queries:
+            r = self._request(endpoint, params=params)
+            users.extend(r.json().get("data", []))
+        return users
+
+    @staticmethod
+    def _users_queries(user_ids, usernames, user_fields) -> list:
         if usernames is None:
             print("Assuming that user IDs are provided.")
-            params["ids"] = user_ids,
-            endpoint = "/users"
+            values, key, endpoint = user_ids, "ids", "/users"
         else:
-            params["usernames"] = usernames
-            endpoint = "/users/by"
-
-        r = self._request(endpoint, params=params)
-        return r.json()["data"]
+            values, key, endpoint = usernames, "usernames", "/users/by"
+        if isinstance(values, str):
+            values = values.split(",")
+        values = [str(value).strip() for value in values]
+        return [
+            (endpoint, {key: ",".join(values[i:i + MAX_USERS]), "user.fields": user_fields})
+            for i in range(0, len(values), MAX_USERS)
+        ]
 
     def get_user_tweets(self, user_id, tweet_fields="created_at", **kwargs):
         '''
+        First page of tweets of a user. See iter_user_tweets for all pages.
+
         Args:
             tweet_fields: Tweet fields are adjustable. Options include:
                 attachments, author_id, context_annotations,
@@ -57,26 +114,111 @@ class Twitter:
                 possibly_sensitive, promoted_metrics, public_metrics, referenced_tweets,
                 source, text, and withheld
         '''
-        endpoint = "/users/{user_id}/tweets"
+        endpoint = f"/users/{user_id}/tweets"
         params = {"tweet.fields": tweet_fields}
         params.update(kwargs)
         r = self._request(endpoint, params=params)
         return r.json() 
 
+    def iter_user_tweets(self, user_id, tweet_fields="created_at", max_pages=None, **kwargs):
+        '''Lazily yield tweets of a user, fetching pages as they are consumed'''
+        endpoint = f"/users/{user_id}/tweets"
+        params = {"tweet.fields": tweet_fields, "max_results": 100}
+        params.update(kwargs)
+        for page in self._paginate(endpoint, params, max_pages):
+            yield from page.get("data", [])
+
+    def iter_users_tweets(
+        self, user_ids, tweet_fields="created_at", max_pages=None,
+        max_workers=4, **kwargs
+    ):
+        '''
+        Yield (user_id, tweet) of many users. Timelines are paginated
+        concurrently by a worker pool and pages are buffered in a bounded
+        queue, so results stream in without loading all timelines.
+        '''
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        pages = queue.Queue(maxsize=2 * max_workers)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def fetch(user_id):
+            try:
+                for page in self._paginate(
+                    f"/users/{user_id}/tweets",
+                    {"tweet.fields": tweet_fields, "max_results": 100, **kwargs},
+                    max_pages
+                ):
+                    if stop.is_set():
+                        return
+                    put((user_id, page.get("data", []), None))
+            except Exception as e:
+                put((user_id, None, e))
+            put((user_id, None, None))
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        for user_id in user_ids:
+            executor.submit(fetch, user_id)
+        finished = 0
+        try:
+            while finished < len(user_ids):
+                user_id, tweets, error = pages.get()
+                if error is not None:
+                    raise error
+                if tweets is None:
+                    finished += 1
+                    continue
+                for tweet in tweets:
+                    yield user_id, tweet
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _paginate(self, endpoint, params, max_pages=None):
+        '''Yield pages of an endpoint, following meta.next_token'''
+        params = dict(params)
+        n_pages = 0
+        while True:
+            page = self._request(endpoint, params=params).json()
+            yield page
+            n_pages += 1
+            next_token = page.get("meta", {}).get("next_token")
+            if next_token is None or (max_pages is not None and n_pages >= max_pages):
+                return
+            params["pagination_token"] = next_token
+
     # List endpoints #
 
     def get_list_members(self, list_id, user_fields="created_at"):
         '''
+        First page of members of a list. See iter_list_members for all pages.
+
         Args:
             user_fields: User fields are adjustable, options include:
                 created_at, description, entities, id, location, name,
                 pinned_tweet_id, profile_image_url, protected,
                 public_metrics, url, username, verified, and withheld
         '''
-        endpoint = "/lists/{list_id}/members"
+        endpoint = f"/lists/{list_id}/members"
         params = {"user.fields": user_fields}
         r = self._request(endpoint, params=params)
         return r.json() 
+
+    def iter_list_members(self, list_id, user_fields="created_at", max_pages=None):
+        '''Lazily yield members of a list, fetching pages as they are consumed'''
+        endpoint = f"/lists/{list_id}/members"
+        params = {"user.fields": user_fields, "max_results": 100}
+        for page in self._paginate(endpoint, params, max_pages):
+            yield from page.get("data", [])
     
     # Rules endpoint
 
@@ -105,7 +247,343 @@ class Twitter:
     def get_stream(self, params={
         "tweet.fields": "created_at",
         "expansions": "author_id"
-    }):
+    }, timeout=(5, 90)):
+        # Keep-alive lines arrive every 20 seconds, so a read timeout well
+        # above that detects stalled connections
         endpoint = "/tweets/search/stream"
-        r = self._request(endpoint, method="GET", params=params, stream=True)
+        r = self._request(
+            endpoint, method="GET", params=params, stream=True, timeout=timeout
+        )
         return r
+
+
+class StreamConsumer:
+    '''
+    Consumer of the filtered stream. A reader thread parses newline-delimited
+    tweets from the socket as they arrive, skips keep-alive lines and
+    reconnects with the backoff recommended by the API. Tweets go through a
+    bounded queue to handler workers, so a slow handler applies backpressure
+    instead of growing memory.
+
+    Args:
+        twitter (Twitter): Client opening the stream
+        handler (Callable): Called with each decoded tweet
+        params (dict): Query parameters of get_stream
+        max_workers (int): Number of handler threads
+        queue_size (int): Maximum number of tweets waiting for a handler
+    '''
+
+    def __init__(self, twitter, handler, params=None, max_workers=4, queue_size=1000):
+        self.twitter = twitter
+        self.handler = handler
+        self.params = params
+        self.max_workers = max_workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.counters = {
+            "received": 0,
+            "processed": 0,
+            "errors": 0,
+            "keepalives": 0,
+            "reconnects": 0,
+            "bytes": 0,
+        }
+        self.lag = 0.0 # seconds the last tweet waited in the queue
+        self.max_lag = 0.0
+        self.started_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._response = None
+        self._threads = []
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def stats(self) -> dict:
+        '''Counters, tweets per second, queue depth and handler lag'''
+        with self._lock:
+            stats = dict(self.counters)
+            stats["lag"] = self.lag
+            stats["max_lag"] = self.max_lag
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        stats["throughput"] = stats["received"] / elapsed if elapsed > 0 else 0.0
+        stats["queued"] = self.queue.qsize()
+        return stats
+
+    def start(self):
+        self._stop.clear()
+        self.started_at = time.monotonic()
+        self._threads = [threading.Thread(target=self._read, daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(self.max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, wait=True):
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            response.close()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _connect(self):
+        if self.params is None:
+            return self.twitter.get_stream()
+        return self.twitter.get_stream(self.params)
+
+    def _read(self):
+        failures = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._response = self._connect()
+                    failures = 0
+                    self._consume(self._response)
+                    # Closed by the server: reconnect right away
+                    backoff = 0.25
+                except RequestError as e:
+                    if self._stop.is_set():
+                        break
+                    failures += 1
+                    if e.status_code == 429:
+                        # Rate limited: exponential from 1 minute
+                        backoff = 60 * 2 ** (failures - 1)
+                    else:
+                        # HTTP errors: exponential from 5 seconds up to 320
+                        backoff = min(5 * 2 ** (failures - 1), 320)
+                    logger.warning(f"Stream error {e}. Reconnecting in {backoff}s.")
+                except Exception as e:
+                    if self._stop.is_set():
+                        break
+                    # Network errors: linear in 250 ms steps up to 16 seconds
+                    failures += 1
+                    backoff = min(0.25 * failures, 16)
+                    logger.warning(f"Stream disconnected {e}. Reconnecting in {backoff}s.")
+                finally:
+                    if self._response is not None:
+                        self._response.close()
+                        self._response = None
+                if self._stop.wait(backoff):
+                    break
+                self._count("reconnects")
+        finally:
+            # Wake up the workers
+            for _ in range(self.max_workers):
+                self.queue.put(None)
+
+    def _consume(self, response):
+        for line in response.iter_lines(chunk_size=None):
+            if self._stop.is_set():
+                return
+            if not line.strip():
+                self._count("keepalives")
+                continue
+            self._count("bytes", len(line))
+            try:
+                tweet = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping malformed stream line: {line[:100]!r}")
+                self._count("errors")
+                continue
+            self._count("received")
+            # Blocks while the queue is full, throttling the reader
+            self.queue.put((time.monotonic(), tweet))
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            received_at, tweet = item
+            lag = time.monotonic() - received_at
+            with self._lock:
+                self.lag = lag
+                self.max_lag = max(self.max_lag, lag)
+            try:
+                self.handler(tweet)
+                self._count("processed")
+            except Exception as e:
+                logger.warning(f"Handler failed on tweet: {e}")
+                self._count("errors")
+
+
+class AsyncTwitter(AsyncClient, Twitter):
+    '''Asyncio counterpart of Twitter with the same methods as coroutines'''
+
+    async def _request(self, endpoint, method="GET", params=None, **kwargs):
+        key = _rate_key(method, endpoint)
+        for attempt in range(self.max_retries + 1):
+            await self.governor.acquire_async(key)
+            r = None
+            try:
+                r = await super()._request(endpoint, method, params, **kwargs)
+                return r
+            except RequestError as e:
+                r = e.response
+                if e.status_code != 429 or attempt == self.max_retries:
+                    raise
+                logger.warning(f"Rate limited on {key}, waiting for reset.")
+                metrics.count(
+                    "retries", type(self).__name__,
+                    self._endpoint_label(endpoint, kwargs)
+                )
+            finally:
+                self.governor.release(key, *_rate_limit(r))
+
+    async def get_users(self, user_ids=None, usernames=None, user_fields="public_metrics"):
+        queries = self._users_queries(user_ids, usernames, user_fields)
+        responses = await asyncio.gather(*(
+            self._request(endpoint, params=params) for endpoint, params in queries
+        ))
+        return [user for r in responses for user in r.json().get("data", [])]
+
+    async def get_user_tweets(self, user_id, tweet_fields="created_at", **kwargs):
+        endpoint = f"/users/{user_id}/tweets"
+        params = {"tweet.fields": tweet_fields}
+        params.update(kwargs)
+        r = await self._request(endpoint, params=params)
+        return r.json()
+
+    async def iter_user_tweets(self, user_id, tweet_fields="created_at", max_pages=None, **kwargs):
+        endpoint = f"/users/{user_id}/tweets"
+        params = {"tweet.fields": tweet_fields, "max_results": 100}
+        params.update(kwargs)
+        async for page in self._paginate(endpoint, params, max_pages):
+            for tweet in page.get("data", []):
+                yield tweet
+
+    async def iter_users_tweets(
+        self, user_ids, tweet_fields="created_at", max_pages=None,
+        max_workers=4, **kwargs
+    ):
+        '''
+        Async generator of (user_id, tweet) of many users. At most max_workers
+        timelines are paginated concurrently and pages are buffered in a
+        bounded queue.
+        '''
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        pages = asyncio.Queue(maxsize=2 * max_workers)
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch(user_id):
+            try:
+                async with semaphore:
+                    async for page in self._paginate(
+                        f"/users/{user_id}/tweets",
+                        {"tweet.fields": tweet_fields, "max_results": 100, **kwargs},
+                        max_pages
+                    ):
+                        await pages.put((user_id, page.get("data", []), None))
+            except Exception as e:
+                await pages.put((user_id, None, e))
+            await pages.put((user_id, None, None))
+
+        tasks = [asyncio.ensure_future(fetch(user_id)) for user_id in user_ids]
+        finished = 0
+        try:
+            while finished < len(user_ids):
+                user_id, tweets, error = await pages.get()
+                if error is not None:
+                    raise error
+                if tweets is None:
+                    finished += 1
+                    continue
+                for tweet in tweets:
+                    yield user_id, tweet
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _paginate(self, endpoint, params, max_pages=None):
+        params = dict(params)
+        n_pages = 0
+        while True:
+            page = (await self._request(endpoint, params=params)).json()
+            yield page
+            n_pages += 1
+            next_token = page.get("meta", {}).get("next_token")
+            if next_token is None or (max_pages is not None and n_pages >= max_pages):
+                return
+            params["pagination_token"] = next_token
+
+    async def get_list_members(self, list_id, user_fields="created_at"):
+        endpoint = f"/lists/{list_id}/members"
+        params = {"user.fields": user_fields}
+        r = await self._request(endpoint, params=params)
+        return r.json()
+
+    async def iter_list_members(self, list_id, user_fields="created_at", max_pages=None):
+        endpoint = f"/lists/{list_id}/members"
+        params = {"user.fields": user_fields, "max_results": 100}
+        async for page in self._paginate(endpoint, params, max_pages):
+            for user in page.get("data", []):
+                yield user
+
+    async def get_rules(self) -> dict:
+        endpoint = "/tweets/search/stream/rules"
+        r = await self._request(endpoint)
+        return r.json()["data"]
+
+    async def delete_all_rules(self, rules: dict) -> dict:
+        if rules is None or "data" not in rules:
+            return None
+
+        rule_ids = list(map(lambda rule: rule["id"], rules["data"]))
+        payload = {"delete": {"ids": rule_ids}}
+        endpoint = "/tweets/search/stream/rules"
+        r = await self._request(endpoint, method="POST", json=payload)
+        content = r.json()
+        logger.info(f"Deleted stream rules: {json.dumps(content)}")
+        return content
+
+    async def set_rules(self, rules: list) -> dict:
+        payload = {"add": rules}
+        endpoint = "/tweets/search/stream/rules"
+        r = await self._request(endpoint, method="POST", json=payload)
+        content = r.json()
+        logger.info(f"Set stream rules: {json.dumps(content)}")
+        return content
+
+    async def get_stream(self, params={
+        "tweet.fields": "created_at",
+        "expansions": "author_id"
+    }):
+        '''Async generator of raw lines of the filtered stream'''
+        url = self.base_url + "/tweets/search/stream"
+        async with self.transport.stream(
+            "GET", url, params=params, headers=self.headers, timeout=(5, 90)
+        ) as r:
+            if r.status != 200:
+                raise RequestError(
+                    f"Request error: {r.status} {await r.text()}"
+                )
+            async for line in r.content:
+                yield line
+
+
+def _rate_key(method, endpoint) -> str:
+    '''Endpoint template of a request, e.g. "GET /users/:id/tweets"'''
+    return f"{method} {_ID_SEGMENT.sub('/:id', endpoint)}"
+
+
+def _rate_limit(r) -> tuple:
+    '''(limit, remaining, reset) from the x-rate-limit headers of a reply'''
+    if r is None:
+        return None, None, None
+    headers = r.headers
+    try:
+        limit = int(headers["x-rate-limit-limit"])
+        remaining = int(headers["x-rate-limit-remaining"])
+        reset = float(headers["x-rate-limit-reset"])
+    except (KeyError, TypeError, ValueError):
+        if r.status_code == 429:
+            # Rate limited without headers: hold the endpoint for a minute
+            return None, 0, time.time() + 60
+        return None, None, None
+    return limit, remaining, reset
@@ -1,13 +1,73 @@
+from __future__ import annotations
+
 import abc
 import enum
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+import numpy as np
+from eth_abi import decode, encode
+from eth_utils import encode_hex, event_signature_to_log_topic, function_abi_to_4byte_selector
+from eth_utils.abi import get_abi_input_types, get_abi_output_types
+
+from . import metrics
+from .cache import Memo
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
 
 
 class Address(enum.Enum):
     ETH = "0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE"
+    # Multicall3 is deployed at the same address on most EVM chains
+    MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
 
+MULTICALL3_ABI = [
+    {
+        "name": "getBlockNumber",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "blockNumber", "type": "uint256"}],
+    },
+    {
+        "name": "aggregate3",
+        "type": "function",
+        "stateMutability": "payable",
+        "inputs": [{
+            "name": "calls",
+            "type": "tuple[]",
+            "components": [
+                {"name": "target", "type": "address"},
+                {"name": "allowFailure", "type": "bool"},
+                {"name": "callData", "type": "bytes"},
+            ],
+        }],
+        "outputs": [{
+            "name": "returnData",
+            "type": "tuple[]",
+            "components": [
+                {"name": "success", "type": "bool"},
+                {"name": "returnData", "type": "bytes"},
+            ],
+        }],
+    },
+]
 
-@dataclass
+
+@dataclass(slots=True)
 class Reserve:
     '''Individual reserve in a liquidity pool'''
     symbol: str
@@ -15,44 +75,505 @@ class Reserve:
     balance: int
 
 
+class ReserveTable:
+    '''
+    Columnar table of the reserves of many pools for vectorized analytics.
+    Raw balances are kept exactly as 128-bit integers split into two uint64
+    columns, since 18-decimal balances overflow int64 beyond ~9 tokens.
+
+    E.g.
+        table = ReserveTable.from_pools(pools)
+        table.tvl({"USDC": 1.0, "DAI": 1.0, "ETH": 3000.0})
+
+    Args:
+        pools (list[str]): Pool addresses, indexed by the pool column
+        tokens (list[str]): Token symbols, indexed by the token column
+        pool (np.ndarray): Pool id of each reserve
+        token (np.ndarray): Token id of each reserve
+        decimals (np.ndarray): Decimals of each reserve
+        balance_hi (np.ndarray): High 64 bits of each raw balance
+        balance_lo (np.ndarray): Low 64 bits of each raw balance
+    '''
+
+    def __init__(self, pools, tokens, pool, token, decimals, balance_hi, balance_lo):
+        self.pools = pools
+        self.tokens = tokens
+        self.pool = pool
+        self.token = token
+        self.decimals = decimals
+        self.balance_hi = balance_hi
+        self.balance_lo = balance_lo
+
+    def __len__(self):
+        return len(self.pool)
+
+    @classmethod
+    def from_pools(cls, pools):
+        '''
+        Args:
+            pools (list[LiquidityPool]): Pools with reserves read
+
+        Returns:
+            ReserveTable
+        '''
+        unloaded = [pool for pool in pools if not pool.loaded]
+        if unloaded:
+            refresh_reserves(unloaded)
+        size = sum(len(pool.reserves) for pool in pools)
+        pool = np.empty(size, dtype=np.int32)
+        token = np.empty(size, dtype=np.int32)
+        decimals = np.empty(size, dtype=np.uint8)
+        balance_hi = np.empty(size, dtype=np.uint64)
+        balance_lo = np.empty(size, dtype=np.uint64)
+
+        token_ids = {}
+        i = 0
+        for pool_id, liquidity_pool in enumerate(pools):
+            for symbol, reserve in liquidity_pool.reserves.items():
+                if reserve.balance >> 128:
+                    raise OverflowError(f"Balance of {symbol} exceeds 128 bits")
+                pool[i] = pool_id
+                token[i] = token_ids.setdefault(symbol, len(token_ids))
+                decimals[i] = reserve.decimals
+                balance_hi[i] = reserve.balance >> 64
+                balance_lo[i] = reserve.balance & 0xFFFFFFFFFFFFFFFF
+                i += 1
+        return cls(
+            [liquidity_pool.address for liquidity_pool in pools], list(token_ids),
+            pool, token, decimals, balance_hi, balance_lo
+        )
+
+    def balances(self) -> np.ndarray:
+        '''Exact raw balances as Python ints (object array)'''
+        return (self.balance_hi.astype(object) << 64) | self.balance_lo.astype(object)
+
+    def normalized(self) -> np.ndarray:
+        '''Balances in token units, i.e. raw balance / 10 ** decimals'''
+        raw = self.balance_hi * 2.0 ** 64 + self.balance_lo.astype(np.float64)
+        return raw / np.power(10.0, self.decimals)
+
+    def _pool_sum(self, values):
+        return np.bincount(self.pool, weights=values, minlength=len(self.pools))
+
+    def imbalance(self) -> np.ndarray:
+        '''
+        Share of each reserve relative to an equal split of its pool, e.g.
+        1.0 for every reserve of a perfectly balanced stable pool
+        '''
+        normalized = self.normalized()
+        counts = np.bincount(self.pool, minlength=len(self.pools))
+        return normalized * counts[self.pool] / self._pool_sum(normalized)[self.pool]
+
+    def implied_prices(self) -> np.ndarray:
+        '''
+        Price of each token implied by the balance ratio of its pool, in
+        units of the pool's first token
+        '''
+        normalized = self.normalized()
+        first = np.unique(self.pool, return_index=True)[1]
+        numeraire = np.empty(len(self.pools))
+        numeraire[self.pool[first]] = normalized[first]
+        return numeraire[self.pool] / normalized
+
+    def tvl(self, prices) -> pd.Series:
+        '''
+        Args:
+            prices (dict | pd.Series): Price of each token symbol. Reserves
+                of tokens without a price count as 0.
+
+        Returns:
+            pd.Series: Value locked in each pool
+        '''
+        token_prices = np.array([prices.get(token, 0.0) for token in self.tokens])
+        values = self.normalized() * token_prices[self.token]
+        import pandas as pd
+        return pd.Series(self._pool_sum(values), index=self.pools, name="tvl")
+
+    def to_frame(self) -> pd.DataFrame:
+        '''
+        Reserves as a frame sharing the table's arrays. Columns pool and
+        token are ids into the pools and tokens lists.
+        '''
+        import pandas as pd
+        return pd.DataFrame({
+            "pool": self.pool,
+            "token": self.token,
+            "decimals": self.decimals,
+            "balance_hi": self.balance_hi,
+            "balance_lo": self.balance_lo,
+        }, copy=False)
+
+
+class Multicall:
+    '''
+    Batches read-only contract calls into a single Multicall3 aggregate3
+    eth_call. Falls back to a JSON-RPC batch request on chains without a
+    Multicall3 deployment (e.g. a fresh local test chain).
+
+    Args:
+        w3 (Web3): Web3 instance
+        address (str): Multicall3 contract address
+        batch_size (int): Maximum number of calls per aggregate3 call
+    '''
+
+    def __init__(self, w3, address=Address.MULTICALL3.value, batch_size=500):
+        self.w3 = w3
+        self.batch_size = batch_size
+        self.contract = w3.eth.contract(
+            address=w3.to_checksum_address(address),
+            abi=MULTICALL3_ABI
+        )
+        self._deployed = None
+
+    @property
+    def deployed(self):
+        if self._deployed is None:
+            code = self.w3.eth.get_code(self.contract.address)
+            self._deployed = len(code) > 0
+        return self._deployed
+
+    def call(self, calls, block_identifier="latest", allow_failure=False):
+        '''
+        Args:
+            calls (list): Contract functions bound to their arguments, e.g.
+                [pool.functions.balances(0), token.functions.symbol()]
+            block_identifier (int | str): Block to read all calls at
+            allow_failure (bool): Return None for reverted calls instead of
+                raising
+
+        Returns:
+            list: Decoded return values in the order of calls. Functions
+                with a single output are unwrapped.
+        '''
+        if not calls:
+            return []
+        if not self.deployed:
+            return self._batch(calls, block_identifier)
+
+        results = []
+        for start in range(0, len(calls), self.batch_size):
+            chunk = calls[start:start + self.batch_size]
+            payload = [
+                (fn.address, allow_failure, _encode(fn))
+                for fn in chunk
+            ]
+            replies = self._send(
+                "aggregate3",
+                self.contract.functions.aggregate3(payload).call,
+                block_identifier=block_identifier
+            )
+            with metrics.timer("parse", "Multicall", "aggregate3"):
+                results.extend(
+                    self._decode(fn, data) if success else None
+                    for fn, (success, data) in zip(chunk, replies)
+                )
+        return results
+
+    def _batch(self, calls, block_identifier):
+        with self.w3.batch_requests() as batch:
+            for fn in calls:
+                batch.add(self.w3.eth.call(
+                    {"to": fn.address, "data": _encode(fn)},
+                    block_identifier
+                ))
+            replies = self._send("batch", batch.execute)
+        with metrics.timer("parse", "Multicall", "batch"):
+            return [self._decode(fn, data) for fn, data in zip(calls, replies)]
+
+    def _send(self, endpoint, func, **kwargs):
+        # JSON-RPC calls have no status code, "ok" marks success in metrics
+        if not metrics.enabled:
+            return func(**kwargs)
+        event = metrics.before_call("Multicall", "eth_call", endpoint)
+        try:
+            replies = func(**kwargs)
+        except Exception as e:
+            metrics.after_call(event, error=e)
+            raise
+        metrics.after_call(event, "ok")
+        return replies
+
+    def _decode(self, fn, data):
+        types = get_abi_output_types(fn.abi)
+        values = [
+            self.w3.to_checksum_address(value) if kind == "address" else value
+            for kind, value in zip(types, decode(types, bytes(data)))
+        ]
+        return values[0] if len(values) == 1 else tuple(values)
+
+
+def _encode(fn) -> str:
+    '''Calldata of a contract function bound to its arguments'''
+    if fn.kwargs:
+        # web3 matches keyword arguments to the ABI. Gas and chain ID are
+        # given so it makes no RPC calls.
+        return fn.build_transaction({"gas": 0, "gasPrice": 0, "chainId": 1})["data"]
+    selector = function_abi_to_4byte_selector(fn.abi)
+    return encode_hex(selector + encode(get_abi_input_types(fn.abi), fn.args))
+
+
+class TokenCache:
+    '''
+    Cache of ERC-20 symbols and decimals keyed by (chain id, checksum
+    address). Metadata of a deployed token never changes, so it is read once
+    per process and can persist to disk across restarts.
+
+    Args:
+        path (str): JSON file of the metadata. Not persisted if None.
+    '''
+
+    def __init__(self, path=None):
+        self.path = None if path is None else os.path.expanduser(path)
+        self.tokens = {}
+        self.lock = threading.Lock()
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def get(self, chain_id, address):
+        '''Returns (symbol, decimals) or None if the token is unknown'''
+        return self.tokens.get((chain_id, address))
+
+    def update(self, chain_id, metadata):
+        '''
+        Args:
+            chain_id (int): Chain ID
+            metadata (dict): Maps checksum addresses to (symbol, decimals)
+        '''
+        with self.lock:
+            for address, token in metadata.items():
+                self.tokens[(chain_id, address)] = tuple(token)
+            if self.path is not None:
+                self.save()
+
+    def load(self):
+        with open(self.path) as f:
+            state = json.load(f)
+        self.tokens = {
+            (int(chain_id), address): tuple(token)
+            for chain_id, tokens in state.items()
+            for address, token in tokens.items()
+        }
+
+    def save(self):
+        state = {}
+        for (chain_id, address), token in self.tokens.items():
+            state.setdefault(str(chain_id), {})[address] = token
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+
+_default_token_cache = TokenCache()
+
+
 class LiquidityPool(abc.ABC):
     '''
-    Abstract class for liquidity pool. Implement method get_reserves.
+    Abstract class for liquidity pool. Implement methods _token_calls and
+    _balance_calls; refresh batches them into as few RPC round trips as
+    possible (one once the pool's tokens are known).
+
+    With refresh=False a pool is built without any RPC: reserves are read on
+    first access, on refresh() or in a batch with refresh_reserves, and
+    block records the block number they were read at.
     
     Args:
         address (str): Contract address
         abi (list | dict): Contract ABI
         n (int): Number of reserves
+        refresh (bool): Read the reserves on instantiation
     '''
     
     # Set class attributes using class method: set_defaults
     w3 = None
     erc20_abi = None
+    multicall = None
+    token_cache = _default_token_cache
+    memo = Memo()
+    # Whether reserves are the pool's ERC-20 balances, which ReserveTracker
+    # can follow from Transfer logs
+    tracks_transfers = False
+    _chain_id = None
+    _contracts = {}
     
     @classmethod
-    def set_defaults(cls, w3, erc20_abi):
+    def set_defaults(cls, w3, erc20_abi, multicall=None, token_cache=None, memo_ttl=1):
+        '''
+        Args:
+            w3 (Web3): Web3 instance
+            erc20_abi (list): ERC-20 ABI
+            multicall (Multicall): Defaults to Multicall3 on w3
+            token_cache (TokenCache | str): Token metadata cache, or path of
+                a JSON file to persist it. Defaults to the process-wide cache.
+            memo_ttl (float): Seconds get_reserves results are reused
+        '''
         cls.w3 = w3
         cls.erc20_abi = erc20_abi
+        cls.multicall = multicall or Multicall(w3)
+        if isinstance(token_cache, str):
+            token_cache = TokenCache(token_cache)
+        if token_cache is not None:
+            cls.token_cache = token_cache
+        cls.memo = Memo(memo_ttl)
+        cls._chain_id = None
+        cls._contracts = {}
+
+    @classmethod
+    def chain_id(cls):
+        if cls._chain_id is None:
+            cls._chain_id = cls.w3.eth.chain_id
+        return cls._chain_id
     
-    def __init__(self, address, abi, n):
+    def __init__(self, address, abi, n, refresh=True):
         # Set class attributes before instantiating LiquidityPool!
         assert self.w3 is not None and self.erc20_abi is not None
 
         self.address = address
         self.abi = abi
         self.n = n
-        self.contract = self.w3.eth.contract(
-            address=self.w3.to_checksum_address(address),
-            abi=abi
-        )
         self.token_addresses = None
-        self.reserves = {}
+        self.tokens = None
+        self.block = None
+        self._reserves = None
+        self._balance_fns = None
+
+        if refresh:
+            self.refresh()
+
+    @cached_property
+    def contract(self):
+        return self.w3.eth.contract(
+            address=self.w3.to_checksum_address(self.address),
+            abi=self.abi
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self._reserves is not None
+
+    @property
+    def reserves(self) -> dict:
+        if self._reserves is None:
+            self.refresh()
+        return self._reserves
+
+    def refresh(self, block_identifier="latest"):
+        '''Reads the reserves at block_identifier'''
+        refresh_reserves([self], block_identifier)
+
+    def get_reserves(self, block_identifier="latest"):
+        '''
+        Reads the reserves at block_identifier. Concurrent reads of a pool
+        address at the same block share one refresh, reused for the memo's
+        TTL, which fills in every pool object waiting on it.
+        '''
+        pool = self.memo.call(
+            (self.w3.to_checksum_address(self.address), block_identifier),
+            lambda: self._read_reserves(block_identifier)
+        )
+        if pool is not self:
+            self._adopt(pool)
+        return self._reserves
+
+    def _read_reserves(self, block_identifier):
+        self.refresh(block_identifier)
+        return self
+
+    def _adopt(self, pool):
+        # State read by another object for the same pool address
+        self.token_addresses = pool.token_addresses
+        self.tokens = pool.tokens
+        self.block = pool.block
+        self._reserves = dict(pool._reserves)
+
+    def is_stale(self, block=None) -> bool:
+        '''
+        Args:
+            block (int): Block the reserves should be read at. Defaults to
+                the head block.
+        '''
+        if self.block is None:
+            return True
+        if block is None:
+            block = self.w3.eth.block_number
+        return self.block < block
+
+    @abc.abstractmethod
+    def _token_calls(self):
+        '''Calls returning the addresses of the pool's tokens'''
 
-        self.get_reserves()
-    
     @abc.abstractmethod
-    def get_reserves():
-        pass 
+    def _balance_calls(self):
+        '''Calls returning the pool's balance of each token'''
+
+    def _events(self):
+        '''Signatures of pool events after which reserves are re-read'''
+        return ()
+
+    def _token(self, addr):
+        # Building a contract processes its ABI, so contracts are shared
+        address = self.w3.to_checksum_address(addr)
+        token = self._contracts.get(address)
+        if token is None:
+            token = self.w3.eth.contract(address=address, abi=self.erc20_abi)
+            self._contracts[address] = token
+        return token
+
+    def _unknown_tokens(self):
+        chain_id = self.chain_id()
+        return [
+            addr for addr in self.token_addresses
+            if addr != Address.ETH.value
+            and self.token_cache.get(chain_id, addr) is None
+        ]
+
+    def _metadata_calls(self, addresses):
+        calls = []
+        for addr in addresses:
+            token = self._token(addr)
+            calls += [token.functions.symbol(), token.functions.decimals()]
+        return calls
+
+    def _set_tokens(self, unknown, metadata):
+        chain_id = self.chain_id()
+        if unknown:
+            self.token_cache.update(chain_id, {
+                addr: (next(metadata), next(metadata)) for addr in unknown
+            })
+        self.tokens = [
+            ("ETH", 18) if addr == Address.ETH.value
+            else self.token_cache.get(chain_id, addr)
+            for addr in self.token_addresses
+        ]
+
+    def _refresh(self):
+        '''
+        Generator yielding batches of calls and receiving their results, so
+        that refresh_reserves can merge the calls of many pools.
+        '''
+        if self.token_addresses is None:
+            self.token_addresses = yield self._token_calls()
+        if self._balance_fns is None:
+            self._balance_fns = self._balance_calls()
+
+        calls = self._balance_fns
+        if self.tokens is None:
+            unknown = self._unknown_tokens()
+            calls = calls + self._metadata_calls(unknown)
+        results = yield calls
+        balances, metadata = results[:self.n], iter(results[self.n:])
+
+        if self.tokens is None:
+            self._set_tokens(unknown, metadata)
+        self._reserves = {
+            symbol: Reserve(symbol, decimals, balance)
+            for (symbol, decimals), balance in zip(self.tokens, balances)
+        }
             
     def __str__(self):
         assert len(self.reserves) > 0
@@ -64,41 +585,359 @@ class LiquidityPool(abc.ABC):
 
 
 class CurveLP(LiquidityPool):
-    def get_reserves(self):
-        self.token_addresses = [
-            self.contract.functions.coins(i).call() for i in range(self.n)
-        ]
-        for i, addr in enumerate(self.token_addresses):
-            if addr == Address.ETH.value:
-                balance = self.contract.functions.balances(i).call()
-                self.reserves["ETH"] = Reserve("ETH", 18, balance)
-            else:
-                token = self.w3.eth.contract(
-                    address=self.w3.to_checksum_address(addr),
-                    abi=self.erc20_abi
-                )
-                symbol = token.functions.symbol().call()
-                self.reserves[symbol] = Reserve( 
-                    symbol,
-                    token.functions.decimals().call(),
-                    self.contract.functions.balances(i).call()
-                )
+    def _token_calls(self):
+        return [self.contract.functions.coins(i) for i in range(self.n)]
+
+    def _balance_calls(self):
+        return [self.contract.functions.balances(i) for i in range(self.n)]
+
+    def _events(self):
+        # Stored balances exclude admin fees, which the events do not report
+        coins = f"uint256[{self.n}]"
+        return (
+            "TokenExchange(address,int128,uint256,int128,uint256)",
+            "TokenExchange(address,uint256,uint256,uint256,uint256)",
+            "TokenExchangeUnderlying(address,int128,uint256,int128,uint256)",
+            f"AddLiquidity(address,{coins},{coins},uint256,uint256)",
+            f"RemoveLiquidity(address,{coins},{coins},uint256)",
+            "RemoveLiquidityOne(address,uint256,uint256)",
+            f"RemoveLiquidityImbalance(address,{coins},{coins},uint256,uint256)",
+        )
 
 
 class UniswapV3LP(LiquidityPool):
-    def get_reserves(self):
-        self.token_addresses = [
-            self.contract.functions.token0().call(),
-            self.contract.functions.token1().call()
+    tracks_transfers = True
+
+    def __init__(self, address, abi, n=2, refresh=True):
+        super().__init__(address, abi, n, refresh)
+
+    def _token_calls(self):
+        return [
+            self.contract.functions.token0(),
+            self.contract.functions.token1()
         ]
-        for addr in self.token_addresses:
-            token = self.w3.eth.contract(
-                address=self.w3.to_checksum_address(addr),
-                abi=self.erc20_abi
-            )
-            symbol = token.functions.symbol().call()
-            self.reserves[symbol] = Reserve( 
-                symbol,
-                token.functions.decimals().call(),
-                token.functions.balanceOf(self.address).call()
-            )
+
+    def _balance_calls(self):
+        return [
+            self._token(addr).functions.balanceOf(self.contract.address)
+            for addr in self.token_addresses
+        ]
+
+
+def refresh_reserves(pools, block_identifier="latest", multicall=None):
+    '''
+    Refreshes the reserves of many pools with one multicall per round trip:
+    pools whose tokens are known take one round trip in total, new pools
+    two. Token metadata is read only for tokens missing from the pools'
+    TokenCache. All balances are read in the same call, hence at the same block.
+
+    A block tag such as "latest" is resolved by the first multicall, which
+    also reads the block number, and later round trips are pinned to it.
+
+    Args:
+        pools (list[LiquidityPool]): Pools to refresh
+        block_identifier (int | str): Block to read reserves at
+        multicall (Multicall): Defaults to LiquidityPool.multicall
+    '''
+    multicall = multicall or LiquidityPool.multicall
+    block = block_identifier
+    if not isinstance(block, int) and not multicall.deployed:
+        block = multicall.w3.eth.block_number
+
+    pending = []
+    for pool in pools:
+        steps = pool._refresh()
+        pending.append((pool, steps, next(steps)))
+
+    while pending:
+        calls = [fn for _, _, batch in pending for fn in batch]
+        if not isinstance(block, int):
+            calls.insert(0, multicall.contract.functions.getBlockNumber())
+        results = multicall.call(calls, block)
+        if not isinstance(block, int):
+            block = results.pop(0)
+
+        results = iter(results)
+        waiting = []
+        for pool, steps, batch in pending:
+            try:
+                batch = steps.send([next(results) for _ in batch])
+            except StopIteration:
+                pool.block = block
+                continue
+            waiting.append((pool, steps, batch))
+        pending = waiting
+
+
+class PoolSet:
+    '''
+    Consistent snapshot of many liquidity pools. Every refresh reads all
+    reserves at the same block, in chunks of pools refreshed concurrently,
+    and is skipped while the head block is unchanged.
+
+    E.g.
+        pools = PoolSet([CurveLP(addr, abi, n=3, refresh=False), ...])
+        pools.start(interval=12)
+
+    Args:
+        pools (list[LiquidityPool]): Pools, e.g. built with refresh=False
+        max_workers (int): Maximum number of concurrent multicalls
+        chunk_size (int): Pools per multicall
+        callback (callable): Called with the PoolSet after each new snapshot
+    '''
+
+    def __init__(self, pools=(), max_workers=4, chunk_size=50, callback=None):
+        self.pools = list(pools)
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.callback = callback
+        self.block = None
+        self.updated_at = None
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.pools)
+
+    def __iter__(self):
+        return iter(self.pools)
+
+    def add(self, pool):
+        with self.lock:
+            self.pools.append(pool)
+            # Read the new pool with the next snapshot
+            self.block = None
+
+    def refresh(self, block_identifier=None) -> bool:
+        '''
+        Args:
+            block_identifier (int): Block to read reserves at. Defaults to
+                the head block, skipping the refresh if it has not changed.
+
+        Returns:
+            bool: Whether a new snapshot was read
+        '''
+        with self.lock:
+            block = block_identifier
+            if block is None:
+                block = LiquidityPool.w3.eth.block_number
+                if block == self.block:
+                    return False
+
+            chunks = [
+                self.pools[i:i + self.chunk_size]
+                for i in range(0, len(self.pools), self.chunk_size)
+            ]
+            with ThreadPoolExecutor(self.max_workers) as executor:
+                list(executor.map(
+                    lambda chunk: refresh_reserves(chunk, block), chunks
+                ))
+            self.block = block
+            self.updated_at = time.time()
+
+        if self.callback is not None:
+            self.callback(self)
+        return True
+
+    def to_table(self) -> ReserveTable:
+        return ReserveTable.from_pools(self.pools)
+
+    def to_frame(self) -> pd.DataFrame:
+        '''Reserves of all pools, one row per (pool, symbol)'''
+        rows = [
+            (pool.address, symbol, reserve.decimals, reserve.balance)
+            for pool in self.pools
+            for symbol, reserve in pool.reserves.items()
+        ]
+        import pandas as pd
+        data = pd.DataFrame(
+            rows, columns=["pool", "symbol", "decimals", "balance"]
+        )
+        data["block"] = self.block
+        return data.set_index(["pool", "symbol"])
+
+    def run(self, interval=12):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh pools")
+            self._stop.wait(interval)
+
+    def start(self, interval=12):
+        '''Refresh in a background thread every interval seconds'''
+        self._stop.clear()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(
+            target=self.run, args=(interval,), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, wait=False):
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+
+TRANSFER = encode_hex(event_signature_to_log_topic("Transfer(address,address,uint256)"))
+
+
+class ReserveTracker:
+    '''
+    Keeps the reserves of many pools up to date from on-chain logs instead of
+    reading every pool at every block. After one full snapshot, new blocks are
+    scanned with eth_getLogs in ranges of up to max_range blocks:
+
+    - ERC-20 Transfer logs to and from pools with tracks_transfers (e.g.
+      UniswapV3LP) are applied to the balances in memory
+    - Other pools (e.g. CurveLP) which emitted one of their _events are
+      re-read with a single multicall at the end of the range
+
+    Checkpoints of the balances are kept for the last blocks processed; when
+    a checkpointed block is no longer on the chain, the tracker rolls back to
+    the latest checkpoint that is and replays the logs from there.
+
+    Args:
+        pools (list[LiquidityPool]): Pools, e.g. built with refresh=False
+        max_range (int): Maximum number of blocks per eth_getLogs request
+        checkpoints (int): Number of checkpoints kept for reorgs
+        confirmations (int): Number of blocks to stay behind the head
+    '''
+
+    def __init__(self, pools, max_range=2000, checkpoints=64, confirmations=0):
+        self.pools = list(pools)
+        self.max_range = max_range
+        self.confirmations = confirmations
+        self.checkpoints = deque(maxlen=checkpoints)
+        self.block = None
+
+        self._holders = {}
+        self._events = {}
+        for pool in self.pools:
+            address = pool.contract.address.lower()
+            for signature in pool._events():
+                topic = encode_hex(event_signature_to_log_topic(signature))
+                self._events.setdefault(topic, set()).add(address)
+        self._pools = {pool.contract.address.lower(): pool for pool in self.pools}
+
+    @property
+    def w3(self):
+        return LiquidityPool.w3
+
+    def _head(self):
+        return self.w3.eth.block_number - self.confirmations
+
+    def _block_hash(self, block):
+        return self.w3.eth.get_block(block)["hash"]
+
+    def _checkpoint(self):
+        balances = [
+            [reserve.balance for reserve in pool.reserves.values()]
+            for pool in self.pools
+        ]
+        self.checkpoints.append((self.block, self._block_hash(self.block), balances))
+
+    def _restore(self, block, balances):
+        for pool, pool_balances in zip(self.pools, balances):
+            for reserve, balance in zip(pool.reserves.values(), pool_balances):
+                reserve.balance = balance
+            pool.block = block
+
+    def snapshot(self, block_identifier=None):
+        '''Reads all pools at block_identifier, defaults to the tracked head'''
+        block = self._head() if block_identifier is None else block_identifier
+        refresh_reserves(self.pools, block)
+        self._holders = {}
+        for pool in self.pools:
+            if pool.tracks_transfers:
+                for addr, symbol in zip(pool.token_addresses, pool.reserves):
+                    self._holders[(addr.lower(), pool.contract.address.lower())] = (pool, symbol)
+        self.block = block
+        self.checkpoints.clear()
+        self._checkpoint()
+
+    def _rollback(self):
+        while self.checkpoints:
+            block, block_hash, balances = self.checkpoints[-1]
+            if self._block_hash(block) == block_hash:
+                logger.warning("Reorg detected, rolling back to block %d", block)
+                self._restore(block, balances)
+                self.block = block
+                return
+            self.checkpoints.pop()
+        logger.warning("Reorg deeper than the checkpoints, reading a snapshot")
+        self.snapshot()
+
+    def _filters(self, start, end):
+        blocks = {"fromBlock": start, "toBlock": end}
+        filters = []
+        if self._events:
+            addresses = set().union(*self._events.values())
+            filters.append({
+                **blocks,
+                "address": [self._pools[addr].contract.address for addr in addresses],
+                "topics": [list(self._events)],
+            })
+        if self._holders:
+            tokens = sorted({token for token, _ in self._holders})
+            holders = sorted({
+                "0x" + pool[2:].rjust(64, "0") for _, pool in self._holders
+            })
+            tokens = [self.w3.to_checksum_address(token) for token in tokens]
+            filters.append({**blocks, "address": tokens, "topics": [TRANSFER, holders]})
+            filters.append({**blocks, "address": tokens, "topics": [TRANSFER, None, holders]})
+        return filters
+
+    def _apply(self, logs) -> list:
+        '''Applies Transfer logs and returns the pools to re-read'''
+        dirty = {}
+        for log in logs:
+            address = log["address"].lower()
+            topic = encode_hex(log["topics"][0])
+            if topic == TRANSFER and len(log["topics"]) == 3:
+                value = int.from_bytes(log["data"], "big")
+                sender = "0x" + log["topics"][1][-20:].hex()
+                receiver = "0x" + log["topics"][2][-20:].hex()
+                for holder, delta in ((sender, -value), (receiver, value)):
+                    if (address, holder) in self._holders:
+                        pool, symbol = self._holders[(address, holder)]
+                        pool.reserves[symbol].balance += delta
+            elif address in self._events.get(topic, ()):
+                dirty[address] = self._pools[address]
+        return list(dirty.values())
+
+    def update(self) -> int:
+        '''
+        Applies the logs of blocks since the last update, reading a snapshot
+        on the first call.
+
+        Returns:
+            int: Number of logs applied
+        '''
+        if self.block is None:
+            self.snapshot()
+            return 0
+        if self._block_hash(self.block) != self.checkpoints[-1][1]:
+            self._rollback()
+
+        count = 0
+        head = self._head()
+        while self.block < head:
+            start, end = self.block + 1, min(head, self.block + self.max_range)
+            # A transfer between two pools matches both Transfer filters
+            logs = {
+                (log["transactionHash"], log["logIndex"]): log
+                for params in self._filters(start, end)
+                for log in self.w3.eth.get_logs(params)
+            }.values()
+            dirty = self._apply(logs)
+            if dirty:
+                refresh_reserves(dirty, end)
+            self.block = end
+            for pool in self.pools:
+                pool.block = end
+            self._checkpoint()
+            count += len(logs)
+        return count
@@ -18,6 +18,10 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     python_requires=">=3.10",
     install_requires=["numpy", "pandas", "requests"],
+    extras_require={
+        "async": ["aiohttp"],
+        "web3": ["web3>=7", "eth-abi>=5", "eth-utils>=5"],
+    },
     classifiers=[
         # Trove classifiers
         # (https://pypi.python.org/pypi?%3Aaction=list_classifiers)
@@ -0,0 +1,17 @@
+import json
+
+
+class FakeResponse:
+    '''Response of a fake transport with a JSON payload, or a raw bytes body'''
+
+    def __init__(self, payload, status_code=200, headers=None):
+        if isinstance(payload, bytes):
+            self.content = payload
+        else:
+            self.content = json.dumps(payload).encode()
+        self.text = self.content.decode()
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content)
@@ -1,6 +1,18 @@
+import asyncio
+import json
 import os
+import tempfile
 import unittest
+
+import numpy as np
+import pandas as pd
+
 import dipzy as dz
+from dipzy.alphavantage import (
+    _ohlcv_panel, _parse_daily, _parse_fundamentals, _parse_series
+)
+
+from . import FakeResponse
 
 
 class TestGetDaily(unittest.TestCase):
@@ -24,3 +36,133 @@ class TestGetDaily(unittest.TestCase):
     
     def test_CPI(self):
         data = self.av.CPI()
+
+
+class TestParseDaily(unittest.TestCase):
+    def setUp(self):
+        self.payload = {"Time Series (Daily)": {
+            date: {
+                "1. open": "10.0", "2. high": "11.0", "3. low": "9.0",
+                "4. close": close, "5. adjusted close": close,
+                "6. volume": "1000", "7. dividend amount": "0.0000",
+                "8. split coefficient": "1.0",
+            }
+            for date, close in [("2024-01-03", "10.5"), ("2024-01-02", "10.2")]
+        }}
+
+    def test_parse_daily(self):
+        data = _parse_daily(self.payload)
+        self.assertEqual(data["date"][0], np.datetime64("2024-01-02"))
+        self.assertEqual(data["close"].tolist(), [10.2, 10.5])
+        self.assertEqual(data["volume"].dtype, np.int64)
+
+    def test_panel(self):
+        arrays = [_parse_daily(self.payload)] * 2
+        long = _ohlcv_panel(["A", "B"], arrays, "long")
+        self.assertEqual(long.shape, (4, 10))
+        self.assertEqual(long["symbol"].tolist(), ["A", "A", "B", "B"])
+        panel = _ohlcv_panel(["A", "B"], arrays, "multiindex")
+        self.assertEqual(panel.loc["B"]["close"].tolist(), [10.2, 10.5])
+
+
+class TestParseSeries(unittest.TestCase):
+    def test_csv_json(self):
+        csv = b"timestamp,value\n2024-02-01,5.33\n2024-01-01,.\n"
+        payload = json.dumps({"name": "Federal Funds Rate", "data": [
+            {"date": "2024-02-01", "value": "5.33"},
+            {"date": "2024-01-01", "value": "."},
+        ]})
+        data = _parse_series(csv, "csv")
+        self.assertEqual(data.index.name, "date")
+        self.assertEqual(data["value"].dtype, np.float64)
+        self.assertTrue(np.isnan(data["value"].iloc[1]))
+        self.assertTrue(data.equals(_parse_series(csv.decode(), "csv")))
+        self.assertTrue(data.equals(_parse_series(payload, "json")))
+
+    def test_fundamentals(self):
+        jsons = [
+            {"Symbol": "IBM", "Sector": "TECHNOLOGY", "PERatio": "22.5",
+             "DividendDate": "2024-03-09", "ForwardPE": "-"},
+            {"Symbol": "XYZ", "Sector": "-", "PERatio": "None",
+             "DividendDate": "None", "ForwardPE": "12"},
+        ]
+        data = _parse_fundamentals(jsons)
+        self.assertEqual(data["PERatio"].dtype, np.float64)
+        self.assertEqual(data.loc["IBM", "PERatio"], 22.5)
+        self.assertTrue(np.isnan(data.loc["XYZ", "PERatio"]))
+        self.assertEqual(data["ForwardPE"].tolist()[1], 12)
+        self.assertEqual(data["DividendDate"].dtype.kind, "M")
+        self.assertTrue(pd.isna(data.loc["XYZ", "Sector"]))
+
+
+class CountingResponse(FakeResponse):
+    def __init__(self, payload):
+        super().__init__(payload)
+        self.decoded = 0
+
+    def json(self):
+        self.decoded += 1
+        return super().json()
+
+
+class QuoteTransport:
+    def __init__(self):
+        self.responses = []
+
+    def request(self, method, url, **kwargs):
+        quote = {"Global Quote": {"01. symbol": kwargs["params"]["symbol"], "05. price": "1.0"}}
+        self.responses.append(CountingResponse(quote))
+        return self.responses[-1]
+
+
+class TestDecodeOnce(unittest.TestCase):
+    def test_decoded_once(self):
+        for cache in (None, ":memory:"):
+            transport = QuoteTransport()
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = None if cache is None else os.path.join(tmpdir, "cache.db")
+                av = dz.AlphaVantage("key", calls_per_minute=100, transport=transport, cache=path)
+                prices = av.get_price(["IBM", "MSFT"])
+            self.assertEqual(prices.loc["MSFT", "Price"], "1.0")
+            self.assertEqual([r.decoded for r in transport.responses], [1, 1])
+
+
+class AsyncQuoteTransport(QuoteTransport):
+    def __init__(self):
+        super().__init__()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def request(self, method, url, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return super().request(method, url, **kwargs)
+
+    async def close(self):
+        pass
+
+
+class TestAsyncAlphaVantage(unittest.TestCase):
+    def setUp(self):
+        self.transport = AsyncQuoteTransport()
+        self.av = dz.AsyncAlphaVantage(
+            "key", calls_per_minute=100, max_workers=2, transport=self.transport
+        )
+
+    def test_request(self):
+        async def main():
+            return await asyncio.gather(*(self.av._request("GLOBAL_QUOTE", "IBM") for _ in range(3)))
+
+        responses = asyncio.run(main())
+        self.assertEqual(responses[0].json()["Global Quote"]["01. symbol"], "IBM")
+        # Identical requests in flight share one call
+        self.assertEqual(len(self.transport.responses), 1)
+
+    def test_batch_request(self):
+        symbols = ["IBM", "MSFT", "AAPL", "GOOG", "AMZN"]
+        prices = asyncio.run(self.av.get_price(symbols))
+        self.assertEqual(prices.index.tolist(), symbols)
+        self.assertEqual(len(self.transport.responses), 5)
+        self.assertLessEqual(self.transport.max_in_flight, 2)
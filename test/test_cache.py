@@ -0,0 +1,166 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import dipzy as dz
+from dipzy.cache import Memo, ResponseCache
+
+from . import FakeResponse
+
+
+def write_entries(path, worker):
+    cache = ResponseCache(path)
+    for i in range(50):
+        cache.set(f"{worker}-{i}", "x" * 100, ttl=60)
+        cache.get(f"{worker}-{i}")
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_get_set(self):
+        cache = ResponseCache(self.path)
+        key = ResponseCache.make_key("OVERVIEW", "IBM", {"a": 1})
+        self.assertIsNone(cache.get(key))
+        cache.set(key, '{"Symbol": "IBM"}', ttl=60)
+        self.assertEqual(cache.get(key), '{"Symbol": "IBM"}')
+        # Persisted across instances
+        self.assertEqual(ResponseCache(self.path).get(key), '{"Symbol": "IBM"}')
+
+    def test_ttl(self):
+        cache = ResponseCache(self.path)
+        cache.set("key", "value", ttl=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("key"))
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(self.path, max_entries=2, touch_interval=0)
+        cache.set("a", "1", ttl=60)
+        cache.set("b", "2", ttl=60)
+        cache.get("a")
+        cache.set("c", "3", ttl=60)
+        self.assertEqual(cache.get("a"), "1")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_size_bound(self):
+        cache = ResponseCache(self.path, max_bytes=250)
+        for key in "abc":
+            cache.set(key, "x" * 100, ttl=60)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 2)
+
+    def test_size_in_bytes(self):
+        cache = ResponseCache(self.path, max_bytes=250)
+        for key in "ab":
+            cache.set(key, "\u00e9" * 100, ttl=60)
+        # 200 bytes each in UTF-8
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 1)
+
+    def test_touch_interval(self):
+        cache = ResponseCache(self.path, touch_interval=60)
+        cache.set("a", "1", ttl=60)
+        conn = cache._connect()
+        accessed = conn.execute("SELECT accessed FROM responses").fetchone()[0]
+        cache.get("a")
+        self.assertEqual(conn.execute("SELECT accessed FROM responses").fetchone()[0], accessed)
+        with conn:
+            conn.execute("UPDATE responses SET accessed = 0")
+        cache.get("a")
+        self.assertGreater(conn.execute("SELECT accessed FROM responses").fetchone()[0], 0)
+
+    def test_concurrent_processes(self):
+        ResponseCache(self.path)
+        workers = [
+            multiprocessing.Process(target=write_entries, args=(self.path, i))
+            for i in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        self.assertEqual(len(ResponseCache(self.path)), 200)
+
+
+class SlowTransport:
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        time.sleep(0.05)
+        return FakeResponse({"Global Quote": {"01. symbol": "IBM", "05. price": "150.0"}})
+
+
+class TestMemo(unittest.TestCase):
+    def test_single_flight(self):
+        memo = Memo(ttl=0)
+        calls = []
+
+        def call():
+            calls.append(1)
+            time.sleep(0.05)
+            return len(calls)
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: memo.call("key", call), range(8)))
+        self.assertEqual(results, [1] * 8)
+        self.assertEqual(memo.call("key", call), 2)
+
+    def test_ttl_lru(self):
+        memo = Memo(ttl=0.05, maxsize=2)
+        memo.call("a", lambda: 1)
+        memo.call("b", lambda: 2)
+        self.assertEqual(memo.call("a", lambda: 3), 1)
+        memo.call("c", lambda: 4)
+        self.assertEqual(memo.call("b", lambda: 5), 5)
+        time.sleep(0.06)
+        self.assertEqual(memo.call("a", lambda: 6), 6)
+
+    def test_errors_not_memoized(self):
+        memo = Memo(ttl=60)
+
+        def fail():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            memo.call("key", fail)
+        self.assertEqual(memo.call("key", lambda: 1), 1)
+
+    def test_async(self):
+        memo = Memo(ttl=0)
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        async def main():
+            return await asyncio.gather(*(memo.call_async("key", call) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), [1] * 5)
+        self.assertEqual(memo.inflight, {})
+
+    def test_client(self):
+        transport = SlowTransport()
+        av = dz.AlphaVantage("key", calls_per_minute=100, transport=transport)
+        threads = [threading.Thread(target=av.get_price, args=("IBM",)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        av.get_price("IBM")
+        self.assertEqual(transport.calls, 1)
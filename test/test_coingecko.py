@@ -0,0 +1,140 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import dipzy as dz
+from dipzy.coingecko import SymbolIndex
+
+from . import FakeResponse
+
+
+COINS = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+    {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+    {"id": "usd-coin", "symbol": "usdc", "name": "USD Coin"},
+    {"id": "bridged-usdc", "symbol": "usdc", "name": "Bridged USDC"},
+]
+
+
+class FakeTransport:
+    '''Replies to /coins/list, honouring If-None-Match, and /coins/markets'''
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, headers=None, params=None, **kwargs):
+        self.requests.append(url)
+        if url.endswith("/coins/markets"):
+            return FakeResponse(markets(params))
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return FakeResponse(b"", 304)
+        return FakeResponse(COINS, headers={"ETag": '"v1"'})
+
+
+def markets(params):
+    if "ids" in params:
+        ids = params["ids"].split(",")
+    else:
+        start = (params["page"] - 1) * params["per_page"]
+        ids = [f"coin-{i}" for i in range(start, start + params["per_page"])]
+    return [
+        {
+            "id": coin_id, "symbol": coin_id[:3], "name": coin_id,
+            "current_price": 1.0, "total_volume": 2.0, "market_cap": 3.0,
+            "price_change_percentage_24h_in_currency": 0.5,
+        }
+        for coin_id in ids
+    ]
+
+
+class TestConvertSymbols(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "coins.json")
+        self.transport = FakeTransport()
+        self.cg = dz.CoinGecko(self.transport, symbol_index=self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_convert_symbols(self):
+        ids = self.cg.convert_symbols(["btc", "eth", "missing"])
+        self.assertEqual(ids.to_dict(), {"BTC": "bitcoin", "ETH": "ethereum"})
+        self.cg.convert_symbols(["btc"])
+        self.assertEqual(len(self.transport.requests), 1)
+
+    def test_ambiguous(self):
+        ids = self.cg.convert_symbols(["usdc", "btc"])
+        self.assertEqual(ids.loc["USDC"].tolist(), ["usd-coin", "bridged-usdc"])
+        ids = self.cg.convert_symbols(["usdc", "btc"], ambiguous="skip")
+        self.assertEqual(ids.index.tolist(), ["BTC"])
+        with self.assertRaises(ValueError):
+            self.cg.convert_symbols(["usdc"], ambiguous="raise")
+
+    def test_catalogue(self):
+        data = self.cg.convert_symbols()
+        self.assertEqual(len(data), 4)
+        self.assertEqual(data.loc["eth", "name"], "Ethereum")
+
+    def test_persisted_and_revalidated(self):
+        self.cg.convert_symbols(["btc"])
+        index = SymbolIndex(self.path, refresh_interval=0)
+        self.assertEqual(index.lookup(["eth"]), {"eth": ("ethereum",)})
+
+        cg = dz.CoinGecko(self.transport, symbol_index=index)
+        ids = cg.convert_symbols(["eth"])
+        self.assertEqual(ids.tolist(), ["ethereum"])
+        # Catalogue was revalidated with a conditional request
+        self.assertEqual(len(self.transport.requests), 2)
+        self.assertEqual(len(index), 4)
+
+
+class TestCoinsMarkets(unittest.TestCase):
+    def setUp(self):
+        self.transport = FakeTransport()
+        self.cg = dz.CoinGecko(self.transport, calls_per_minute=1000)
+
+    def test_chunked_ids(self):
+        ids = [f"coin-{i}" for i in range(600)]
+        data = self.cg.get_coins_markets(ids)
+        self.assertEqual(len(self.transport.requests), 3)
+        self.assertEqual(data["name"].tolist(), ids)
+        self.assertEqual(list(data.columns), ["symbol", "name", "current_price", "total_volume", "24h"])
+
+    def test_pages(self):
+        data = self.cg.get_coins_markets(pages=3, per_page=100)
+        self.assertEqual(len(self.transport.requests), 3)
+        self.assertEqual(data["name"].iloc[-1], "coin-299")
+
+
+class AsyncFakeTransport(FakeTransport):
+    async def request(self, method, url, **kwargs):
+        await asyncio.sleep(0.01)
+        return super().request(method, url, **kwargs)
+
+    async def close(self):
+        pass
+
+
+class TestAsyncCoinGecko(unittest.TestCase):
+    def setUp(self):
+        self.transport = AsyncFakeTransport()
+        self.cg = dz.AsyncCoinGecko(self.transport, symbol_index=SymbolIndex(), calls_per_minute=1000)
+
+    def test_concurrent_convert_symbols(self):
+        async def main():
+            return await asyncio.gather(*(self.cg.convert_symbols(["btc"]) for _ in range(20)))
+
+        results = asyncio.run(main())
+        self.assertEqual(results[-1].to_dict(), {"BTC": "bitcoin"})
+        # The catalogue is downloaded once
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertEqual(self.cg.symbol_index.refreshes, {})
+
+    def test_get_coins_markets(self):
+        ids = [f"coin-{i}" for i in range(600)]
+        data = asyncio.run(self.cg.get_coins_markets(ids))
+        self.assertEqual(len(self.transport.requests), 3)
+        self.assertEqual(data["name"].tolist(), ids)
+        self.assertEqual(data.loc[data.index[0], "24h"], 0.5)
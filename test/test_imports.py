@@ -0,0 +1,28 @@
+import subprocess
+import sys
+import unittest
+
+
+def loaded(statement, modules=("numpy", "pandas", "web3", "eth_abi")):
+    '''Heavy modules loaded by a statement in a fresh interpreter'''
+    code = f"import sys; {statement}; print(','.join(m for m in {modules!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return [module for module in output.stdout.strip().split(",") if module]
+
+
+class TestImports(unittest.TestCase):
+    def test_import(self):
+        self.assertEqual(loaded("import dipzy"), [])
+
+    def test_telegram(self):
+        self.assertEqual(loaded("import dipzy; dipzy.telegram.Bot"), [])
+
+    def test_coingecko(self):
+        self.assertEqual(loaded("import dipzy; dipzy.CoinGecko()"), [])
+
+    def test_attributes(self):
+        import dipzy
+        self.assertIs(dipzy.RequestError, dipzy.client.RequestError)
+        self.assertIn("Twitter", dir(dipzy))
+        with self.assertRaises(AttributeError):
+            dipzy.missing
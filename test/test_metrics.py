@@ -0,0 +1,69 @@
+import unittest
+
+import dipzy as dz
+from dipzy import metrics
+from dipzy.client import Client, RequestError
+
+from . import FakeResponse
+
+
+class FakeTransport:
+    def __init__(self, *payloads):
+        self.payloads = list(payloads)
+
+    def request(self, method, url, **kwargs):
+        payload = self.payloads.pop(0) if self.payloads else {"ok": True}
+        return FakeResponse(payload, 404 if "missing" in url else 200)
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.enable()
+        self.client = Client(FakeTransport())
+        self.client.base_url = "https://api.example.com"
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.registry.clear()
+
+    def test_requests_counted(self):
+        self.client._request("/users/123/tweets")
+        self.client._request("/users/456/tweets")
+        with self.assertRaises(RequestError):
+            self.client._request("/missing")
+
+        registry = metrics.registry
+        self.assertEqual(registry.get("dipzy_requests_total", endpoint="/users/:id/tweets", status="200"), 2)
+        self.assertEqual(registry.get("dipzy_requests_total", status="404"), 1)
+        self.assertEqual(registry.get("dipzy_response_bytes_total", client="Client"), 3 * len(b'{"ok": true}'))
+        text = registry.to_prometheus()
+        self.assertIn('dipzy_requests_total{client="Client",endpoint="/missing",status="404"} 1', text)
+        self.assertIn('dipzy_request_seconds_count{client="Client",endpoint="/users/:id/tweets"} 2', text)
+        self.assertIn('le="+Inf"', text)
+
+    def test_hooks(self):
+        events = []
+        before = lambda event: events.append(("before", event.endpoint, event.status))
+        after = lambda event: events.append(("after", event.endpoint, event.status))
+        metrics.add_hook(before, after)
+        try:
+            self.client._request("/a")
+        finally:
+            metrics.remove_hook(before, after)
+        self.assertEqual(events, [("before", "/a", None), ("after", "/a", 200)])
+
+    def test_disabled(self):
+        metrics.disable()
+        self.client._request("/a")
+        with metrics.timer("parse", "Client", "/a"):
+            pass
+        self.assertEqual(metrics.registry.to_dict(), {})
+
+    def test_alphavantage_retries(self):
+        quote = {"Global Quote": {"01. symbol": "IBM", "05. price": "150.0"}}
+        transport = FakeTransport({"Note": "Throttled"}, quote)
+        av = dz.AlphaVantage("key", calls_per_minute=100, throttle_backoff=0, transport=transport)
+        av.get_price("IBM")
+        registry = metrics.registry
+        self.assertEqual(registry.get("dipzy_retries_total", endpoint="GLOBAL_QUOTE"), 1)
+        self.assertEqual(registry.get("dipzy_requests_total", client="AlphaVantage", endpoint="GLOBAL_QUOTE"), 2)
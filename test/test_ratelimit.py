@@ -0,0 +1,60 @@
+import time
+import unittest
+
+from dipzy.ratelimit import RateGovernor, RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_allows_calls_within_limit(self):
+        limiter = RateLimiter([(3, 60)])
+        for _ in range(3):
+            self.assertTrue(limiter.acquire(timeout=0))
+        self.assertFalse(limiter.acquire(timeout=0))
+
+    def test_sliding_window_frees_slots(self):
+        limiter = RateLimiter([(2, 0.2)])
+        start = time.monotonic()
+        for _ in range(4):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_all_limits_enforced(self):
+        limiter = RateLimiter.from_quota(calls_per_minute=5, calls_per_day=2)
+        self.assertTrue(limiter.acquire(timeout=0))
+        self.assertTrue(limiter.acquire(timeout=0))
+        self.assertFalse(limiter.acquire(timeout=1))
+
+    def test_pause(self):
+        limiter = RateLimiter([(10, 60)])
+        limiter.pause(0.1)
+        self.assertFalse(limiter.acquire(timeout=0))
+        self.assertTrue(limiter.acquire(timeout=0.5))
+
+
+class TestRateGovernor(unittest.TestCase):
+    def test_exhausted_key_waits_for_reset(self):
+        governor = RateGovernor(margin=0)
+        governor.acquire("a")
+        governor.release("a", limit=2, remaining=0, reset=time.time() + 0.2)
+        start = time.monotonic()
+        governor.acquire("b")
+        self.assertLess(time.monotonic() - start, 0.1)
+        governor.acquire("a")
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertEqual(governor.budgets()["a"]["in_flight"], 1)
+
+    def test_in_flight_counted(self):
+        governor = RateGovernor(margin=0)
+        governor.acquire("a")
+        governor.release("a", limit=5, remaining=1, reset=time.time() + 60)
+        governor.acquire("a")
+        self.assertGreater(governor._reserve("a"), 1)
+
+    def test_out_of_order_replies(self):
+        governor = RateGovernor()
+        reset = time.time() + 60
+        governor.acquire("a")
+        governor.acquire("a")
+        governor.release("a", limit=5, remaining=3, reset=reset)
+        governor.release("a", limit=5, remaining=4, reset=reset)
+        self.assertEqual(governor.budgets()["a"]["remaining"], 3)
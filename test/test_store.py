@@ -0,0 +1,115 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+import dipzy as dz
+from dipzy.store import OHLCV_DTYPE, OHLCVStore
+
+from . import FakeResponse
+
+
+def make_rows(start, n, adjust=1.0):
+    data = np.zeros(n, dtype=OHLCV_DTYPE)
+    data["date"] = np.datetime64(start) + np.arange(n)
+    data["close"] = 100 + np.arange(n)
+    data["adjusted close"] = data["close"] * adjust
+    data["volume"] = 1000
+    data["split coefficient"] = 1
+    return data
+
+
+class TestOHLCVStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = OHLCVStore(self.tmpdir.name)
+        self.store.write("IBM", make_rows("2024-01-01", 10))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load(self):
+        data = self.store.load("IBM")
+        self.assertEqual(len(data), 10)
+        self.assertIn("IBM", self.store)
+        self.assertIsNone(self.store.load("AAPL"))
+
+    def test_append_tail(self):
+        tail = make_rows("2024-01-06", 8)
+        tail["adjusted close"] = make_rows("2024-01-01", 13)["adjusted close"][5:]
+        self.assertTrue(self.store.append("IBM", tail))
+        data = self.store.load("IBM")
+        self.assertEqual(len(data), 13)
+        self.assertEqual(data["date"][-1], np.datetime64("2024-01-13"))
+
+    def test_adjustment_detected(self):
+        tail = make_rows("2024-01-06", 8, adjust=0.5)
+        self.assertFalse(self.store.append("IBM", tail))
+        self.assertEqual(len(self.store.load("IBM")), 10)
+
+    def test_gap_detected(self):
+        self.assertFalse(self.store.append("IBM", make_rows("2024-03-01", 5)))
+        self.assertFalse(self.store.append("AAPL", make_rows("2024-03-01", 5)))
+
+
+class SeriesTransport:
+    """ Serves daily series of 3 compact or all full days, newest first"""
+
+    def __init__(self, days):
+        self.days = days
+        self.adjust = 1.0
+        self.requests = []
+
+    def request(self, method, url, params=None, **kwargs):
+        self.requests.append((params["symbol"], params["outputsize"]))
+        dates = np.datetime64("2024-01-01") + np.arange(self.days)
+        if params["outputsize"] == "compact":
+            dates = dates[-3:]
+        series = {
+            str(date): {
+                "1. open": "1.0", "2. high": "1.0", "3. low": "1.0", "4. close": "2.0",
+                "5. adjusted close": str(2.0 * self.adjust), "6. volume": "100",
+                "7. dividend amount": "0.0000", "8. split coefficient": "1.0",
+            }
+            for date in dates[::-1]
+        }
+        return FakeResponse({"Time Series (Daily)": series})
+
+
+class TestStoreIntegration(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.transport = SeriesTransport(days=10)
+        self.av = dz.AlphaVantage(
+            "key", calls_per_minute=100, transport=self.transport,
+            store=self.tmpdir.name, memo_ttl=0
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def fetch(self):
+        self.transport.requests.clear()
+        return self.av.get_daily_ohlcv("IBM")
+
+    def test_first_fetch(self):
+        data = self.fetch()
+        self.assertEqual(self.transport.requests, [("IBM", "full")])
+        self.assertEqual(len(data), 10)
+
+    def test_append_tail(self):
+        self.fetch()
+        self.transport.days = 11
+        data = self.fetch()
+        self.assertEqual(self.transport.requests, [("IBM", "compact")])
+        self.assertEqual(len(data), 11)
+        self.assertEqual(len(self.av.store.load("IBM")), 11)
+
+    def test_refetch_after_adjustment(self):
+        self.fetch()
+        self.transport.days = 11
+        self.transport.adjust = 0.5
+        data = self.fetch()
+        self.assertEqual(self.transport.requests, [("IBM", "compact"), ("IBM", "full")])
+        self.assertEqual(len(data), 11)
+        self.assertTrue(np.all(data["adjusted close"] == 1.0))
@@ -1,6 +1,19 @@
+import asyncio
+import json
 import os
+import socket
+import tempfile
+import threading
+import time
 import unittest
+
+import requests
+
 import dipzy as dz
+from dipzy.client import RequestError
+from dipzy.telegram import MessageQueue
+
+from . import FakeResponse
 
 
 class TestBot(unittest.TestCase):
@@ -18,3 +31,315 @@ class TestBot(unittest.TestCase):
     def test_send_message(self):
         chat_id = 948759574
         r = self.bot.send_message(chat_id, "unittest!")
+
+
+class FakeBot:
+    """ Records sent messages, replies 429 to the first message of chat 3"""
+
+    def __init__(self):
+        self.sent = []
+        self.limited = False
+
+    def send_message(self, chat_id, text, **kwargs):
+        if chat_id == 3 and not self.limited:
+            self.limited = True
+            r = FakeResponse({"ok": False, "parameters": {"retry_after": 0.2}}, 429)
+            raise RequestError("Request error: 429", r)
+        if chat_id == 4:
+            raise RequestError("Request error: 400", FakeResponse({}, 400))
+        self.sent.append((chat_id, text, time.monotonic()))
+        return FakeResponse({"ok": True})
+
+
+class TestMessageQueue(unittest.TestCase):
+    def setUp(self):
+        self.bot = FakeBot()
+        self.queue = MessageQueue(self.bot, chat_interval=0.1)
+
+    def tearDown(self):
+        self.queue.close()
+
+    def test_broadcast(self):
+        futures = {
+            chat_id: self.queue.submit(chat_id, "dip!") for chat_id in [1, 2, 3, 4]
+        }
+        self.assertEqual(futures[1].result(timeout=5).status_code, 200)
+        self.assertEqual(futures[3].result(timeout=5).status_code, 200)
+        with self.assertRaises(RequestError):
+            futures[4].result(timeout=5)
+        self.assertEqual(sorted(chat_id for chat_id, _, _ in self.bot.sent), [1, 2, 3])
+
+    def test_chat_interval(self):
+        futures = [self.queue.submit(1, str(i)) for i in range(3)]
+        for future in futures:
+            future.result(timeout=5)
+        texts = [text for _, text, _ in self.bot.sent]
+        times = [sent_at for _, _, sent_at in self.bot.sent]
+        self.assertEqual(texts, ["0", "1", "2"])
+        self.assertGreaterEqual(times[2] - times[0], 0.19)
+
+
+class PollingBot(dz.telegram.Bot):
+    """ Serves a fixed backlog of updates from getUpdates"""
+
+    def __init__(self, updates):
+        super().__init__("token")
+        self.updates = updates
+        self.offsets = []
+
+    def get_updates(self, offset=None, timeout=0, allowed_updates=None, limit=None):
+        self.offsets.append(offset)
+        offset = offset or 0
+        result = [u for u in self.updates if u["update_id"] >= offset]
+        return FakeResponse({"ok": True, "result": result})
+
+
+def message(update_id, text):
+    return {"update_id": update_id, "message": {"chat": {"id": 1}, "text": text}}
+
+
+class TestPoller(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "offset")
+        self.bot = PollingBot([
+            message(10, "/start"), message(11, "hello"), message(12, "/price@dipzy_bot eth"),
+        ])
+        self.handled = []
+        self.bot.add_command_handler("start", lambda update, bot: self.handled.append("start"))
+        self.bot.add_command_handler("/price", lambda update, bot: self.handled.append("price"))
+
+    def tearDown(self):
+        self.bot.close()
+        self.tmpdir.cleanup()
+
+    def test_poll(self):
+        poller = dz.telegram.Poller(self.bot, self.path, timeout=0)
+        self.assertEqual(len(poller.poll()), 3)
+        self.assertEqual(poller.poll(), [])
+        self.assertEqual(self.bot.offsets, [None, 13])
+        self.bot.dispatcher.shutdown()
+        self.assertEqual(sorted(self.handled), ["price", "start"])
+
+    def test_failed_dispatch(self):
+        async def start(update, bot):
+            pass
+
+        with self.assertRaises(TypeError):
+            self.bot.add_command_handler("start", start)
+        # Without an event loop the coroutine handler cannot be dispatched
+        self.bot.dispatcher.add_command_handler("start", start)
+        poller = dz.telegram.Poller(self.bot, self.path, timeout=0)
+        self.assertEqual(len(poller.poll()), 3)
+        self.assertEqual(poller.offset, 13)
+        self.bot.dispatcher.shutdown()
+        self.assertEqual(self.handled, ["price"])
+
+    def test_offset_persisted(self):
+        dz.telegram.Poller(self.bot, self.path, timeout=0).poll()
+        poller = dz.telegram.Poller(self.bot, self.path, timeout=0)
+        self.assertEqual(poller.offset, 13)
+        self.assertEqual(poller.poll(), [])
+
+
+class FakeAsyncTransport:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class AsyncPollingBot(dz.telegram.AsyncBot):
+    """ Serves a fixed backlog of updates, then long polls with no result"""
+
+    def __init__(self, updates):
+        super().__init__("token", transport=FakeAsyncTransport())
+        self.updates = updates
+
+    async def get_updates(self, offset=None, timeout=0, allowed_updates=None, limit=None):
+        result = [u for u in self.updates if u["update_id"] >= (offset or 0)]
+        if not result:
+            await asyncio.sleep(timeout)
+        return FakeResponse({"ok": True, "result": result})
+
+
+class TestAsyncPoller(unittest.TestCase):
+    def test_poll(self):
+        handled = []
+
+        async def main():
+            done = asyncio.Event()
+
+            async def start(update, bot):
+                handled.append(update["update_id"])
+                done.set()
+
+            async with AsyncPollingBot([message(10, "/start"), message(11, "hello")]) as bot:
+                bot.add_command_handler("start", start)
+                bot.start_polling(timeout=0.05)
+                await asyncio.wait_for(done.wait(), 5)
+            return bot
+
+        bot = asyncio.run(main())
+        self.assertEqual(handled, [10])
+        self.assertEqual(bot.poller.offset, 12)
+        self.assertTrue(bot.poller._task.done())
+        self.assertTrue(bot.transport.closed)
+
+
+class WebhookBot(dz.telegram.Bot):
+    """ Records setWebhook and deleteWebhook instead of calling Telegram"""
+
+    def __init__(self):
+        super().__init__("token")
+        self.calls = []
+
+    def set_webhook(self, url, secret_token=None, allowed_updates=None,
+                    max_connections=None, drop_pending_updates=False):
+        self.calls.append(("setWebhook", url, secret_token))
+
+    def delete_webhook(self, drop_pending_updates=False):
+        self.calls.append(("deleteWebhook",))
+
+
+class TestWebhook(unittest.TestCase):
+    def setUp(self):
+        self.bot = WebhookBot()
+        self.handled = threading.Event()
+        self.bot.add_command_handler("start", lambda update, bot: self.handled.set())
+        self.webhook = dz.telegram.WebhookServer(
+            self.bot, "https://example.com/hook", host="127.0.0.1", port=0,
+            secret_token="secret", timeout=0.5
+        )
+        self.bot.webhook = self.webhook
+        self.webhook.start()
+        host, port = self.webhook.address
+        self.url = f"http://{host}:{port}"
+
+    def tearDown(self):
+        self.bot.close()
+
+    def post(self, path="/hook", secret="secret", update=None, body=None):
+        if body is None:
+            body = json.dumps(update or message(1, "/start"))
+        headers = {dz.telegram.SECRET_TOKEN_HEADER: secret}
+        return requests.post(self.url + path, data=body, headers=headers, timeout=5)
+
+    def test_dispatch(self):
+        self.assertEqual(self.bot.calls, [("setWebhook", "https://example.com/hook", "secret")])
+        self.assertEqual(self.post().status_code, 200)
+        self.assertTrue(self.handled.wait(5))
+
+    def test_rejected(self):
+        self.assertEqual(self.post(secret="wrong").status_code, 403)
+        self.assertEqual(self.post(path="/other").status_code, 404)
+        self.assertFalse(self.handled.is_set())
+
+    def test_malformed_updates(self):
+        for body in ["[1, 2]", '"x"', "null", "{"]:
+            self.assertEqual(self.post(body=body).status_code, 400)
+        self.assertEqual(self.post(update={"message": "hi"}).status_code, 200)
+        self.assertEqual(self.post(update={"message": {"text": 1}}).status_code, 200)
+        self.assertEqual(self.post().status_code, 200)
+        self.assertTrue(self.handled.wait(5))
+
+    def test_failed_dispatch(self):
+        async def start(update, bot):
+            pass
+
+        self.bot.dispatcher.add_command_handler("start", start)
+        self.assertEqual(self.post().status_code, 500)
+        self.assertEqual(self.post(update=message(2, "hello")).status_code, 200)
+
+    def raw(self, head, body=b""):
+        """ Status code of a raw request, None if the server hung up"""
+        host, port = self.webhook.address
+        with socket.create_connection((host, port), timeout=5) as sock:
+            sock.sendall(head.encode() + b"\r\n" + body)
+            reply = sock.recv(1024)
+        return int(reply.split()[1]) if reply else None
+
+    def test_content_length(self):
+        secret = f"{dz.telegram.SECRET_TOKEN_HEADER}: secret\r\n"
+        post = "POST /hook HTTP/1.1\r\nHost: localhost\r\n"
+        self.assertEqual(self.raw(post + secret), 400)
+        self.assertEqual(self.raw(post + secret + "Content-Length: -5\r\n"), 400)
+        self.assertEqual(self.raw(post + secret + "Content-Length: 99999999\r\n"), 413)
+        # Checked before the body is read
+        self.assertEqual(self.raw(post + "Content-Length: 100\r\n"), 403)
+
+    def test_stalled_client(self):
+        secret = f"{dz.telegram.SECRET_TOKEN_HEADER}: secret\r\n"
+        head = "POST /hook HTTP/1.1\r\nHost: localhost\r\nContent-Length: 100\r\n" + secret
+        start = time.monotonic()
+        self.assertIsNone(self.raw(head, b"{}"))
+        self.assertLess(time.monotonic() - start, 4)
+        self.assertEqual(self.post().status_code, 200)
+
+    def test_stop(self):
+        self.bot.stop_webhook()
+        self.assertEqual(self.bot.calls[-1], ("deleteWebhook",))
+        with self.assertRaises(requests.ConnectionError):
+            self.post()
+
+
+class AsyncRecordingBot(dz.telegram.AsyncBot):
+    """ Records sent messages and webhook calls instead of calling Telegram"""
+
+    def __init__(self):
+        super().__init__("token", transport=FakeAsyncTransport())
+        self.calls = []
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0)
+        self.sent.append((chat_id, text))
+        return FakeResponse({"ok": True})
+
+    async def set_webhook(self, url, secret_token=None, allowed_updates=None,
+                          max_connections=None, drop_pending_updates=False):
+        self.calls.append("setWebhook")
+
+    async def delete_webhook(self, drop_pending_updates=False):
+        self.calls.append("deleteWebhook")
+
+
+class TestAsyncBot(unittest.TestCase):
+    def test_queue_message(self):
+        async def main():
+            async with AsyncRecordingBot() as bot:
+                bot._get_queue().chat_interval = 0
+                futures = [bot.queue_message(chat_id, str(i)) for i in range(3) for chat_id in (1, 2)]
+                responses = await asyncio.gather(*futures)
+            return bot, responses
+
+        bot, responses = asyncio.run(main())
+        self.assertEqual(len(responses), 6)
+        self.assertEqual([text for chat_id, text in bot.sent if chat_id == 1], ["0", "1", "2"])
+
+    def test_webhook(self):
+        async def main():
+            done = asyncio.Event()
+
+            async def start(update, bot):
+                done.set()
+
+            async with AsyncRecordingBot() as bot:
+                bot.add_command_handler("start", start)
+                await bot.start_webhook(
+                    "https://example.com/hook", host="127.0.0.1", port=0, secret_token="secret"
+                )
+                host, port = bot.webhook.address
+                r = await asyncio.to_thread(
+                    requests.post, f"http://{host}:{port}/hook",
+                    data=json.dumps(message(1, "/start")),
+                    headers={dz.telegram.SECRET_TOKEN_HEADER: "secret"}, timeout=5
+                )
+                await asyncio.wait_for(done.wait(), 5)
+            return bot, r
+
+        bot, r = asyncio.run(main())
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(bot.calls, ["setWebhook", "deleteWebhook"])
+        self.assertFalse(bot.webhook.running)
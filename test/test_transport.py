@@ -0,0 +1,144 @@
+import asyncio
+import gc
+import importlib.util
+import json
+import threading
+import unittest
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dipzy.client import AsyncClient, Client, RequestError
+from dipzy.transport import AsyncTransport, Transport
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.hits.append((self.command, self.path))
+        if self.path.startswith("/unavailable"):
+            status = 503
+        else:
+            status = 404 if self.path.startswith("/missing") else 200
+        body = json.dumps({
+            "path": self.path,
+            "auth": self.headers.get("Authorization"),
+            "port": self.client_address[1],
+        }).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.hits = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+
+class TestClient(ServerTestCase):
+    def setUp(self):
+        self.transport = Transport(retries=0)
+        self.client = Client(self.transport)
+        self.client.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_connection_reused(self):
+        ports = {self.client._request("/a").json()["port"] for _ in range(5)}
+        self.assertEqual(len(ports), 1)
+
+    def test_headers(self):
+        self.client.headers = {"Authorization": "Bearer token"}
+        r = self.client._request("/a")
+        self.assertEqual(r.json()["auth"], "Bearer token")
+
+    def test_error_raised(self):
+        with self.assertRaises(RequestError) as cm:
+            self.client._request("/missing")
+        self.assertEqual(cm.exception.status_code, 404)
+
+    def test_idempotent_retries(self):
+        transport = Transport(retries=2, backoff_factor=0)
+        url = f"http://127.0.0.1:{self.server.server_port}/unavailable"
+        for method in ("GET", "POST"):
+            self.server.hits.clear()
+            self.assertEqual(transport.request(method, url).status_code, 503)
+            self.assertEqual(len(self.server.hits), 3 if method == "GET" else 1)
+        transport.close()
+
+
+class AsyncTestClient(AsyncClient, Client):
+    pass
+
+
+@unittest.skipUnless(importlib.util.find_spec("aiohttp"), "requires aiohttp")
+class TestAsyncClient(ServerTestCase):
+    def setUp(self):
+        self.client = AsyncTestClient(AsyncTransport(retries=0))
+        self.client.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.client.headers = {"Authorization": "Bearer token"}
+
+    def test_concurrent_requests(self):
+        async def run():
+            async with self.client:
+                return await asyncio.gather(*(
+                    self.client._request("/a", params={"i": i, "skip": None})
+                    for i in range(20)
+                ))
+
+        responses = asyncio.run(run())
+        self.assertEqual(responses[3].json()["path"], "/a?i=3")
+        self.assertEqual(responses[0].json()["auth"], "Bearer token")
+
+    def test_error_raised(self):
+        async def run():
+            async with self.client:
+                await self.client._request("/missing")
+
+        with self.assertRaises(RequestError) as cm:
+            asyncio.run(run())
+        self.assertEqual(cm.exception.status_code, 404)
+
+    def test_session_per_loop(self):
+        async def run():
+            return await self.client._request("/a")
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            asyncio.run(run())
+            session = self.client.transport._session
+            # The session is closed with the loop that created it
+            self.assertTrue(session.closed)
+            asyncio.run(run())
+            self.assertIsNot(self.client.transport._session, session)
+            asyncio.run(self.client.transport.close())
+            gc.collect()
+        self.assertEqual([w for w in caught if issubclass(w.category, ResourceWarning)], [])
+
+    def test_idempotent_retries(self):
+        transport = AsyncTransport(retries=2, backoff_factor=0)
+        url = f"http://127.0.0.1:{self.server.server_port}/unavailable"
+
+        async def run(method):
+            self.server.hits.clear()
+            r = await transport.request(method, url)
+            return r.status_code, len(self.server.hits)
+
+        self.assertEqual(asyncio.run(run("GET")), (503, 3))
+        self.assertEqual(asyncio.run(run("POST")), (503, 1))
@@ -1,7 +1,12 @@
+import asyncio
 import os
+import threading
+import time
 import unittest
 import dipzy as dz
 
+from . import FakeResponse
+
 
 class TestTwitter(unittest.TestCase):
     def setUp(self):
@@ -10,3 +15,151 @@ class TestTwitter(unittest.TestCase):
         
     def test_get_users(self):
         r = self.twtr.get_users(usernames="elonmusk")
+
+
+class FakeStream:
+    def __init__(self, lines):
+        self.lines = lines
+        self.closed = False
+
+    def iter_lines(self, chunk_size=None):
+        yield from self.lines
+
+    def close(self):
+        self.closed = True
+
+
+class FakeTwitter:
+    """ Serves two connections of a stream, then idles"""
+
+    def __init__(self):
+        self.connections = [
+            [b'{"data": {"id": "1"}}', b"", b"not json", b'{"data": {"id": "2"}}'],
+            [b"", b'{"data": {"id": "3"}}'],
+        ]
+
+    def get_stream(self, params=None):
+        if self.connections:
+            return FakeStream(self.connections.pop(0))
+        return FakeStream([b""] * 1000)
+
+
+class TestStreamConsumer(unittest.TestCase):
+    def test_consume(self):
+        tweets = []
+        consumer = dz.twitter.StreamConsumer(
+            FakeTwitter(), lambda tweet: tweets.append(tweet["data"]["id"]),
+            max_workers=2, queue_size=2
+        )
+        consumer.start()
+        deadline = time.monotonic() + 5
+        while len(tweets) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        consumer.stop()
+
+        self.assertEqual(sorted(tweets), ["1", "2", "3"])
+        stats = consumer.stats()
+        self.assertEqual(stats["received"], 3)
+        self.assertEqual(stats["processed"], 3)
+        self.assertEqual(stats["errors"], 1)
+        self.assertGreaterEqual(stats["keepalives"], 2)
+        self.assertGreaterEqual(stats["reconnects"], 1)
+
+
+class PagingTransport:
+    """ Serves user lookups and three pages of 2 tweets per timeline"""
+
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def request(self, method, url, params=None, **kwargs):
+        with self.lock:
+            self.requests.append((url, dict(params)))
+        path = url.replace(dz.Twitter.base_url, "")
+        if path == "/users":
+            ids = params["ids"].split(",")
+            return FakeResponse({"data": [{"id": i} for i in ids]})
+        user_id = path.split("/")[2]
+        page = int(params.get("pagination_token", 0))
+        content = {"data": [{"id": f"{user_id}-{page}-{i}"} for i in range(2)], "meta": {}}
+        if page < 2:
+            content["meta"]["next_token"] = str(page + 1)
+        return FakeResponse(content)
+
+
+class TestPagination(unittest.TestCase):
+    def setUp(self):
+        self.transport = PagingTransport()
+        self.twtr = dz.Twitter("token", transport=self.transport)
+
+    def test_get_users_batched(self):
+        users = self.twtr.get_users(user_ids=[str(i) for i in range(250)])
+        self.assertEqual(len(users), 250)
+        self.assertEqual(len(self.transport.requests), 3)
+
+    def test_iter_user_tweets_lazy(self):
+        tweets = self.twtr.iter_user_tweets("42")
+        self.assertEqual(next(tweets)["id"], "42-0-0")
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertEqual(len(list(tweets)), 5)
+        self.assertEqual(self.transport.requests[0][0], dz.Twitter.base_url + "/users/42/tweets")
+
+    def test_iter_users_tweets(self):
+        users = [str(i) for i in range(10)]
+        tweets = list(self.twtr.iter_users_tweets(users, max_workers=3))
+        self.assertEqual(len(tweets), 60)
+        self.assertEqual({user_id for user_id, _ in tweets}, set(users))
+
+
+class AsyncPagingTransport(PagingTransport):
+    async def request(self, method, url, params=None, **kwargs):
+        await asyncio.sleep(0)
+        return super().request(method, url, params, **kwargs)
+
+
+class TestAsyncPagination(unittest.TestCase):
+    def test_iter_users_tweets(self):
+        twtr = dz.AsyncTwitter("token", transport=AsyncPagingTransport())
+        users = [str(i) for i in range(10)]
+
+        async def collect():
+            return [item async for item in twtr.iter_users_tweets(users, max_workers=3)]
+
+        tweets = asyncio.run(collect())
+        self.assertEqual(len(tweets), 60)
+        self.assertEqual({user_id for user_id, _ in tweets}, set(users))
+
+    def test_get_users_batched(self):
+        transport = AsyncPagingTransport()
+        twtr = dz.AsyncTwitter("token", transport=transport)
+        users = asyncio.run(twtr.get_users(user_ids=[str(i) for i in range(250)]))
+        self.assertEqual(len(users), 250)
+        self.assertEqual(len(transport.requests), 3)
+
+
+class LimitedTransport:
+    """ Replies 429 to the first call, then 200 with budget headers"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        reset = str(time.time() + 0.2)
+        if self.calls == 1:
+            headers = {"x-rate-limit-limit": "15", "x-rate-limit-remaining": "0", "x-rate-limit-reset": reset}
+            return FakeResponse({}, 429, headers)
+        headers = {"x-rate-limit-limit": "15", "x-rate-limit-remaining": "14", "x-rate-limit-reset": reset}
+        return FakeResponse({"data": [{"id": "1"}]}, 200, headers)
+
+
+class TestRateLimits(unittest.TestCase):
+    def test_waits_for_reset_after_429(self):
+        twtr = dz.Twitter("token", transport=LimitedTransport())
+        twtr.governor.margin = 0
+        tweets = twtr.get_user_tweets(42)
+        self.assertEqual(tweets["data"][0]["id"], "1")
+        budget = twtr.rate_limits["GET /users/:id/tweets"]
+        self.assertEqual(budget["remaining"], 14)
+        self.assertEqual(budget["in_flight"], 0)
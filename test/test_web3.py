@@ -0,0 +1,334 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from eth_abi import decode, encode
+from eth_utils import event_signature_to_log_topic, function_signature_to_4byte_selector
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+
+import dipzy as dz
+from dipzy.web3 import Address, Multicall, _encode, PoolSet, ReserveTable, ReserveTracker, TokenCache, refresh_reserves
+
+
+def selector(signature):
+    return function_signature_to_4byte_selector(signature)
+
+
+ERC20_ABI = [
+    {"name": "symbol", "type": "function", "stateMutability": "view", "inputs": [], "outputs": [{"name": "", "type": "string"}]},
+    {"name": "decimals", "type": "function", "stateMutability": "view", "inputs": [], "outputs": [{"name": "", "type": "uint8"}]},
+    {"name": "balanceOf", "type": "function", "stateMutability": "view", "inputs": [{"name": "account", "type": "address"}], "outputs": [{"name": "", "type": "uint256"}]},
+]
+CURVE_ABI = [
+    {"name": "coins", "type": "function", "stateMutability": "view", "inputs": [{"name": "i", "type": "uint256"}], "outputs": [{"name": "", "type": "address"}]},
+    {"name": "balances", "type": "function", "stateMutability": "view", "inputs": [{"name": "i", "type": "uint256"}], "outputs": [{"name": "", "type": "uint256"}]},
+]
+UNISWAP_ABI = [
+    {"name": "token0", "type": "function", "stateMutability": "view", "inputs": [], "outputs": [{"name": "", "type": "address"}]},
+    {"name": "token1", "type": "function", "stateMutability": "view", "inputs": [], "outputs": [{"name": "", "type": "address"}]},
+]
+
+DAI = "0x" + "0d" * 20
+USDC = "0x" + "0c" * 20
+CURVE = "0x" + "c0" * 20
+UNISWAP = "0x" + "a0" * 20
+
+
+class FakeChain(JSONBaseProvider):
+    '''Answers eth_call for a Curve pool, a Uniswap pool, two tokens and Multicall3'''
+
+    def __init__(self, multicall=True):
+        super().__init__()
+        self.multicall = multicall
+        self.calls = 0
+        self.head = 100
+        self.blocks = []
+        self.logs = []
+        self.hashes = {}
+        self.balances = {DAI: 1000 * 10 ** 18, USDC: 2000 * 10 ** 6}
+        self.functions = {
+            (CURVE, selector("coins(uint256)")): (["uint256"], ["address"], lambda i: [[DAI, Address.ETH.value][i]]),
+            (CURVE, selector("balances(uint256)")): (["uint256"], ["uint256"], lambda i: [[self.balances[DAI], 5 * 10 ** 18][i]]),
+            (Address.MULTICALL3.value.lower(), selector("getBlockNumber()")): ([], ["uint256"], lambda: [self.head]),
+            (UNISWAP, selector("token0()")): ([], ["address"], lambda: [DAI]),
+            (UNISWAP, selector("token1()")): ([], ["address"], lambda: [USDC]),
+            (DAI, selector("symbol()")): ([], ["string"], lambda: ["DAI"]),
+            (DAI, selector("decimals()")): ([], ["uint8"], lambda: [18]),
+            (DAI, selector("balanceOf(address)")): (["address"], ["uint256"], lambda a: [self.balances[DAI]]),
+            (USDC, selector("symbol()")): ([], ["string"], lambda: ["USDC"]),
+            (USDC, selector("decimals()")): ([], ["uint8"], lambda: [6]),
+            (USDC, selector("balanceOf(address)")): (["address"], ["uint256"], lambda a: [self.balances[USDC]]),
+        }
+
+    def execute(self, to, data):
+        inputs, outputs, func = self.functions[(to.lower(), data[:4])]
+        return encode(outputs, func(*decode(inputs, data[4:])))
+
+    def eth_call(self, tx):
+        self.calls += 1
+        to, data = tx["to"].lower(), bytes.fromhex(tx["data"][2:])
+        if to != Address.MULTICALL3.value.lower():
+            return self.execute(to, data)
+        (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+        replies = [(True, self.execute(target, call)) for target, _, call in calls]
+        return encode(["(bool,bytes)[]"], [replies])
+
+    def respond(self, method, params):
+        if method == "eth_chainId":
+            return "0x1"
+        if method == "eth_getCode":
+            is_multicall = params[0].lower() == Address.MULTICALL3.value.lower()
+            return "0x60" if self.multicall and is_multicall else "0x"
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getBlockByNumber":
+            number = int(params[0], 16)
+            return {"number": params[0], "hash": self.block_hash(number), "parentHash": self.block_hash(number - 1)}
+        if method == "eth_getLogs":
+            return self.get_logs(params[0])
+        if method == "eth_call":
+            self.blocks.append(params[1])
+            return "0x" + self.eth_call(params[0]).hex()
+        raise NotImplementedError(method)
+
+    def block_hash(self, number):
+        return self.hashes.get(number, "0x" + format(number, "064x"))
+
+    def emit(self, block, address, signature, topics, data):
+        topic = "0x" + event_signature_to_log_topic(signature).hex()
+        self.logs.append({
+            "address": address, "blockNumber": hex(block), "blockHash": self.block_hash(block),
+            "transactionHash": "0x" + format(len(self.logs), "064x"), "transactionIndex": "0x0",
+            "logIndex": "0x0", "removed": False, "topics": [topic, *topics], "data": "0x" + data.hex(),
+        })
+
+    def get_logs(self, params):
+        def matches(log):
+            if not int(params["fromBlock"], 16) <= int(log["blockNumber"], 16) <= int(params["toBlock"], 16):
+                return False
+            if log["address"].lower() not in [a.lower() for a in params["address"]]:
+                return False
+            for expected, topic in zip(params["topics"], log["topics"]):
+                if expected is not None and topic not in (expected if isinstance(expected, list) else [expected]):
+                    return False
+            return True
+
+        return [log for log in self.logs if matches(log)]
+
+    def make_request(self, method, params):
+        return {"jsonrpc": "2.0", "id": 1, "result": self.respond(method, params)}
+
+    def make_batch_request(self, requests):
+        return [
+            {"jsonrpc": "2.0", "id": i, "result": self.respond(method, params)}
+            for i, (method, params) in enumerate(requests)
+        ]
+
+
+class TestReserves(unittest.TestCase):
+    def setUp(self):
+        self.chain = FakeChain()
+        w3 = Web3(self.chain)
+        dz.web3.LiquidityPool.set_defaults(w3, ERC20_ABI, token_cache=TokenCache())
+
+    def test_curve(self):
+        pool = dz.web3.CurveLP(CURVE, CURVE_ABI, n=2)
+        self.assertEqual(pool.reserves["DAI"].balance, 1000 * 10 ** 18)
+        self.assertEqual(pool.reserves["ETH"].balance, 5 * 10 ** 18)
+        # Tokens, then balances and metadata
+        self.assertEqual(self.chain.calls, 2)
+
+        self.chain.balances[DAI] = 7
+        pool.get_reserves()
+        self.assertEqual(pool.reserves["DAI"].balance, 7)
+        self.assertEqual(self.chain.calls, 3)
+
+    def test_get_reserves_shared(self):
+        a = dz.web3.CurveLP(CURVE, CURVE_ABI, n=2, refresh=False)
+        b = dz.web3.CurveLP(CURVE.upper().replace("0X", "0x"), CURVE_ABI, n=2, refresh=False)
+        reserves = a.get_reserves()
+        calls = self.chain.calls
+        self.assertEqual(b.get_reserves(), reserves)
+        self.assertEqual(self.chain.calls, calls)
+        self.assertTrue(b.loaded)
+        self.assertEqual(b.block, a.block)
+        self.assertEqual(b.reserves["ETH"].balance, 5 * 10 ** 18)
+
+    def test_encode(self):
+        w3 = dz.web3.LiquidityPool.w3
+        token = w3.eth.contract(address=Web3.to_checksum_address(DAI), abi=ERC20_ABI)
+        account = Web3.to_checksum_address(CURVE)
+        expected = token.encode_abi("balanceOf", [account])
+        self.assertEqual(_encode(token.functions.balanceOf(account)), expected)
+        self.assertEqual(_encode(token.functions.balanceOf(account=account)), expected)
+        self.assertEqual(self.chain.calls, 0)
+
+    def test_many_pools_one_round_trip(self):
+        curve = dz.web3.CurveLP(CURVE, CURVE_ABI, n=2)
+        uniswap = dz.web3.UniswapV3LP(UNISWAP, UNISWAP_ABI)
+        self.assertEqual(uniswap.reserves["USDC"].decimals, 6)
+        calls = self.chain.calls
+        refresh_reserves([curve, uniswap])
+        self.assertEqual(self.chain.calls, calls + 1)
+        self.assertEqual(str(uniswap), "1,000 DAI\n2,000 USDC")
+
+    def test_lazy(self):
+        pools = [dz.web3.CurveLP(CURVE, CURVE_ABI, n=2, refresh=False) for _ in range(50)]
+        self.assertEqual(self.chain.calls, 0)
+        self.assertTrue(pools[0].is_stale())
+        self.assertEqual(pools[0].reserves["ETH"].balance, 5 * 10 ** 18)
+        self.assertEqual(pools[0].block, 100)
+        self.assertFalse(pools[0].is_stale())
+        self.chain.head = 101
+        self.assertTrue(pools[0].is_stale())
+        self.assertFalse(pools[1].loaded)
+
+    def test_batch_fallback(self):
+        chain = FakeChain(multicall=False)
+        multicall = Multicall(Web3(chain))
+        pool = dz.web3.CurveLP(CURVE, CURVE_ABI, n=2)
+        refresh_reserves([pool], multicall=multicall)
+        self.assertFalse(multicall.deployed)
+        self.assertEqual(chain.calls, 2)
+        self.assertEqual(pool.reserves["DAI"].decimals, 18)
+
+
+class TestPoolSet(unittest.TestCase):
+    def setUp(self):
+        self.chain = FakeChain()
+        dz.web3.LiquidityPool.set_defaults(Web3(self.chain), ERC20_ABI, token_cache=TokenCache())
+        pools = [dz.web3.CurveLP(CURVE, CURVE_ABI, n=2, refresh=False)]
+        pools += [dz.web3.UniswapV3LP(UNISWAP, UNISWAP_ABI, refresh=False) for _ in range(5)]
+        self.pools = PoolSet(pools, chunk_size=2)
+        self.assertEqual(self.chain.calls, 0)
+
+    def test_pinned_to_head_block(self):
+        self.assertTrue(self.pools.refresh())
+        self.assertEqual(set(self.chain.blocks), {hex(100)})
+        data = self.pools.to_frame()
+        self.assertEqual(len(data), 12)
+        self.assertEqual(data.loc[CURVE, "balance"]["ETH"], 5 * 10 ** 18)
+        self.assertEqual(data["block"].unique().tolist(), [100])
+
+    def test_skips_unchanged_head(self):
+        self.pools.refresh()
+        calls = self.chain.calls
+        self.assertFalse(self.pools.refresh())
+        self.assertEqual(self.chain.calls, calls)
+        self.chain.head = 101
+        self.assertTrue(self.pools.refresh())
+        # One multicall per chunk of warm pools
+        self.assertEqual(self.chain.calls, calls + 3)
+        self.assertEqual(self.chain.blocks[-1], hex(101))
+
+
+class TestReserveTable(unittest.TestCase):
+    def setUp(self):
+        chain = FakeChain()
+        chain.balances[DAI] = 3 * 10 ** 30 + 1
+        dz.web3.LiquidityPool.set_defaults(Web3(chain), ERC20_ABI, token_cache=TokenCache())
+        self.curve = dz.web3.CurveLP(CURVE, CURVE_ABI, n=2)
+        self.uniswap = dz.web3.UniswapV3LP(UNISWAP, UNISWAP_ABI)
+        self.table = ReserveTable.from_pools([self.curve, self.uniswap])
+
+    def test_exact_balances(self):
+        self.assertEqual(self.table.balances().tolist(), [3 * 10 ** 30 + 1, 5 * 10 ** 18, 3 * 10 ** 30 + 1, 2000 * 10 ** 6])
+        np.testing.assert_allclose(self.table.normalized(), [3e12, 5, 3e12, 2000])
+
+    def test_analytics(self):
+        np.testing.assert_allclose(self.table.imbalance()[2:], [2 * 3e12 / (3e12 + 2000), 2 * 2000 / (3e12 + 2000)])
+        np.testing.assert_allclose(self.table.implied_prices(), [1, 6e11, 1, 1.5e9])
+        tvl = self.table.tvl({"DAI": 1.0, "ETH": 3000.0})
+        self.assertEqual(tvl[CURVE], 3e12 + 15000)
+
+    def test_frame_shares_arrays(self):
+        data = self.table.to_frame()
+        self.assertTrue(np.shares_memory(data["balance_lo"].to_numpy(), self.table.balance_lo))
+        self.assertEqual(self.table.tokens[data["token"].iloc[3]], "USDC")
+
+
+def topic(address):
+    return "0x" + address[2:].rjust(64, "0")
+
+
+class TestReserveTracker(unittest.TestCase):
+    def setUp(self):
+        self.chain = FakeChain()
+        dz.web3.LiquidityPool.set_defaults(Web3(self.chain), ERC20_ABI, token_cache=TokenCache())
+        self.curve = dz.web3.CurveLP(CURVE, CURVE_ABI, n=2, refresh=False)
+        self.uniswap = dz.web3.UniswapV3LP(UNISWAP, UNISWAP_ABI, refresh=False)
+        self.tracker = ReserveTracker([self.curve, self.uniswap], max_range=10)
+        self.tracker.update()
+
+    def transfer(self, block, token, sender, receiver, value):
+        self.chain.emit(block, token, "Transfer(address,address,uint256)", [topic(sender), topic(receiver)], encode(["uint256"], [value]))
+
+    def test_transfers_applied_without_reads(self):
+        calls = self.chain.calls
+        self.transfer(105, USDC, "0x" + "01" * 20, UNISWAP, 5)
+        self.transfer(130, DAI, UNISWAP, "0x" + "01" * 20, 7)
+        self.chain.head = 130
+        self.assertEqual(self.tracker.update(), 2)
+        self.assertEqual(self.uniswap.reserves["USDC"].balance, 2000 * 10 ** 6 + 5)
+        self.assertEqual(self.uniswap.reserves["DAI"].balance, 1000 * 10 ** 18 - 7)
+        self.assertEqual(self.chain.calls, calls)
+        self.assertEqual(self.tracker.block, 130)
+
+    def test_pool_events_trigger_read(self):
+        self.chain.balances[DAI] = 3
+        self.chain.emit(
+            102, CURVE, "TokenExchange(address,int128,uint256,int128,uint256)",
+            [topic("0x" + "01" * 20)], encode(["int128", "uint256", "int128", "uint256"], [0, 1, 1, 1]),
+        )
+        self.chain.head = 103
+        self.tracker.update()
+        self.assertEqual(self.curve.reserves["DAI"].balance, 3)
+        self.assertEqual(self.chain.blocks[-1], hex(103))
+
+    def test_reorg_rolls_back(self):
+        self.transfer(101, USDC, "0x" + "01" * 20, UNISWAP, 5)
+        self.chain.head = 101
+        self.tracker.update()
+        self.transfer(102, USDC, "0x" + "01" * 20, UNISWAP, 10)
+        self.chain.head = 102
+        self.tracker.update()
+        self.assertEqual(self.uniswap.reserves["USDC"].balance, 2000 * 10 ** 6 + 15)
+
+        # Block 102 is replaced by one without the second transfer
+        self.chain.logs.pop()
+        self.chain.hashes[102] = "0x" + "ff" * 32
+        self.chain.head = 103
+        self.tracker.update()
+        self.assertEqual(self.uniswap.reserves["USDC"].balance, 2000 * 10 ** 6 + 5)
+        self.assertEqual(self.tracker.block, 103)
+
+
+class TestTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "tokens.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_metadata_read_once(self):
+        chain = FakeChain()
+        dz.web3.LiquidityPool.set_defaults(Web3(chain), ERC20_ABI, token_cache=self.path)
+        dz.web3.CurveLP(CURVE, CURVE_ABI, n=2)
+        dz.web3.UniswapV3LP(UNISWAP, UNISWAP_ABI)
+        self.assertEqual(len(dz.web3.LiquidityPool.token_cache), 2)
+
+        # A restarted process only reads tokens and balances
+        chain = FakeChain()
+        dz.web3.LiquidityPool.set_defaults(Web3(chain), ERC20_ABI, token_cache=self.path)
+        executed = []
+        execute = chain.execute
+        chain.execute = lambda to, data: executed.append(data[:4]) or execute(to, data)
+        pool = dz.web3.UniswapV3LP(UNISWAP, UNISWAP_ABI)
+        self.assertEqual(pool.reserves["USDC"].decimals, 6)
+        self.assertNotIn(selector("symbol()"), executed)
+        self.assertNotIn(selector("decimals()"), executed)
+        self.assertEqual(TokenCache(self.path).get(1, Web3.to_checksum_address(DAI)), ("DAI", 18))